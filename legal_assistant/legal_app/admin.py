@@ -1,14 +1,73 @@
 from django.contrib import admin
-from .models import LegalQuestion, Document
+from django.db.models import Q
+from .models import DailyQuestionStats, LegalQuestion, Document
+from . import search
+
+
+class FullTextSearchMixin:
+    """Answer admin searches from the full-text index instead of LIKE scans.
+
+    Only the index columns named in ``indexed_search_fields`` are searched,
+    so answers do not match. Usernames and other ``search_fields`` outside
+    the index are still matched
+    with ``icontains``; without the index (non-SQLite) the admin
+    falls back to them entirely.
+    """
+    fts_table = None
+    indexed_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        matches = None
+        if search_term:
+            matches = search.filter_by_search(queryset, self.fts_table, search_term, self.indexed_search_fields)
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        others = Q()
+        for field in self.search_fields:
+            if field not in self.indexed_search_fields:
+                others |= Q(**{f"{field}__icontains": search_term})
+        if others:
+            matches = matches | queryset.filter(others)
+        return matches, False
+
+class CategoryListFilter(admin.SimpleListFilter):
+    """Category filter listing the categories of the analytics rollups.
+
+    The stock filter runs ``SELECT DISTINCT category`` over every question
+    on each changelist page; categories not rolled up yet are not offered.
+    """
+    title = 'категория'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        categories = DailyQuestionStats.objects.order_by('category').values_list('category', flat=True).distinct()
+        return [(category, category) for category in categories]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category=self.value())
+        return queryset
 
 @admin.register(LegalQuestion)
-class LegalQuestionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'question', 'answer', 'created_at', 'category')
+class LegalQuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ('user', 'question', 'answer', 'created_at', 'category', 'prompt_tokens', 'completion_tokens')
     search_fields = ('user__username', 'question', 'category')
-    list_filter = ('category', 'created_at')
+    list_filter = (CategoryListFilter, 'created_at')
+    # Skip the unfiltered COUNT(*) shown next to filtered results
+    show_full_result_count = False
+    fts_table = search.QUESTION_FTS_TABLE
+    indexed_search_fields = ('question', 'category')
+
+@admin.register(DailyQuestionStats)
+class DailyQuestionStatsAdmin(admin.ModelAdmin):
+    list_display = ('day', 'category', 'status', 'count', 'timed_count', 'processing_time_sum')
+    list_filter = ('day', 'status')
+    date_hierarchy = 'day'
 
 @admin.register(Document)
-class DocumentAdmin(admin.ModelAdmin):
+class DocumentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('user', 'title', 'document_type', 'created_at')
     search_fields = ('title', 'document_type')
     list_filter = ('document_type', 'created_at')
+    fts_table = search.DOCUMENT_FTS_TABLE
+    indexed_search_fields = ('title',)
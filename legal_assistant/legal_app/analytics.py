@@ -0,0 +1,266 @@
+# legal_app/analytics.py
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+from .metrics import DEFAULT_BUCKETS
+from .models import DailyQuestionStats, DailyTopQuestion, LegalQuestion, RollupState
+from .response_cache import stable_digest
+from .text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = 'questions'
+# Upper bounds in seconds; a bucket counts the questions up to its bound, the last one the slower rest
+LATENCY_BUCKETS = DEFAULT_BUCKETS
+QUESTION_SAMPLE_CHARS = 500
+STATS_FIELDS = ('count', 'timed_count', 'processing_time_sum', 'processing_time_max',
+                'latency_buckets', 'prompt_tokens', 'completion_tokens')
+
+
+def latency_bucket(seconds: float) -> int:
+    return bisect_left(LATENCY_BUCKETS, seconds)
+
+
+def bucket_quantile(buckets: List[int], q: float, maximum: float = 0.0) -> float:
+    """Estimate a quantile from bucket counts, interpolating within the bucket like Prometheus.
+
+    Questions past the last bound are placed at ``maximum``.
+    """
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            if index >= len(LATENCY_BUCKETS):
+                return maximum
+            lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+            upper = LATENCY_BUCKETS[index]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return maximum
+
+
+def _new_stats() -> Dict[str, Any]:
+    return {
+        'count': 0, 'timed_count': 0, 'processing_time_sum': 0.0, 'processing_time_max': 0.0,
+        'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'prompt_tokens': 0, 'completion_tokens': 0,
+    }
+
+
+def _add_stats(stats: Dict[str, Any], other: Dict[str, Any]):
+    for field in ('count', 'timed_count', 'processing_time_sum', 'prompt_tokens', 'completion_tokens'):
+        stats[field] += other[field]
+    stats['processing_time_max'] = max(stats['processing_time_max'], other['processing_time_max'])
+    buckets = stats['latency_buckets']
+    for index, count in enumerate(other['latency_buckets'][:len(buckets)]):
+        buckets[index] += count
+
+
+def _aggregate(rows: List[Dict[str, Any]]) -> Tuple[Dict[tuple, dict], Dict[tuple, list]]:
+    """Sum a batch of questions per (day, category, status) and per (day, normalized question)."""
+    stats: Dict[tuple, dict] = defaultdict(_new_stats)
+    top: Dict[tuple, list] = {}
+    for row in rows:
+        day = timezone.localdate(row['created_at'])
+        entry = stats[(day, row['category'], row['status'])]
+        entry['count'] += 1
+        entry['prompt_tokens'] += row['prompt_tokens']
+        entry['completion_tokens'] += row['completion_tokens']
+        if row['processing_time'] is not None:
+            entry['timed_count'] += 1
+            entry['processing_time_sum'] += row['processing_time']
+            entry['processing_time_max'] = max(entry['processing_time_max'], row['processing_time'])
+            entry['latency_buckets'][latency_bucket(row['processing_time'])] += 1
+        normalized = normalize_text(row['question'])
+        key = (day, stable_digest(normalized))
+        if key in top:
+            top[key][1] += 1
+        else:
+            top[key] = [row['question'][:QUESTION_SAMPLE_CHARS], 1]
+    return stats, top
+
+
+def _merge(stats: Dict[tuple, dict], top: Dict[tuple, list]):
+    """Add aggregated counts to the rollup tables; called inside the rollup transaction."""
+    days = {day for day, _, _ in stats}
+    existing = {
+        (row.day, row.category, row.status): row
+        for row in DailyQuestionStats.objects.filter(day__in=days)
+    }
+    created, updated = [], []
+    for key, entry in stats.items():
+        row = existing.get(key)
+        if row is None:
+            day, category, status = key
+            created.append(DailyQuestionStats(day=day, category=category, status=status, **entry))
+            continue
+        current = {field: getattr(row, field) for field in STATS_FIELDS}
+        current['latency_buckets'] = list(current['latency_buckets']) + \
+            [0] * (len(LATENCY_BUCKETS) + 1 - len(current['latency_buckets']))
+        _add_stats(current, entry)
+        for field, value in current.items():
+            setattr(row, field, value)
+        updated.append(row)
+    DailyQuestionStats.objects.bulk_create(created)
+    DailyQuestionStats.objects.bulk_update(updated, STATS_FIELDS)
+
+    existing_top = {
+        (row.day, row.digest): row
+        for row in DailyTopQuestion.objects.filter(day__in=days, digest__in={digest for _, digest in top})
+    }
+    created, updated = [], []
+    for (day, digest), (question, count) in top.items():
+        row = existing_top.get((day, digest))
+        if row is None:
+            created.append(DailyTopQuestion(day=day, digest=digest, question=question, count=count))
+        else:
+            row.count += count
+            updated.append(row)
+    DailyTopQuestion.objects.bulk_create(created)
+    DailyTopQuestion.objects.bulk_update(updated, ['count'])
+
+
+def prune_top_questions(day: date, keep: Optional[int] = None) -> int:
+    """Keep only the ``keep`` most asked questions of ``day``; returns the rows deleted."""
+    keep = keep if keep is not None else getattr(settings, 'LEGAL_ANALYTICS_TOP_QUESTIONS', 50)
+    kept = list(
+        DailyTopQuestion.objects.filter(day=day).order_by('-count', 'id').values_list('id', flat=True)[:keep]
+    )
+    deleted, _ = DailyTopQuestion.objects.filter(day=day).exclude(id__in=kept).delete()
+    return deleted
+
+
+def rollup(batch_size: Optional[int] = None, lag: Optional[float] = None, now: Optional[datetime] = None) -> int:
+    """Fold the questions saved since the last run into the rollups; returns how many.
+
+    Questions are read in id order, one batch per transaction, starting
+    after the last id folded in, so each run costs what was added since
+    the previous one. Questions younger than ``lag`` seconds wait for the
+    next run: a transaction still open then could commit a lower id after
+    a higher one was already counted. Once a day is over, only its top
+    questions are kept.
+    """
+    batch_size = batch_size or getattr(settings, 'LEGAL_ANALYTICS_BATCH_SIZE', 1000)
+    lag = lag if lag is not None else getattr(settings, 'LEGAL_ANALYTICS_LAG', 60.0)
+    cutoff = (now or timezone.now()) - timedelta(seconds=lag)
+    open_day = timezone.localdate(cutoff)
+
+    processed = 0
+    touched = set()
+    while True:
+        with transaction.atomic():
+            state, _ = RollupState.objects.select_for_update().get_or_create(name=ROLLUP_NAME)
+            rows = list(
+                LegalQuestion.objects.filter(id__gt=state.last_id).order_by('id').values(
+                    'id', 'created_at', 'category', 'status', 'processing_time',
+                    'prompt_tokens', 'completion_tokens', 'question',
+                )[:batch_size]
+            )
+            ready = []
+            for row in rows:
+                if row['created_at'] > cutoff:
+                    break
+                ready.append(row)
+            if not ready:
+                break
+            stats, top = _aggregate(ready)
+            _merge(stats, top)
+            touched.update(day for day, _, _ in stats)
+            state.last_id = ready[-1]['id']
+            state.save()
+        processed += len(ready)
+        if len(ready) < batch_size:
+            break
+
+    with transaction.atomic():
+        state, _ = RollupState.objects.select_for_update().get_or_create(name=ROLLUP_NAME)
+        closed = DailyTopQuestion.objects.filter(day__lt=open_day)
+        if state.closed_until is not None:
+            closed = closed.filter(day__gt=state.closed_until)
+        days = set(closed.values_list('day', flat=True).distinct())
+        days.update(day for day in touched if day < open_day)
+        for day in sorted(days):
+            prune_top_questions(day)
+        state.closed_until = open_day - timedelta(days=1)
+        state.save()
+
+    if processed:
+        logger.info(f"Rolled up {processed} questions up to id {state.last_id}.")
+    return processed
+
+
+def rebuild(**kwargs) -> int:
+    """Drop the rollups and fold in every question again (after deleting questions, say)."""
+    with transaction.atomic():
+        DailyQuestionStats.objects.all().delete()
+        DailyTopQuestion.objects.all().delete()
+        RollupState.objects.filter(name=ROLLUP_NAME).delete()
+    return rollup(**kwargs)
+
+
+def dashboard(days: int, top: int = 20) -> Dict[str, Any]:
+    """Question volume, categories, latency and top questions of the last ``days`` days.
+
+    Reads only the rollup tables, so the cost grows with the days and
+    categories shown, not with the number of questions.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    per_day: Dict[date, dict] = {}
+    per_category: Dict[str, dict] = defaultdict(_new_stats)
+    statuses: Dict[str, int] = defaultdict(int)
+    total = _new_stats()
+    for row in DailyQuestionStats.objects.filter(day__gte=since).order_by('day'):
+        entry = {field: getattr(row, field) for field in STATS_FIELDS}
+        entry['latency_buckets'] = list(entry['latency_buckets'])
+        if row.day not in per_day:
+            per_day[row.day] = _new_stats()
+        _add_stats(per_day[row.day], entry)
+        _add_stats(per_category[row.category], entry)
+        _add_stats(total, entry)
+        statuses[row.status] += row.count
+
+    def summary(stats: Dict[str, Any]) -> Dict[str, Any]:
+        timed = stats['timed_count']
+
+        def quantile(q: float) -> Optional[float]:
+            if not timed:
+                return None
+            return round(bucket_quantile(stats['latency_buckets'], q, stats['processing_time_max']), 3)
+
+        return {
+            'count': stats['count'],
+            'avg_seconds': round(stats['processing_time_sum'] / timed, 3) if timed else None,
+            'p50_seconds': quantile(0.5),
+            'p95_seconds': quantile(0.95),
+            'prompt_tokens': stats['prompt_tokens'],
+            'completion_tokens': stats['completion_tokens'],
+        }
+
+    top_questions = (
+        DailyTopQuestion.objects.filter(day__gte=since)
+        .values('digest')
+        .annotate(total=Sum('count'), question=Min('question'))
+        .order_by('-total')[:top]
+    )
+    state = RollupState.objects.filter(name=ROLLUP_NAME).first()
+    return {
+        'since': since,
+        'days': days,
+        'total': summary(total),
+        'statuses': dict(statuses),
+        'per_day': [{'day': day, **summary(stats)} for day, stats in per_day.items()],
+        'categories': sorted(
+            ({'category': category, **summary(stats)} for category, stats in per_category.items()),
+            key=lambda item: -item['count'],
+        ),
+        'top_questions': [{'question': row['question'], 'count': row['total']} for row in top_questions],
+        'updated_at': state.updated_at if state else None,
+    }
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class LegalAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'legal_app'
+
+    def ready(self):
+        # Keep the full-text search index in sync with saves and deletes
+        from . import signals  # noqa: F401
+        # Tune SQLite connections as they are opened
+        from . import db  # noqa: F401
+        # tiktoken reads its BPE files from LEGAL_AI_TIKTOKEN_CACHE_DIR
+        from .tokens import use_encoding_cache
+        use_encoding_cache()
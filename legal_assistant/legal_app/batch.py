@@ -0,0 +1,236 @@
+# legal_app/batch.py
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .db import answer_provenance
+from .metrics import stage
+from .models import LegalQuestion
+from .scheduler import BACKGROUND, RateBudget, scheduling
+from .signals import questions_bulk_created
+from .text import normalize_text
+from .tokens import usage_fields
+from .utils import get_legal_ai
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(question: str) -> int:
+    """Cost of answering ``question``: prompt plus the answer and category budgets."""
+    budget = get_legal_ai().token_budget
+    return 2 * budget.count(question) + budget.for_answer(question) + 100
+
+
+class BatchCheckpoint:
+    """Append-only JSONL record of a batch.
+
+    The first line describes the batch, then one line per saved answer or
+    failure, and a final ``finished`` line. A line is written only after the
+    answer is committed to the database, so a resumed batch skips exactly
+    the questions that are already stored and retries failures.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def start(self, total: int, **meta):
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._write([{'total': total, **meta}])
+
+    def done_questions(self) -> set:
+        """Normalized questions already saved by earlier runs."""
+        return {normalize_text(line['question']) for line in self.read() if 'question_id' in line}
+
+    def read(self) -> List[Dict]:
+        if not self.path.exists():
+            return []
+        lines = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    lines.append(json.loads(line))
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    break
+        return lines
+
+    def status(self) -> Dict:
+        lines = self.read()
+        header = lines[0] if lines else {}
+        answered = {normalize_text(line['question']) for line in lines if 'question_id' in line}
+        failed = {normalize_text(line['question']) for line in lines if 'error' in line} - answered
+        return {
+            'total': header.get('total'),
+            'answered': len(answered),
+            'failed': len(failed),
+            'finished': any(line.get('finished') for line in lines),
+        }
+
+    def append(self, records: Iterable[Dict]):
+        self._write(records)
+
+    def _write(self, records: Iterable[Dict]):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+@dataclass
+class BatchResult:
+    answered: int = 0
+    skipped: int = 0
+    failed: List[str] = field(default_factory=list)
+
+
+def read_questions(path) -> List[str]:
+    """Questions from a text file (one per line) or JSONL with a ``question`` key."""
+    questions = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if str(path).endswith('.jsonl'):
+                line = json.loads(line)['question'].strip()
+            questions.append(line)
+    return questions
+
+
+def answer_batch(questions: Iterable[str], user, checkpoint: Optional[BatchCheckpoint] = None,
+                 concurrency: Optional[int] = None, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, flush_every: int = 50,
+                 progress: Optional[Callable[[BatchResult], None]] = None) -> BatchResult:
+    """Answer many questions through ``LegalAI.get_legal_response`` and store them.
+
+    Duplicates (after normalization) and questions saved by an earlier run of
+    the same checkpoint are skipped. Answers are inserted with
+    ``bulk_create`` every ``flush_every`` results; work lost to a crash is
+    at most one unsaved chunk, and redoing it is served by the response cache.
+    """
+    concurrency = concurrency or getattr(settings, 'LEGAL_AI_BATCH_CONCURRENCY', 4)
+    budget = RateBudget(
+        requests_per_minute if requests_per_minute is not None else getattr(settings, 'LEGAL_AI_BATCH_RPM', 60),
+        tokens_per_minute if tokens_per_minute is not None else getattr(settings, 'LEGAL_AI_BATCH_TPM', 80000),
+    )
+    done = checkpoint.done_questions() if checkpoint else set()
+    result = BatchResult()
+
+    pending, seen = [], set()
+    for question in questions:
+        key = normalize_text(question)
+        if key in seen or key in done:
+            result.skipped += 1
+        else:
+            pending.append(question)
+        seen.add(key)
+
+    def answer(question: str) -> Dict:
+        budget.acquire(estimate_tokens(question))
+        started = time.monotonic()
+        # Batch answers yield to interactive chat in the upstream scheduler
+        with scheduling(user, BACKGROUND):
+            response = get_legal_ai().get_legal_response(question)
+        return {**response, 'question': question, 'processing_time': time.monotonic() - started}
+
+    buffer: List[Dict] = []
+
+    def flush():
+        if not buffer:
+            return
+        provenance = answer_provenance()
+        with stage("orm_write"), transaction.atomic():
+            created = LegalQuestion.objects.bulk_create([
+                LegalQuestion(
+                    user=user,
+                    question=item['question'],
+                    answer=item['answer'],
+                    category=item['category'],
+                    status='answered',
+                    processing_time=item['processing_time'],
+                    **usage_fields(item),
+                    **provenance,
+                )
+                for item in buffer
+            ])
+            questions_bulk_created.send(sender=LegalQuestion, instances=created)
+        if checkpoint:
+            checkpoint.append({'question': q.question, 'question_id': q.id, 'category': q.category} for q in created)
+        result.answered += len(created)
+        buffer.clear()
+        if progress:
+            progress(result)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='answer-batch') as executor:
+        futures = {executor.submit(answer, question): question for question in pending}
+        for future in as_completed(futures):
+            question = futures[future]
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e)}
+            if response.get('status') == 'success':
+                buffer.append(response)
+                if len(buffer) >= flush_every:
+                    flush()
+            else:
+                logger.warning(f"Batch question failed: {question[:50]}")
+                result.failed.append(question)
+                if checkpoint:
+                    checkpoint.append([{'question': question, 'error': response.get('message', '')}])
+        flush()
+
+    if checkpoint:
+        checkpoint.append([{'finished': True, 'answered': result.answered, 'failed': len(result.failed)}])
+    logger.info(f"Batch finished: {result.answered} answered, {result.skipped} skipped, {len(result.failed)} failed.")
+    return result
+
+
+# Batches submitted through the API run in this pool
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool that runs batches submitted through the API."""
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='answer-batch-runner')
+    return _batch_executor
+
+
+def batch_checkpoint(batch_id: str) -> BatchCheckpoint:
+    return BatchCheckpoint(Path(settings.LEGAL_AI_BATCH_DIR) / f"{batch_id}.jsonl")
+
+
+def submit_batch(questions: List[str], user) -> str:
+    """Run a batch in the background and return its id for status polling."""
+    batch_id = uuid.uuid4().hex
+    checkpoint = batch_checkpoint(batch_id)
+    checkpoint.start(len(questions), user_id=user.id)
+
+    def run():
+        close_old_connections()
+        try:
+            answer_batch(questions, user, checkpoint)
+        except Exception as e:
+            logger.error(f"Batch {batch_id} failed: {e}", exc_info=True)
+            checkpoint.append([{'finished': True, 'error': str(e)}])
+        finally:
+            close_old_connections()
+
+    get_batch_executor().submit(run)
+    return batch_id
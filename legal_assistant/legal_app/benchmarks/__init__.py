@@ -0,0 +1,2 @@
+# legal_app/benchmarks/__init__.py
+"""Offline load tests against a fake OpenAI server; run with ``manage.py benchmark``."""
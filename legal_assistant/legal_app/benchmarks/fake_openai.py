@@ -0,0 +1,221 @@
+# legal_app/benchmarks/fake_openai.py
+"""A local OpenAI-compatible server for benchmarks.
+
+Serves ``/v1/chat/completions`` (plain and streamed) and ``/v1/embeddings``
+with configurable latency and error injection, so the app can be load
+tested without calling (or paying for) OpenAI. Run standalone with
+``python -m legal_app.benchmarks.fake_openai --port 8089`` and point
+``OPENAI_BASE_URL`` at ``http://127.0.0.1:8089/v1``.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+CATEGORY_REPLY = "гражданское право"
+ANSWER_TEMPLATE = (
+    "Согласно действующему законодательству Российской Федерации, по вопросу «{question}» "
+    "следует руководствоваться Гражданским кодексом РФ. Рекомендуется обратиться к юристу. "
+)
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, error_rate: float = 0.0,
+                 error_status: int = 500, stream_chunk_delay: float = 0.01, answer_words: int = 200,
+                 embedding_dimensions: int = 256, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunk_delay = stream_chunk_delay
+        self.answer_words = answer_words
+        self.embedding_dimensions = embedding_dimensions
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeOpenAIConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+
+        time.sleep(self.config.delay())
+        if self.config.should_fail():
+            status = self.config.error_status
+            return self._json(status, {"error": {"message": f"Injected error {status}", "type": "server_error"}})
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            return self._chat(body)
+        if self.path.rstrip("/").endswith("/embeddings"):
+            return self._embeddings(body)
+        return self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _chat(self, body):
+        messages = body.get("messages", [])
+        system = messages[0]["content"] if messages else ""
+        question = messages[-1]["content"] if messages else ""
+        if "category" in system.lower():
+            text = CATEGORY_REPLY
+        else:
+            words = (ANSWER_TEMPLATE.format(question=question[:100]) * 50).split()
+            text = " ".join(words[:self.config.answer_words])
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(text) // 4
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4")
+
+        if not body.get("stream"):
+            return self._json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            self._chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            if self.config.stream_chunk_delay:
+                time.sleep(self.config.stream_chunk_delay)
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _embeddings(self, body):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            # Deterministic pseudo-embedding: identical texts get identical vectors
+            seed = int(hashlib.sha256(str(text).encode()).hexdigest()[:16], 16)
+            rng = random.Random(seed)
+            data.append({
+                "object": "embedding",
+                "index": index,
+                "embedding": [rng.uniform(-1, 1) for _ in range(self.config.embedding_dimensions)],
+            })
+        tokens = sum(len(str(text)) for text in inputs) // 4
+        return self._json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status: int, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOpenAIServer:
+    """Run the fake server in a background thread (``port=0`` picks a free port)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[FakeOpenAIConfig] = None):
+        self.config = config or FakeOpenAIConfig()
+        handler = type("Handler", (FakeOpenAIHandler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response.")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- seconds added to the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail.")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected errors.")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.01, help="Seconds between streamed chunks.")
+    args = parser.parse_args()
+    config = FakeOpenAIConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, stream_chunk_delay=args.stream_chunk_delay,
+    )
+    server = FakeOpenAIServer(args.host, args.port, config)
+    print(f"Fake OpenAI server on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
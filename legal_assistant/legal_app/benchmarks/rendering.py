@@ -0,0 +1,100 @@
+# legal_app/benchmarks/rendering.py
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, List
+from docx import Document as DocxDocument
+from ..document_templates import TEMPLATES
+from ..metrics import quantile
+from ..rendering import convert_to_pdf, render_docx
+
+SAMPLE_TITLE = "Договор аренды квартиры"
+SAMPLE_FRAGMENT = (
+    "**Арендодатель** передаёт, а *Арендатор* принимает во временное владение и пользование квартиру:\n"
+    "- адрес: г. Москва, ул. Примерная, д. 1, кв. 2;\n"
+    "- общая площадь: 54 кв. м;\n"
+    "  - в том числе жилая: 32 кв. м.\n"
+    "1. Срок аренды — 11 месяцев.\n"
+    "2. Арендная плата — 30 000 рублей в месяц."
+)
+
+
+@dataclass
+class RenderResult:
+    renderer: str
+    concurrency: int
+    renders: int
+    renders_per_second: float
+    p50_ms: float
+    p95_ms: float
+    size_kb: float
+
+
+def sample_content(repeat: int = 1) -> str:
+    """A contract assembled from its template, with markdown-heavy variable sections."""
+    template = TEMPLATES['contract']
+    document = template.assemble({section.key: SAMPLE_FRAGMENT for section in template.variable_sections})
+    return "\n\n".join([document] * repeat)
+
+
+def render_plain(title: str, content: str, stream: BinaryIO):
+    """The previous renderer, for comparison: a fresh default package and one plain paragraph per line."""
+    document = DocxDocument()
+    document.add_heading(title, 0)
+    for paragraph in content.split("\n"):
+        document.add_paragraph(paragraph)
+    document.save(stream)
+
+
+RENDERERS = {
+    'plain': render_plain,
+    'markdown': render_docx,
+}
+
+
+def run_renders(name: str, render: Callable, content: str, renders: int, concurrency: int) -> RenderResult:
+    """Render ``content`` ``renders`` times from ``concurrency`` threads."""
+
+    def one(_) -> tuple:
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        render(SAMPLE_TITLE, content, buffer)
+        return time.perf_counter() - started, buffer.tell()
+
+    # Warm-up: loads the base template, like the first render of a worker
+    one(None)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(renders)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    return RenderResult(
+        renderer=name,
+        concurrency=concurrency,
+        renders=renders,
+        renders_per_second=round(renders / elapsed, 1),
+        p50_ms=round(quantile(latencies, 0.5) * 1000, 2),
+        p95_ms=round(quantile(latencies, 0.95) * 1000, 2),
+        size_kb=round(results[-1][1] / 1024, 1),
+    )
+
+
+def time_pdf(content: str) -> float:
+    """Seconds to convert one rendered sample to PDF."""
+    buffer = io.BytesIO()
+    render_docx(SAMPLE_TITLE, content, buffer)
+    started = time.perf_counter()
+    convert_to_pdf(buffer.getvalue())
+    return time.perf_counter() - started
+
+
+def format_table(results: List[RenderResult]) -> str:
+    header = f"{'renderer':<10} {'conc':>5} {'renders':>8} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'KB':>7}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.renderer:<10} {r.concurrency:>5} {r.renders:>8} {r.renders_per_second:>8.1f} "
+            f"{r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.size_kb:>7.1f}"
+        )
+    return "\n".join(lines)
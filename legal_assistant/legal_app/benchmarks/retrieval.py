@@ -0,0 +1,107 @@
+# legal_app/benchmarks/retrieval.py
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+from ..knowledge import KnowledgeBase, KnowledgeIndexer
+from ..metrics import quantile
+
+WORDS = (
+    "договор покупатель продавец товар возврат неустойка срок гарантия работодатель работник "
+    "отпуск увольнение заработная плата аренда арендатор наниматель жилое помещение суд иск "
+    "претензия ущерб возмещение обязательство исполнение сторона требование потребитель услуга "
+    "недостаток качество расторжение залог поручительство наследство завещание собственность"
+).split()
+EMBEDDING_MODEL = "benchmark"
+
+
+@dataclass
+class RetrievalResult:
+    mode: str
+    queries: int
+    p50_ms: float
+    p95_ms: float
+
+
+def write_corpus(directory: Path, articles: int, seed: int = 0) -> Path:
+    """Write a synthetic code of ``articles`` articles of about 150 words into ``directory``."""
+    rng = random.Random(seed)
+    lines = ["Синтетический кодекс Российской Федерации"]
+    for number in range(1, articles + 1):
+        lines.append(f"Статья {number}. {' '.join(rng.choices(WORDS, k=4)).capitalize()}")
+        for _ in range(3):
+            lines.append(f"{rng.randint(1, 5)}. {' '.join(rng.choices(WORDS, k=50))}.")
+    path = directory / "code.txt"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return path
+
+
+def fake_embed(dimensions: int):
+    """Deterministic random vectors, so no embedding API is needed."""
+    rng = random.Random(1)
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        return [[rng.gauss(0, 1) for _ in range(dimensions)] for _ in texts]
+
+    return embed
+
+
+def build_index(index_dir: Path, articles: int, dimensions: int) -> float:
+    """Index a synthetic corpus into ``index_dir``; return the seconds it took."""
+    source = index_dir / "source"
+    source.mkdir(parents=True, exist_ok=True)
+    write_corpus(source, articles)
+    started = time.perf_counter()
+    KnowledgeIndexer(index_dir / "index").update(source, fake_embed(dimensions), EMBEDDING_MODEL)
+    return time.perf_counter() - started
+
+
+def time_open(index_dir: Path) -> float:
+    """Seconds for a worker to open the index and map its vectors."""
+    started = time.perf_counter()
+    knowledge_base = KnowledgeBase(index_dir, EMBEDDING_MODEL)
+    knowledge_base.vectors()
+    return time.perf_counter() - started
+
+
+def run_queries(index_dir: Path, queries: int, k: int, dimensions: Optional[int]) -> RetrievalResult:
+    """Time ``queries`` retrievals; with ``dimensions``, hybrid (keywords and vectors)."""
+    rng = random.Random(2)
+    knowledge_base = KnowledgeBase(index_dir, EMBEDDING_MODEL)
+    knowledge_base.retrieve("договор", k)  # opens the connection, like a worker's first request
+    latencies = []
+    for _ in range(queries):
+        question = " ".join(rng.choices(WORDS, k=8))
+        embedding = [rng.gauss(0, 1) for _ in range(dimensions)] if dimensions else None
+        started = time.perf_counter()
+        knowledge_base.retrieve(question, k, embedding)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return RetrievalResult(
+        mode="hybrid" if dimensions else "keywords",
+        queries=queries,
+        p50_ms=round(quantile(latencies, 0.5) * 1000, 2),
+        p95_ms=round(quantile(latencies, 0.95) * 1000, 2),
+    )
+
+
+def run_benchmark(articles: int, queries: int, k: int, dimensions: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="legal-knowledge-") as workdir:
+        workdir = Path(workdir)
+        build_seconds = build_index(workdir, articles, dimensions)
+        index_dir = workdir / "index"
+        return {
+            "build_seconds": build_seconds,
+            "open_ms": time_open(index_dir) * 1000,
+            "results": [run_queries(index_dir, queries, k, None), run_queries(index_dir, queries, k, dimensions)],
+        }
+
+
+def format_table(results: List[RetrievalResult]) -> str:
+    header = f"{'mode':<10} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(f"{r.mode:<10} {r.queries:>8} {r.p50_ms:>8.2f} {r.p95_ms:>8.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,231 @@
+# legal_app/benchmarks/runner.py
+import asyncio
+import json
+import random
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+from django.test import AsyncClient, Client
+from ..metrics import quantile
+from ..models import DocumentJob
+from ..utils import get_legal_ai
+
+SCENARIOS = ('chat', 'chat_stream', 'chat_async', 'document')
+
+
+@dataclass
+class LevelResult:
+    scenario: str
+    mode: str
+    concurrency: int
+    requests: int
+    errors: int
+    seconds: float
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    upstream_calls: int
+    upstream_calls_per_request: float
+    cache_hit_ratio: float
+    rss_mb: float
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+
+def rss_mb() -> float:
+    """Resident memory of this (worker) process in MiB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak rather than current RSS; kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class QuestionPool:
+    """Questions for a run: a share ``repeat_ratio`` repeats a small hot set, the rest are unique."""
+
+    def __init__(self, repeat_ratio: float = 0.5, hot_questions: int = 10, seed: int = 0):
+        self.repeat_ratio = repeat_ratio
+        self.hot = [f"Как расторгнуть договор аренды, вариант {i}?" for i in range(hot_questions)]
+        self.random = random.Random(seed)
+        self.counter = 0
+
+    def next(self) -> str:
+        self.counter += 1
+        if self.random.random() < self.repeat_ratio:
+            return self.random.choice(self.hot)
+        return f"Уникальный вопрос номер {self.counter} о трудовом договоре"
+
+
+def _chat(client: Client, question: str) -> int:
+    return client.post('/chat/', {'question': question}).status_code
+
+
+def _chat_stream(client: Client, question: str) -> int:
+    response = client.post('/legal_app/chat/stream/', {'question': question})
+    if response.streaming:
+        # Consume the stream: the answer is only complete at the end
+        for _ in response.streaming_content:
+            pass
+    return response.status_code
+
+
+def _document(client: Client, question: str, timeout: float = 120) -> int:
+    response = client.post('/document_generator/', {
+        'document_type': 'contract', 'title': 'Договор', 'context': question, 'content': question,
+    })
+    if response.status_code != 202:
+        return response.status_code
+    job_id = response.json()['job_id']
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = DocumentJob.objects.filter(id=job_id).values_list('status', flat=True).first()
+        if status == 'done':
+            return 200
+        if status == 'failed':
+            return 500
+        time.sleep(0.02)
+    return 504
+
+
+SYNC_SCENARIOS: Dict[str, Callable[[Client, str], int]] = {
+    'chat': _chat,
+    'chat_stream': _chat_stream,
+    'document': _document,
+}
+
+
+def _run_sync(scenario: str, clients: List[Client], questions: List[str]) -> List[tuple]:
+    """Drive the WSGI stack with one thread per concurrent client."""
+    request = SYNC_SCENARIOS[scenario]
+
+    def worker(index: int) -> List[tuple]:
+        client, results = clients[index], []
+        for question in questions[index::len(clients)]:
+            started = time.monotonic()
+            try:
+                status = request(client, question)
+            except Exception:
+                status = 0
+            results.append((time.monotonic() - started, status))
+        return results
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        return [result for results in executor.map(worker, range(len(clients))) for result in results]
+
+
+async def _run_async(clients: List[AsyncClient], questions: List[str]) -> List[tuple]:
+    """Drive the ASGI stack with one task per concurrent client."""
+
+    async def worker(index: int) -> List[tuple]:
+        client, results = clients[index], []
+        for question in questions[index::len(clients)]:
+            started = time.monotonic()
+            try:
+                status = (await client.post('/legal_app/async/chat/', {'question': question})).status_code
+            except Exception:
+                status = 0
+            results.append((time.monotonic() - started, status))
+        return results
+
+    batches = await asyncio.gather(*(worker(i) for i in range(len(clients))))
+    return [result for results in batches for result in results]
+
+
+def run_level(scenario: str, concurrency: int, requests: int, users: list,
+              questions: QuestionPool, upstream_counter: Callable[[], int]) -> LevelResult:
+    """Send ``requests`` requests of ``scenario`` from ``concurrency`` clients at once."""
+    batch = [questions.next() for _ in range(requests)]
+    cache = get_legal_ai().response_cache
+    stats_before, upstream_before = cache.stats(), upstream_counter()
+
+    sessions = []
+    for user in users[:concurrency]:
+        client = Client()
+        client.force_login(user)
+        sessions.append(client)
+
+    started = time.monotonic()
+    if scenario == 'chat_async':
+        clients = []
+        for session in sessions:
+            client = AsyncClient()
+            client.cookies = session.cookies
+            clients.append(client)
+        results = asyncio.run(_run_async(clients, batch))
+        mode = 'asgi'
+    else:
+        results = _run_sync(scenario, sessions, batch)
+        mode = 'wsgi'
+    elapsed = time.monotonic() - started
+
+    stats_after = cache.stats()
+    hits = stats_after['hits'] - stats_before['hits']
+    lookups = hits + stats_after['misses'] - stats_before['misses']
+    upstream = upstream_counter() - upstream_before
+    latencies = sorted(latency for latency, _ in results)
+    status_codes: Dict[str, int] = {}
+    for _, status in results:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+
+    return LevelResult(
+        scenario=scenario,
+        mode=mode,
+        concurrency=concurrency,
+        requests=len(results),
+        errors=sum(1 for _, status in results if status >= 400 or status == 0),
+        seconds=round(elapsed, 3),
+        requests_per_second=round(len(results) / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(quantile(latencies, 0.5) * 1000, 1),
+        p95_ms=round(quantile(latencies, 0.95) * 1000, 1),
+        p99_ms=round(quantile(latencies, 0.99) * 1000, 1),
+        upstream_calls=upstream,
+        upstream_calls_per_request=round(upstream / len(results), 2) if results else 0.0,
+        cache_hit_ratio=round(hits / lookups, 3) if lookups else 0.0,
+        rss_mb=round(rss_mb(), 1),
+        status_codes=status_codes,
+    )
+
+
+def format_table(results: List[LevelResult]) -> str:
+    header = f"{'scenario':<12} {'mode':<5} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} " \
+             f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'up/req':>7} {'hit':>6} {'rss MB':>7}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.scenario:<12} {r.mode:<5} {r.concurrency:>5} {r.requests:>5} {r.errors:>4} "
+            f"{r.requests_per_second:>8.2f} {r.p50_ms:>8.1f} {r.p95_ms:>8.1f} {r.p99_ms:>8.1f} "
+            f"{r.upstream_calls_per_request:>7.2f} {r.cache_hit_ratio:>6.2f} {r.rss_mb:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def write_json(results: List[LevelResult], path: str, meta: Optional[dict] = None):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta or {}, 'results': [asdict(r) for r in results]}, f, ensure_ascii=False, indent=2)
+
+
+def compare(results: List[LevelResult], baseline_path: str, tolerance: float) -> List[str]:
+    """Regressions against a previous ``--output`` file: throughput drops or p95 growth beyond ``tolerance``."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {
+            (r['scenario'], r['concurrency']): r for r in json.load(f)['results']
+        }
+    regressions = []
+    for r in results:
+        base = baseline.get((r.scenario, r.concurrency))
+        if base is None:
+            continue
+        if r.requests_per_second < base['requests_per_second'] * (1 - tolerance):
+            regressions.append(
+                f"{r.scenario} x{r.concurrency}: {r.requests_per_second} req/s (baseline {base['requests_per_second']})"
+            )
+        if r.p95_ms > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{r.scenario} x{r.concurrency}: p95 {r.p95_ms} ms (baseline {base['p95_ms']})")
+    return regressions
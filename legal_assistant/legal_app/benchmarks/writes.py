@@ -0,0 +1,118 @@
+# legal_app/benchmarks/writes.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List
+from django.db import connection
+from django.test.utils import override_settings
+from ..db import WriteBehindBuffer
+from ..metrics import quantile
+from ..models import LegalQuestion
+
+# mode -> (PRAGMAs, write-behind); 'default' is SQLite's own rollback journal with full syncs
+MODES = {
+    'default': ({'journal_mode': 'DELETE', 'synchronous': 'FULL'}, False),
+    'wal': ({'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'mmap_size': 256 * 1024 * 1024}, False),
+    'write_behind': ({'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'mmap_size': 256 * 1024 * 1024}, True),
+}
+ANSWER = "Согласно статье 18 Закона о защите прав потребителей покупатель вправе вернуть товар. " * 10
+
+
+@dataclass
+class WriteResult:
+    mode: str
+    threads: int
+    rows: int
+    errors: int
+    seconds: float
+    rows_per_second: float
+    p50_ms: float
+    p95_ms: float
+    reads: int
+
+
+def _question(user, index: int) -> LegalQuestion:
+    return LegalQuestion(
+        user=user, question=f"Вопрос {index} о возврате товара", answer=ANSWER,
+        category="consumer protection", status='answered', processing_time=0.0,
+    )
+
+
+def run_level(mode: str, threads: int, rows: int, user, readers: int = 2) -> WriteResult:
+    """Insert ``rows`` answered questions from ``threads`` threads while ``readers`` page through history.
+
+    Inserts are timed as the view sees them: a committed ``create``, or
+    handing the row to the write-behind buffer (whose final flush is
+    included in the total time).
+    """
+    pragmas, write_behind = MODES[mode]
+    buffer = WriteBehindBuffer() if write_behind else None
+    stop = threading.Event()
+    reads = [0] * readers
+
+    def write(index: int) -> List[float]:
+        latencies, errors = [], 0
+        try:
+            for i in range(index, rows, threads):
+                started = time.monotonic()
+                try:
+                    if buffer is not None:
+                        buffer.add(_question(user, i))
+                    else:
+                        _question(user, i).save()
+                except Exception:
+                    errors += 1
+                latencies.append(time.monotonic() - started)
+        finally:
+            connection.close()
+        return latencies + [None] * errors
+
+    def read(index: int):
+        try:
+            while not stop.is_set():
+                list(LegalQuestion.objects.filter(user=user).order_by('-id').values('id', 'question')[:20])
+                reads[index] += 1
+        finally:
+            connection.close()
+
+    with override_settings(SQLITE_PRAGMAS=pragmas):
+        # New connections get the PRAGMAs of the mode
+        connection.close()
+        with ThreadPoolExecutor(max_workers=threads + readers) as executor:
+            for index in range(readers):
+                executor.submit(read, index)
+            started = time.monotonic()
+            try:
+                results = list(executor.map(write, range(threads)))
+                if buffer is not None:
+                    buffer.flush()
+                elapsed = time.monotonic() - started
+            finally:
+                stop.set()
+        connection.close()
+
+    latencies = sorted(latency for result in results for latency in result if latency is not None)
+    errors = sum(1 for result in results for latency in result if latency is None)
+    return WriteResult(
+        mode=mode,
+        threads=threads,
+        rows=rows,
+        errors=errors,
+        seconds=round(elapsed, 3),
+        rows_per_second=round((rows - errors) / elapsed, 1) if elapsed else 0.0,
+        p50_ms=round(quantile(latencies, 0.5) * 1000, 2),
+        p95_ms=round(quantile(latencies, 0.95) * 1000, 2),
+        reads=sum(reads),
+    )
+
+
+def format_table(results: List[WriteResult]) -> str:
+    header = f"{'mode':<13} {'threads':>7} {'rows':>6} {'err':>4} {'rows/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'reads':>7}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.mode:<13} {r.threads:>7} {r.rows:>6} {r.errors:>4} {r.rows_per_second:>9.1f} "
+            f"{r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.reads:>7}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,179 @@
+# legal_app/classifier.py
+import json
+import logging
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from .text import normalize_text, tokenize
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_CATEGORY = "unknown"
+OTHER_CATEGORY = "other"
+
+# Canonical category labels and the markers that identify them in free-form
+# text. More specific branches come before "civil law", which they are part of.
+CATEGORY_MARKERS = [
+    ("criminal law", ("criminal", "уголов")),
+    ("administrative law", ("administrative", "административ")),
+    ("labor law", ("labor", "labour", "employment", "трудов")),
+    ("family law", ("family", "семейн")),
+    ("housing law", ("housing", "жилищ")),
+    ("consumer protection", ("consumer", "потребител")),
+    ("tax law", ("tax", "налог")),
+    ("land law", ("land law", "земельн")),
+    ("civil law", ("civil", "гражданск")),
+]
+CATEGORY_LABELS = [label for label, _ in CATEGORY_MARKERS] + [OTHER_CATEGORY]
+# With a single centroid the softmax confidence is always 1.0 and the LLM is never asked
+MIN_LABELS = 2
+
+
+def normalize_category(raw: str) -> str:
+    """Map a free-form category (e.g. an LLM reply) onto a canonical label."""
+    text = normalize_text(raw or "")
+    if not text or text == UNKNOWN_CATEGORY:
+        return UNKNOWN_CATEGORY
+    for label, markers in CATEGORY_MARKERS:
+        if any(marker in text for marker in markers):
+            return label
+    return OTHER_CATEGORY
+
+
+def _normalize_vector(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {term: weight / norm for term, weight in vector.items()} if norm else vector
+
+
+class CategoryClassifier:
+    """Nearest-centroid classifier over TF-IDF vectors of question text.
+
+    Cheap enough to run inline on every request. ``predict`` returns the best
+    label with a softmax confidence over the centroid similarities, so callers
+    can fall back to the LLM when the question is ambiguous.
+    """
+
+    def __init__(self, idf: Dict[str, float], centroids: Dict[str, Dict[str, float]], temperature: float = 0.05):
+        self.idf = idf
+        self.centroids = centroids
+        self.temperature = temperature
+
+    def _vectorize(self, text: str) -> Dict[str, float]:
+        counts = Counter(term for term in tokenize(text) if term in self.idf)
+        return _normalize_vector({
+            term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items()
+        })
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[str, str]], min_samples: int = 3) -> "CategoryClassifier":
+        """Train on ``(question, label)`` pairs; labels with fewer than ``min_samples`` are dropped."""
+        samples = list(samples)
+        label_counts = Counter(label for _, label in samples)
+        samples = [(text, label) for text, label in samples if label_counts[label] >= min_samples]
+        if not samples:
+            raise ValueError("Not enough labelled questions to train the classifier.")
+        labels = {label for _, label in samples}
+        if len(labels) < MIN_LABELS:
+            raise ValueError(
+                f"Only {len(labels)} category with at least {min_samples} questions; "
+                f"the classifier needs {MIN_LABELS}."
+            )
+
+        documents = [(Counter(tokenize(text)), label) for text, label in samples]
+        document_frequency = Counter(term for counts, _ in documents for term in counts)
+        total = len(documents)
+        idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        classifier = cls(idf, {})
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for counts, label in documents:
+            vector = _normalize_vector({
+                term: (1 + math.log(count)) * idf[term] for term, count in counts.items()
+            })
+            for term, weight in vector.items():
+                sums[label][term] += weight
+        classifier.centroids = {label: _normalize_vector(dict(vector)) for label, vector in sums.items()}
+        return classifier
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Return ``(label, confidence)`` for ``text``."""
+        vector = self._vectorize(text)
+        if not vector or len(self.centroids) < MIN_LABELS:
+            return UNKNOWN_CATEGORY, 0.0
+        scores = {
+            label: sum(weight * centroid.get(term, 0.0) for term, weight in vector.items())
+            for label, centroid in self.centroids.items()
+        }
+        best = max(scores, key=scores.get)
+        exps = {label: math.exp((score - scores[best]) / self.temperature) for label, score in scores.items()}
+        return best, exps[best] / sum(exps.values())
+
+    def evaluate(self, samples: Iterable[Tuple[str, str]]) -> float:
+        """Return accuracy on ``(question, label)`` pairs."""
+        samples = list(samples)
+        if not samples:
+            return 0.0
+        return sum(self.predict(text)[0] == label for text, label in samples) / len(samples)
+
+    def save(self, path: str):
+        """Write the model to a JSON artifact."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": 1,
+                "temperature": self.temperature,
+                "idf": self.idf,
+                "centroids": self.centroids,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CategoryClassifier":
+        """Load a model saved with ``save``; one with fewer than ``MIN_LABELS`` labels is refused."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if len(data["centroids"]) < MIN_LABELS:
+            raise ValueError(f"The model has {len(data['centroids'])} labels, at least {MIN_LABELS} are needed.")
+        return cls(data["idf"], data["centroids"], data.get("temperature", 0.05))
+
+    @property
+    def labels(self) -> List[str]:
+        return sorted(self.centroids)
+
+
+_classifier = None
+_classifier_mtime = None
+_classifier_lock = threading.Lock()
+
+
+def get_category_classifier() -> Optional[CategoryClassifier]:
+    """Return the trained classifier, reloading it when the artifact changes.
+
+    Returns None when no artifact has been trained yet, or the artifact
+    cannot be used (e.g. it knows fewer than two labels).
+    """
+    global _classifier, _classifier_mtime
+    path = getattr(settings, 'LEGAL_AI_CATEGORY_CLASSIFIER_PATH', None)
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if mtime != _classifier_mtime:
+        with _classifier_lock:
+            if mtime != _classifier_mtime:
+                try:
+                    _classifier = CategoryClassifier.load(path)
+                    logger.info(f"Category classifier loaded from {path}.")
+                except Exception as e:
+                    logger.warning(f"Could not load category classifier from {path}: {e!r}")
+                    _classifier = None
+                _classifier_mtime = mtime
+    return _classifier
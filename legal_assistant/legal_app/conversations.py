@@ -0,0 +1,176 @@
+# legal_app/conversations.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .db import flush_conversation, record_question
+from .metrics import stage
+from .models import Conversation, LegalQuestion
+from .scheduler import BACKGROUND, scheduling
+from .tokens import count_tokens, truncate_tokens
+from .utils import get_legal_ai
+
+logger = logging.getLogger(__name__)
+
+# Conversations being compacted by this process
+_compacting = set()
+_compacting_lock = threading.Lock()
+# Summaries are written by a pool of their own, so that they never hold the
+# threads that interactive requests fan their upstream calls out to
+_compaction_executor = None
+
+
+def get_conversation(user, conversation_id) -> Optional[Conversation]:
+    """The user's conversation with ``conversation_id``, or None to start a new one."""
+    if not conversation_id:
+        return None
+    try:
+        return Conversation.objects.get(id=int(conversation_id), user=user)
+    except (ValueError, Conversation.DoesNotExist):
+        raise ValidationError("Unknown conversation.")
+
+
+def start_conversation(user, question: str) -> Conversation:
+    return Conversation.objects.create(user=user, title=question[:200])
+
+
+def _recent_turns(conversation: Conversation) -> List[LegalQuestion]:
+    """Answered turns after the summary, oldest first (at most ``LEGAL_AI_CONVERSATION_MAX_TURNS``)."""
+    turns = conversation.questions.filter(status='answered')
+    if conversation.summary_until_id:
+        turns = turns.filter(id__gt=conversation.summary_until_id)
+    limit = getattr(settings, 'LEGAL_AI_CONVERSATION_MAX_TURNS', 20)
+    turns = list(turns.order_by('-id').only('id', 'question', 'answer')[:limit])
+    turns.reverse()
+    return turns
+
+
+def _turn_messages(turn: LegalQuestion) -> List[Dict[str, str]]:
+    max_tokens = getattr(settings, 'LEGAL_AI_CONVERSATION_TURN_MAX_TOKENS', 500)
+    return [
+        {"role": "user", "content": turn.question},
+        {"role": "assistant", "content": truncate_tokens(turn.answer, max_tokens)},
+    ]
+
+
+def _tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def conversation_history(conversation: Optional[Conversation]) -> List[Dict[str, str]]:
+    """Earlier turns of ``conversation`` as chat messages, within ``LEGAL_AI_CONVERSATION_MAX_TOKENS``.
+
+    The rolling summary comes first, then the most recent turns verbatim.
+    No LLM call is made here: if the turns since the summary do not fit
+    (compaction has not caught up yet), the oldest of them are left out.
+    """
+    if conversation is None:
+        return []
+    flush_conversation(conversation.id)
+    budget = getattr(settings, 'LEGAL_AI_CONVERSATION_MAX_TOKENS', 2000)
+    messages = []
+    if conversation.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{conversation.summary}"})
+        budget -= _tokens(messages)
+    recent = []
+    with stage("conversation_history"):
+        for turn in reversed(_recent_turns(conversation)):
+            turn_messages = _turn_messages(turn)
+            tokens = _tokens(turn_messages)
+            if tokens > budget:
+                break
+            recent[:0] = turn_messages
+            budget -= tokens
+    return messages + recent
+
+
+def _turns_to_fold(conversation: Conversation) -> List[LegalQuestion]:
+    """Turns to fold into the summary: all but the last few, once they exceed half the budget."""
+    turns = _recent_turns(conversation)
+    keep = getattr(settings, 'LEGAL_AI_CONVERSATION_KEEP_TURNS', 2)
+    budget = getattr(settings, 'LEGAL_AI_CONVERSATION_MAX_TOKENS', 2000)
+    if len(turns) <= keep or sum(_tokens(_turn_messages(turn)) for turn in turns) <= budget // 2:
+        return []
+    return turns[:len(turns) - keep]
+
+
+def compact_conversation(conversation_id: int) -> bool:
+    """Fold older turns into the conversation's summary; True if it was updated.
+
+    Only the turns since the last summary are sent, together with that
+    summary, so each compaction costs the same however long the
+    conversation is.
+    """
+    flush_conversation(conversation_id)
+    conversation = Conversation.objects.get(id=conversation_id)
+    turns = _turns_to_fold(conversation)
+    if not turns:
+        return False
+    with scheduling(conversation.user_id, BACKGROUND):
+        summary = get_legal_ai().summarize_conversation(
+            conversation.summary, [(turn.question, turn.answer) for turn in turns]
+        )
+    # Another worker may have compacted the same turns meanwhile
+    updated = Conversation.objects.filter(id=conversation_id, summary_until=conversation.summary_until_id).update(
+        summary=summary, summary_until=turns[-1].id, updated_at=timezone.now(),
+    )
+    if updated:
+        logger.info(f"Conversation {conversation_id}: {len(turns)} turns folded into the summary.")
+    return bool(updated)
+
+
+def _compact_in_thread(conversation_id: int):
+    close_old_connections()
+    try:
+        compact_conversation(conversation_id)
+    except Exception as e:
+        logger.warning(f"Compacting conversation {conversation_id} failed: {e!r}")
+    finally:
+        close_old_connections()
+        with _compacting_lock:
+            _compacting.discard(conversation_id)
+
+
+def _get_compaction_executor() -> ThreadPoolExecutor:
+    global _compaction_executor
+    if _compaction_executor is None:
+        with _compacting_lock:
+            if _compaction_executor is None:
+                _compaction_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'LEGAL_AI_CONVERSATION_COMPACTION_WORKERS', 1),
+                    thread_name_prefix='conversation-compaction',
+                )
+    return _compaction_executor
+
+
+def turn_added(conversation: Conversation):
+    """Compact ``conversation`` in the background once the new turn is committed.
+
+    The summary is ready by the next question, so no request waits for it.
+    """
+    Conversation.objects.filter(id=conversation.id).update(updated_at=timezone.now())
+    with _compacting_lock:
+        if conversation.id in _compacting:
+            return
+        _compacting.add(conversation.id)
+    transaction.on_commit(lambda: _get_compaction_executor().submit(_compact_in_thread, conversation.id))
+
+
+def record_turn(user, conversation: Optional[Conversation], question: str,
+                **fields) -> Tuple[LegalQuestion, Conversation]:
+    """Save an answered question as the next turn of ``conversation``, starting one if None.
+
+    The turn's writes share one transaction. With ``DB_WRITE_BEHIND`` the
+    question row is left to the buffer; ``conversation_history`` and
+    compaction flush it before reading the conversation.
+    """
+    with transaction.atomic():
+        if conversation is None:
+            conversation = start_conversation(user, question)
+        legal_question = record_question(user=user, conversation=conversation, question=question, **fields)
+        turn_added(conversation)
+    return legal_question, conversation
@@ -0,0 +1,213 @@
+# legal_app/db.py
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .metrics import REGISTRY
+from .models import LegalQuestion
+from .providers import task_model
+from .signals import questions_bulk_created
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied in this order: busy_timeout first, switching to WAL may have to wait for a lock
+PRAGMA_ORDER = ('busy_timeout', 'journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store')
+# Signals standing in for post_save after bulk_create, per model
+BULK_CREATED_SIGNALS = {LegalQuestion: questions_bulk_created}
+
+WRITE_BEHIND_ROWS = REGISTRY.counter(
+    "legal_write_behind_rows_total", "Rows inserted by the write-behind buffer", ("model", "outcome"),
+)
+WRITE_BEHIND_FLUSH_SECONDS = REGISTRY.histogram(
+    "legal_write_behind_flush_seconds", "Duration of write-behind flushes (one transaction each)",
+)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply ``SQLITE_PRAGMAS`` to every new SQLite connection.
+
+    With WAL, readers no longer block the writer and a commit appends to
+    the log instead of rewriting pages; ``synchronous=NORMAL`` syncs at
+    checkpoints rather than on every commit, which stays safe in WAL mode.
+    ``busy_timeout`` makes a writer wait for the lock instead of failing
+    with "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    names = [name for name in PRAGMA_ORDER if name in pragmas] + [name for name in pragmas if name not in PRAGMA_ORDER]
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f"PRAGMA {name} = {pragmas[name]}")
+
+
+class WriteBehindBuffer:
+    """Inserts rows of append-only models in batches from a background thread.
+
+    ``add`` returns at once; rows are written with ``bulk_create``, all
+    models in one transaction, when ``max_rows`` are waiting or
+    ``interval`` seconds after the first. Concurrent requests then share
+    one write lock and one sync instead of taking turns at commit. The
+    price: an added row has no primary key, is visible a moment later and
+    is lost if the process is killed before the flush (rows left at a
+    normal exit are flushed). Readers that must see a row, like the next
+    turn of a conversation, call ``flush_if`` first. A flush that fails is
+    retried row by row, so one bad row does not lose the batch.
+    """
+
+    def __init__(self, max_rows: Optional[int] = None, interval: Optional[float] = None):
+        self.max_rows = max_rows or getattr(settings, 'DB_WRITE_BEHIND_MAX_ROWS', 100)
+        self.interval = interval or getattr(settings, 'DB_WRITE_BEHIND_INTERVAL', 0.5)
+        self._pending: List = []
+        # Rows taken by the flush in progress, not committed yet
+        self._flushing: List = []
+        self._first_added: Optional[float] = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, instance):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._first_added = time.monotonic()
+            self._pending.append(instance)
+            if len(self._pending) >= self.max_rows:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if len(self._pending) >= self.max_rows:
+                        break
+                    if self._pending:
+                        remaining = self._first_added + self.interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e!r}", exc_info=True)
+            finally:
+                close_old_connections()
+
+    def flush_if(self, predicate: Callable[[Any], bool]) -> int:
+        """Flush now if a waiting or in-flight row matches ``predicate``, so reads after this see it."""
+        with self._condition:
+            if not any(predicate(row) for row in self._pending + self._flushing):
+                return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """Insert everything waiting now; returns the number of rows written."""
+        with self._flush_lock:
+            with self._condition:
+                rows, self._pending = self._pending, []
+                self._flushing = rows
+            if not rows:
+                return 0
+            try:
+                return self._write(rows)
+            finally:
+                with self._condition:
+                    self._flushing = []
+
+    def _write(self, rows: List) -> int:
+        by_model: Dict[type, List] = defaultdict(list)
+        for row in rows:
+            by_model[type(row)].append(row)
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                created = {model: model.objects.bulk_create(instances) for model, instances in by_model.items()}
+                for model, instances in created.items():
+                    self._send_created(model, instances)
+        except Exception as e:
+            logger.warning(f"Write-behind batch of {len(rows)} rows failed ({e!r}), inserting one by one.")
+            created = {model: self._save_each(instances) for model, instances in by_model.items()}
+        WRITE_BEHIND_FLUSH_SECONDS.observe(time.monotonic() - started)
+        written = 0
+        for model, instances in created.items():
+            WRITE_BEHIND_ROWS.inc(len(instances), model=model.__name__, outcome="success")
+            if len(instances) < len(by_model[model]):
+                WRITE_BEHIND_ROWS.inc(len(by_model[model]) - len(instances), model=model.__name__, outcome="error")
+            written += len(instances)
+        return written
+
+    @staticmethod
+    def _send_created(model: type, instances: List):
+        """Stand in for post_save, inside the inserting transaction."""
+        signal = BULK_CREATED_SIGNALS.get(model)
+        if signal is not None and instances:
+            signal.send(sender=model, instances=instances)
+
+    def _save_each(self, instances: List) -> List:
+        saved = []
+        for instance in instances:
+            try:
+                with transaction.atomic():
+                    created = type(instance).objects.bulk_create([instance])
+                    self._send_created(type(instance), created)
+                saved.extend(created)
+            except Exception as e:
+                logger.error(f"Write-behind dropped a {type(instance).__name__} row: {e!r}")
+        return saved
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind_buffer() -> Optional[WriteBehindBuffer]:
+    """Return the process-wide buffer, or None when ``DB_WRITE_BEHIND`` is off."""
+    global _write_behind
+    if not getattr(settings, 'DB_WRITE_BEHIND', False):
+        return None
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                _write_behind = WriteBehindBuffer()
+                atexit.register(_write_behind.flush)
+    return _write_behind
+
+
+def answer_provenance() -> Dict[str, str]:
+    """``model``/``prompt_version`` of an answer produced now; the cache key of the answer depends on them."""
+    return {
+        'model': task_model('answer'),
+        'prompt_version': str(getattr(settings, 'LEGAL_AI_PROMPT_VERSION', '1')),
+    }
+
+
+def record_question(**fields) -> LegalQuestion:
+    """Save an answered question, through the write-behind buffer when enabled (its ``pk`` is then None)."""
+    fields = {**answer_provenance(), **fields}
+    buffer = get_write_behind_buffer()
+    if buffer is None:
+        # The search index is updated in the same transaction
+        with transaction.atomic():
+            return LegalQuestion.objects.create(**fields)
+    question = LegalQuestion(**fields)
+    buffer.add(question)
+    return question
+
+
+def flush_conversation(conversation_id: int):
+    """Write the buffered turns of a conversation now, before they are read back."""
+    buffer = get_write_behind_buffer()
+    if buffer is not None:
+        buffer.flush_if(lambda row: getattr(row, 'conversation_id', None) == conversation_id)
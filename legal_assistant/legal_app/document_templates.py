@@ -0,0 +1,205 @@
+# legal_app/document_templates.py
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+
+SIGNATURE = (
+    "«___» __________ 20__ г.\n\n"
+    "____________ / ______________________ /\n"
+    "(подпись)          (ФИО)"
+)
+ATTACHMENTS = "Приложения:\n1. ______________________\n2. ______________________"
+
+
+@dataclass(frozen=True)
+class Section:
+    """A part of a document: fixed ``text`` or, with an ``instruction``, text written by the LLM."""
+    key: str
+    heading: str = ""
+    text: str = ""
+    instruction: str = ""
+    max_tokens: int = 400
+
+    @property
+    def is_variable(self) -> bool:
+        return bool(self.instruction)
+
+    def fragment(self, text: Optional[str] = None) -> str:
+        """The section as markdown, with ``text`` in place of the fixed text."""
+        body = self.text if text is None else text
+        return f"## {self.heading}\n\n{body}" if self.heading else body
+
+
+@lru_cache(maxsize=None)
+def _fixed_fragment(section: Section) -> str:
+    return section.fragment()
+
+
+@dataclass(frozen=True)
+class DocumentTemplate:
+    """Fixed sections, headers and legal formulae of a document type.
+
+    Only the variable sections are written by the LLM. Bump ``version``
+    when the template changes so cached documents and sections expire.
+    """
+    doc_type: str
+    name: str
+    sections: Tuple[Section, ...]
+    version: str = "1"
+
+    @property
+    def variable_sections(self) -> Tuple[Section, ...]:
+        return tuple(section for section in self.sections if section.is_variable)
+
+    def assemble(self, fragments: Dict[str, str]) -> str:
+        """Join the fixed sections with the LLM's ``fragments`` (by section key)."""
+        return "\n\n".join(
+            section.fragment(fragments[section.key]) if section.is_variable else _fixed_fragment(section)
+            for section in self.sections
+        )
+
+
+TEMPLATES: Dict[str, DocumentTemplate] = {
+    template.doc_type: template for template in (
+        DocumentTemplate('complaint', 'Жалоба', (
+            Section('addressee', text=(
+                "В ______________________________\n"
+                "(наименование органа или организации)\n\n"
+                "От: ______________________________\n"
+                "(ФИО, адрес, телефон)"
+            )),
+            Section(
+                'circumstances', 'Обстоятельства дела',
+                instruction="the facts that caused the complaint, in chronological order",
+                max_tokens=500,
+            ),
+            Section(
+                'violations', 'Нарушенные права',
+                instruction="which rights of the complainant were violated, citing Russian laws",
+                max_tokens=400,
+            ),
+            Section('grounds', text=(
+                "На основании изложенного, руководствуясь Федеральным законом от 02.05.2006 № 59-ФЗ "
+                "«О порядке рассмотрения обращений граждан Российской Федерации»,"
+            )),
+            Section(
+                'demands', 'Прошу',
+                instruction="a numbered list of the complainant's demands",
+                max_tokens=250,
+            ),
+            Section('attachments', text=ATTACHMENTS),
+            Section('signature', text=SIGNATURE),
+        )),
+        DocumentTemplate('contract', 'Договор', (
+            Section('preamble', text=(
+                "г. ______________                                        «___» __________ 20__ г.\n\n"
+                "______________________, именуемый(ая) в дальнейшем «Сторона 1», с одной стороны, "
+                "и ______________________, именуемый(ая) в дальнейшем «Сторона 2», с другой стороны, "
+                "совместно именуемые «Стороны», заключили настоящий договор о нижеследующем:"
+            )),
+            Section(
+                'subject', '1. Предмет договора',
+                instruction="the subject of the contract as numbered clauses 1.1, 1.2, ...",
+                max_tokens=300,
+            ),
+            Section(
+                'obligations', '2. Права и обязанности сторон',
+                instruction="the rights and obligations of both parties as numbered clauses 2.1, 2.2, ...",
+                max_tokens=500,
+            ),
+            Section(
+                'price', '3. Цена и порядок расчётов',
+                instruction="the price, payment terms and procedure as numbered clauses 3.1, 3.2, ...",
+                max_tokens=250,
+            ),
+            Section('liability', '4. Ответственность сторон', text=(
+                "4.1. За неисполнение или ненадлежащее исполнение обязательств по настоящему договору "
+                "Стороны несут ответственность в соответствии с законодательством Российской Федерации.\n"
+                "4.2. Стороны освобождаются от ответственности за неисполнение обязательств, если оно "
+                "явилось следствием обстоятельств непреодолимой силы (статья 401 ГК РФ)."
+            )),
+            Section('disputes', '5. Разрешение споров', text=(
+                "5.1. Споры и разногласия разрешаются путём переговоров. Соблюдение претензионного порядка "
+                "обязательно, срок ответа на претензию — 30 календарных дней.\n"
+                "5.2. При недостижении согласия спор передаётся на рассмотрение суда в порядке, "
+                "установленном законодательством Российской Федерации."
+            )),
+            Section('final', '6. Заключительные положения', text=(
+                "6.1. Договор вступает в силу с момента подписания и действует до полного исполнения "
+                "Сторонами своих обязательств.\n"
+                "6.2. Изменения и дополнения к договору действительны, если они совершены в письменной "
+                "форме и подписаны обеими Сторонами.\n"
+                "6.3. Договор составлен в двух экземплярах, имеющих равную юридическую силу, "
+                "по одному для каждой из Сторон."
+            )),
+            Section('signatures', '7. Реквизиты и подписи сторон', text=(
+                "Сторона 1: ______________________\n\n____________ / ______________________ /\n\n"
+                "Сторона 2: ______________________\n\n____________ / ______________________ /"
+            )),
+        )),
+        DocumentTemplate('statement', 'Заявление', (
+            Section('addressee', text=(
+                "В ______________________________\n"
+                "(наименование суда, органа или организации)\n\n"
+                "Заявитель: ______________________________\n"
+                "(ФИО, адрес, телефон)"
+            )),
+            Section(
+                'body', 'Существо заявления',
+                instruction="the substance of the statement: the facts and their legal grounds under Russian law",
+                max_tokens=400,
+            ),
+            Section(
+                'requests', 'Прошу',
+                instruction="a numbered list of the applicant's requests",
+                max_tokens=200,
+            ),
+            Section('attachments', text=ATTACHMENTS),
+            Section('signature', text=SIGNATURE),
+        )),
+        DocumentTemplate('pretension', 'Претензия', (
+            Section('addressee', text=(
+                "Кому: ______________________________\n"
+                "(наименование или ФИО должника, адрес)\n\n"
+                "От кого: ______________________________\n"
+                "(наименование или ФИО, адрес, телефон)"
+            )),
+            Section(
+                'circumstances', 'Обстоятельства',
+                instruction="the obligation, how it was breached and the resulting debt or damage",
+                max_tokens=400,
+            ),
+            Section('grounds', text=(
+                "В соответствии со статьями 309 и 310 Гражданского кодекса Российской Федерации "
+                "обязательства должны исполняться надлежащим образом в соответствии с их условиями "
+                "и требованиями закона; односторонний отказ от исполнения обязательства не допускается."
+            )),
+            Section(
+                'demands', 'Требую',
+                instruction="a numbered list of demands to the debtor with amounts and deadlines where known",
+                max_tokens=250,
+            ),
+            Section('consequences', text=(
+                "Ответ на претензию прошу направить в течение 10 (десяти) календарных дней с момента "
+                "её получения. В случае неудовлетворения требований я буду вынужден(а) обратиться "
+                "в суд, что повлечёт взыскание судебных расходов, неустойки и процентов за пользование "
+                "чужими денежными средствами (статья 395 ГК РФ)."
+            )),
+            Section('signature', text=SIGNATURE),
+        )),
+    )
+}
+
+
+def get_document_template(doc_type: str) -> Optional[DocumentTemplate]:
+    """The template of ``doc_type``, or None to have the LLM write the whole document."""
+    if not getattr(settings, 'LEGAL_AI_DOCUMENT_TEMPLATES', True):
+        return None
+    return TEMPLATES.get(doc_type)
+
+
+def document_template_version(doc_type: str) -> str:
+    """Part of document cache keys: changes when the type's template does."""
+    template = get_document_template(doc_type)
+    return f"template-{template.version}" if template else "freeform"
@@ -0,0 +1,185 @@
+# legal_app/downloads.py
+import logging
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+from .models import Document
+from .rendering import DOCX_CONTENT_TYPE, convert_to_pdf
+
+logger = logging.getLogger(__name__)
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+# Background PDF conversions: storage name of the PDF -> its conversion
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+_pdf_conversions: Dict[str, Future] = {}
+_pdf_lock = threading.Lock()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive offsets.
+
+    Returns None for a missing or unsupported header (the whole file is then
+    served) and raises ValueError for an unsatisfiable range.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def _read_range(f: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    try:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _content_disposition(title: str, extension: str = 'docx') -> str:
+    """Attachment header with an ASCII fallback and the UTF-8 (RFC 6266) file name."""
+    ascii_title = title.encode('ascii', 'ignore').decode().replace('"', '').strip() or 'document'
+    return f"attachment; filename=\"{ascii_title}.{extension}\"; filename*=utf-8''{quote(f'{title}.{extension}')}"
+
+
+def pdf_file_name(document: Document) -> str:
+    return document.file.name.rsplit('.', 1)[0] + '.pdf'
+
+
+def store_document_pdf(document: Document) -> str:
+    """Convert the document's .docx to PDF once and return the stored PDF's name.
+
+    The PDF is stored next to the content-addressed .docx, so it is shared
+    by every document with the same content.
+    """
+    storage = document.file.storage
+    name = pdf_file_name(document)
+    if not storage.exists(name):
+        with storage.open(document.file.name, 'rb') as f:
+            pdf = convert_to_pdf(f.read())
+        name = storage.save(name, ContentFile(pdf))
+    return name
+
+
+def get_pdf_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool converting documents to PDF."""
+    global _pdf_executor
+    if _pdf_executor is None:
+        with _pdf_executor_lock:
+            if _pdf_executor is None:
+                _pdf_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'DOCUMENT_PDF_WORKERS', 2),
+                    thread_name_prefix='document-pdf',
+                )
+    return _pdf_executor
+
+
+def request_document_pdf(document: Document) -> Optional[str]:
+    """The stored PDF's name, or None while it is being converted in the background.
+
+    A conversion takes LibreOffice up to ``DOCUMENT_PDF_TIMEOUT`` seconds,
+    too long to hold a request for; the client asks again until the PDF is
+    there. One conversion runs per file; if it failed, its error is raised
+    once and the next request starts over.
+    """
+    name = pdf_file_name(document)
+    if document.file.storage.exists(name):
+        return name
+    with _pdf_lock:
+        conversion = _pdf_conversions.get(name)
+        if conversion is not None and conversion.done():
+            # Successful conversions remove themselves, so this one failed
+            del _pdf_conversions[name]
+            raise conversion.exception()
+        if conversion is None:
+            _pdf_conversions[name] = get_pdf_executor().submit(_convert, document, name)
+            logger.info(f"Converting document {document.id} to PDF.")
+    return None
+
+
+def _convert(document: Document, name: str) -> str:
+    stored = store_document_pdf(document)
+    with _pdf_lock:
+        del _pdf_conversions[name]
+    return stored
+
+
+def serve_document_file(request, document: Document, file_name: Optional[str] = None,
+                        content_type: str = DOCX_CONTENT_TYPE) -> HttpResponse:
+    """Stream a generated document with ETag and single byte-range support.
+
+    Files are content-addressed and never change, so the content hash is a
+    strong ETag. Full downloads go through ``FileResponse`` (the server's
+    ``wsgi.file_wrapper``/sendfile) or, when ``DOCUMENT_SENDFILE_HEADER`` is
+    set, are handed off to the front-end server entirely.
+    """
+    storage = document.file.storage
+    file_name = file_name or document.file.name
+    extension = file_name.rsplit('.', 1)[-1]
+    size = storage.size(file_name)
+    # The PDF of a document is a different representation, with its own ETag
+    suffix = '' if extension == 'docx' else f"-{extension}"
+    etag = f'"{document.content_hash or f"{document.id}-{size}"}{suffix}"'
+
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    sendfile_header = getattr(settings, 'DOCUMENT_SENDFILE_HEADER', None)
+    if sendfile_header:
+        # e.g. nginx X-Accel-Redirect to an internal location aliasing MEDIA_ROOT
+        response = HttpResponse(content_type=content_type)
+        response[sendfile_header] = f"{settings.DOCUMENT_SENDFILE_PREFIX}{file_name}"
+    else:
+        range_header = request.META.get('HTTP_RANGE', '')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        try:
+            byte_range = parse_range(range_header, size) if if_range in (None, etag) else None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+        if byte_range is None:
+            response = FileResponse(storage.open(file_name, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(storage.open(file_name, 'rb'), start, end),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+            response['Content-Length'] = str(end - start + 1)
+
+    response['Content-Disposition'] = _content_disposition(document.title, extension)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
@@ -0,0 +1,271 @@
+# legal_app/jobs.py
+import io
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .document_templates import document_template_version
+from .metrics import stage
+from .models import Document, DocumentJob
+from .rendering import content_hash, render_docx
+from .response_cache import stable_digest
+from .scheduler import BACKGROUND, scheduling
+from .text import normalize_text
+from .utils import get_legal_ai
+
+logger = logging.getLogger(__name__)
+
+# In-process workers used by the 'thread' backend
+_job_executor = None
+_job_executor_lock = threading.Lock()
+_recovery_started = False
+
+
+def get_job_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool that runs document jobs for the 'thread' backend."""
+    global _job_executor
+    if _job_executor is None:
+        with _job_executor_lock:
+            if _job_executor is None:
+                _job_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'DOCUMENT_JOB_WORKERS', 2),
+                    thread_name_prefix='document-job',
+                )
+    return _job_executor
+
+
+def enqueue_document_job(user, doc_type: str, title: str, context: str) -> DocumentJob:
+    """Queue a document for generation and return the job immediately.
+
+    With the 'thread' backend the job starts in an in-process worker once the
+    transaction commits; with the 'db' backend it waits for
+    ``manage.py document_worker``.
+    """
+    job = DocumentJob.objects.create(user=user, document_type=doc_type, title=title, context=context)
+    if getattr(settings, 'DOCUMENT_JOB_BACKEND', 'thread') == 'thread':
+        transaction.on_commit(lambda: get_job_executor().submit(_run_in_thread, job.id))
+    logger.info(f"Document job {job.id} queued.")
+    return job
+
+
+def _run_in_thread(job_id: int):
+    """Claim and run a job from a pool thread, which owns its DB connection."""
+    close_old_connections()
+    try:
+        if claim_job(job_id):
+            run_document_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id: int) -> bool:
+    """Atomically move a queued job to 'running'; False if someone else got it."""
+    now = timezone.now()
+    return DocumentJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=now, heartbeat_at=now
+    ) == 1
+
+
+def stale_jobs(older_than: timedelta):
+    """Running jobs whose heartbeat stopped more than ``older_than`` ago (their worker died)."""
+    cutoff = timezone.now() - older_than
+    return DocumentJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status='running',
+    )
+
+
+@contextmanager
+def _heartbeat(job_id: int):
+    """Refresh the job's heartbeat from a side thread while the block runs."""
+    interval = getattr(settings, 'DOCUMENT_JOB_HEARTBEAT', 30)
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(interval):
+                try:
+                    DocumentJob.objects.filter(id=job_id, status='running').update(heartbeat_at=timezone.now())
+                except Exception as e:
+                    logger.warning(f"Could not refresh the heartbeat of document job {job_id}: {e!r}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'document-job-heartbeat-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+
+
+def claim_next_job() -> Optional[int]:
+    """Claim the oldest queued job and return its id, or None if the queue is empty."""
+    while True:
+        job_id = (
+            DocumentJob.objects.filter(status='queued')
+            .order_by('created_at')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        if claim_job(job_id):
+            return job_id
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Return running jobs whose heartbeat stopped (e.g. after a worker crash) to the queue."""
+    return stale_jobs(older_than).update(status='queued', started_at=None, heartbeat_at=None)
+
+
+def resume_jobs(include_queued: bool = True) -> int:
+    """Submit jobs a dead process left behind to the 'thread' backend's pool; returns how many.
+
+    Running jobs whose heartbeat is older than ``DOCUMENT_JOB_STALE_AFTER``
+    seconds are requeued and submitted, and with ``include_queued`` so are all queued
+    jobs, whose submission died with the process that queued them. Other
+    processes may submit the same jobs; ``claim_job`` runs each once.
+    """
+    stale_after = timedelta(seconds=getattr(settings, 'DOCUMENT_JOB_STALE_AFTER', 120))
+    # Re-check staleness per job so one that just beat again is left alone
+    requeued = [job_id for job_id in stale_jobs(stale_after).values_list('id', flat=True)
+                if stale_jobs(stale_after).filter(id=job_id).update(status='queued', started_at=None, heartbeat_at=None)]
+    if include_queued:
+        job_ids = list(DocumentJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True))
+    else:
+        job_ids = requeued
+    executor = get_job_executor()
+    for job_id in job_ids:
+        executor.submit(_run_in_thread, job_id)
+    if job_ids:
+        logger.info(f"Resumed {len(job_ids)} document jobs ({len(requeued)} were stale).")
+    return len(job_ids)
+
+
+def _schedule_stale_check():
+    timer = threading.Timer(getattr(settings, 'DOCUMENT_JOB_STALE_AFTER', 120), _check_stale_jobs)
+    timer.daemon = True
+    timer.start()
+
+
+def _check_stale_jobs():
+    close_old_connections()
+    try:
+        resume_jobs(include_queued=False)
+    except Exception as e:
+        logger.error(f"Could not requeue stale document jobs: {e!r}", exc_info=True)
+    finally:
+        close_old_connections()
+    _schedule_stale_check()
+
+
+def start_job_recovery():
+    """Resume the jobs left behind by a previous run, then requeue stale ones periodically.
+
+    Does nothing after the first call in a process, or unless the 'thread'
+    backend is used (``manage.py document_worker`` recovers 'db' jobs).
+    """
+    global _recovery_started
+    if getattr(settings, 'DOCUMENT_JOB_BACKEND', 'thread') != 'thread':
+        return
+    with _job_executor_lock:
+        if _recovery_started:
+            return
+        _recovery_started = True
+    try:
+        resume_jobs()
+    except Exception as e:
+        logger.error(f"Could not resume document jobs: {e!r}", exc_info=True)
+    _schedule_stale_check()
+
+
+def document_source_hash(doc_type: str, title: str, context: str) -> str:
+    """Identify a document request; identical inputs produce the same document."""
+    return stable_digest(
+        get_legal_ai().models['document'],
+        str(getattr(settings, 'LEGAL_AI_PROMPT_VERSION', '1')),
+        doc_type,
+        document_template_version(doc_type),
+        title,
+        normalize_text(context, casefold=False),
+    )
+
+
+def store_document_file(title: str, content: str) -> Tuple[str, str]:
+    """Render ``content`` into content-addressed storage unless already there.
+
+    Returns the content hash and the storage name of the .docx file.
+    """
+    storage = Document._meta.get_field('file').storage
+    digest = content_hash(title, content)
+    name = f"documents/{digest[:2]}/{digest}.docx"
+    if not storage.exists(name):
+        buffer = io.BytesIO()
+        with stage("docx_render"):
+            render_docx(title, content, buffer)
+        # A concurrent writer may have won the race; storage then picks another name
+        name = storage.save(name, ContentFile(buffer.getvalue()))
+    return digest, name
+
+
+def run_document_job(job_id: int):
+    """Produce the document of a claimed job and attach it to the job.
+
+    A document previously produced from the same inputs is reused without
+    calling the LLM or rendering again. The job's heartbeat is refreshed
+    meanwhile, so slow jobs are not mistaken for ones whose worker died.
+    """
+    with _heartbeat(job_id):
+        _run_document_job(job_id)
+
+
+def _run_document_job(job_id: int):
+    job = DocumentJob.objects.select_related('user').get(id=job_id)
+    try:
+        source_hash = document_source_hash(job.document_type, job.title, job.context)
+        existing = (
+            Document.objects.filter(source_hash=source_hash)
+            .exclude(file='')
+            .order_by('-created_at')
+            .first()
+        )
+        if existing is not None and existing.user_id == job.user_id:
+            document = existing
+        else:
+            if existing is not None:
+                content, digest, file_name = existing.content, existing.content_hash, existing.file.name
+            else:
+                with scheduling(job.user_id, BACKGROUND):
+                    content = get_legal_ai().generate_document(job.document_type, job.context, raise_errors=True)
+                digest, file_name = store_document_file(job.title, content)
+            # The search index is updated in the same transaction
+            with stage("orm_write"), transaction.atomic():
+                document = Document.objects.create(
+                    user=job.user,
+                    title=job.title,
+                    content=content,
+                    document_type=job.document_type,
+                    file=file_name,
+                    content_hash=digest,
+                    source_hash=source_hash,
+                )
+
+        job.document = document
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['document', 'status', 'finished_at'])
+        logger.info(f"Document job {job.id} finished: document {document.id}.")
+    except Exception as e:
+        logger.error(f"Document job {job.id} failed: {e}", exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
@@ -0,0 +1,368 @@
+# legal_app/knowledge.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from django.conf import settings
+from .text import tokenize
+from .tokens import count_tokens
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# The store is a directory holding an SQLite database (chunks, FTS5 index of
+# stemmed terms, source digests) and the chunk embeddings as a NumPy matrix.
+# Embedding files are numbered by generation, so a worker keeps reading its
+# memory-mapped matrix while the indexer writes the next one.
+DATABASE_NAME = "knowledge.sqlite3"
+SOURCE_PATTERNS = ("*.txt", "*.md")
+RRF_K = 60  # reciprocal rank fusion constant
+BM25_WEIGHTS = (2.0, 1.0)  # title, text
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, code TEXT, digest TEXT, indexed_at REAL)",
+    "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, source TEXT, code TEXT, article TEXT, "
+    "title TEXT, text TEXT, digest TEXT, row INTEGER)",
+    "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(title, text, tokenize='unicode61')",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+_ARTICLE_RE = re.compile(r"^\s*Статья\s+(\d+(?:\.\d+)*)\.?\s*(.*)$")
+
+
+@dataclass
+class Chunk:
+    code: str
+    article: str
+    title: str
+    text: str
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(f"{self.code}\0{self.title}\0{self.text}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Passage:
+    """A retrieved statute fragment."""
+    code: str
+    article: str
+    title: str
+    text: str
+    score: float
+
+    @property
+    def citation(self) -> str:
+        return f"{self.code}, статья {self.article}" if self.article else self.code
+
+
+def split_articles(text: str, max_tokens: int = 400) -> Tuple[str, List[Chunk]]:
+    """Split a statute into chunks, one per article ("Статья N. Title").
+
+    The first non-empty line names the act. Articles longer than
+    ``max_tokens`` are split at line breaks into several chunks that share
+    the article's title.
+    """
+    lines = text.splitlines()
+    code = next((line.strip() for line in lines if line.strip()), "")[:200]
+    articles: List[Tuple[str, str, List[str]]] = []
+    article, title, body = "", code, []
+    for line in lines[1:] if lines else []:
+        match = _ARTICLE_RE.match(line)
+        if match:
+            articles.append((article, title, body))
+            article = match.group(1)
+            title = f"Статья {article}. {match.group(2).strip()}".rstrip(". ")
+            body = []
+        elif line.strip():
+            body.append(line.strip())
+    articles.append((article, title, body))
+
+    chunks = []
+    for article, title, body in articles:
+        part: List[str] = []
+        part_tokens = 0
+        for paragraph in body:
+            tokens = count_tokens(paragraph)
+            if part and part_tokens + tokens > max_tokens:
+                chunks.append(Chunk(code, article, title, "\n".join(part)))
+                part, part_tokens = [], 0
+            part.append(paragraph)
+            part_tokens += tokens
+        if part:
+            chunks.append(Chunk(code, article, title, "\n".join(part)))
+    return code, chunks
+
+
+def _terms(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def _match_query(question: str) -> Optional[str]:
+    """Any of the question's stems; bm25 ranks chunks matching more (and rarer) of them higher."""
+    stems = list(dict.fromkeys(tokenize(question)))
+    if not stems:
+        return None
+    return " OR ".join(f'"{stem}"' for stem in stems)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+class KnowledgeIndexer:
+    """Builds and incrementally updates the store from a directory of statute texts.
+
+    Files whose digest did not change are skipped; chunks of changed files
+    are replaced. Embeddings of chunks whose text did not change are copied
+    from the previous matrix, so only new text is sent to the embedding API.
+    """
+
+    def __init__(self, index_dir, chunk_tokens: int = 400):
+        self.index_dir = Path(index_dir)
+        self.chunk_tokens = chunk_tokens
+
+    def connect(self) -> sqlite3.Connection:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.index_dir / DATABASE_NAME)
+        for statement in SCHEMA:
+            db.execute(statement)
+        return db
+
+    def update(self, source_dir, embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+               embedding_model: str = "", rebuild: bool = False, batch_size: int = 64) -> Dict[str, int]:
+        """Index ``source_dir`` and return counts of what changed."""
+        source_dir = Path(source_dir)
+        stats = {"files": 0, "skipped": 0, "removed": 0, "chunks": 0, "embedded": 0}
+        db = self.connect()
+        try:
+            # Chunks of a changed file are re-inserted, so the rows of their
+            # current vectors are read before anything is deleted
+            previous_rows = {} if rebuild else dict(
+                db.execute("SELECT digest, row FROM chunks WHERE row IS NOT NULL")
+            )
+            with db:
+                if rebuild:
+                    db.execute("DELETE FROM sources")
+                    db.execute("DELETE FROM chunks")
+                    db.execute("DELETE FROM chunks_fts")
+                known = dict(db.execute("SELECT path, digest FROM sources"))
+                seen = set()
+                for path in sorted(p for pattern in SOURCE_PATTERNS for p in source_dir.rglob(pattern)):
+                    name = str(path.relative_to(source_dir))
+                    seen.add(name)
+                    data = path.read_bytes()
+                    digest = hashlib.sha256(data).hexdigest()
+                    if known.get(name) == digest:
+                        stats["skipped"] += 1
+                        continue
+                    code, chunks = split_articles(data.decode("utf-8", "replace"), self.chunk_tokens)
+                    self._remove_source(db, name)
+                    self._add_chunks(db, name, chunks)
+                    db.execute(
+                        "INSERT OR REPLACE INTO sources (path, code, digest, indexed_at) VALUES (?, ?, ?, ?)",
+                        (name, code, digest, time.time()),
+                    )
+                    stats["files"] += 1
+                    stats["chunks"] += len(chunks)
+                for name in set(known) - seen:
+                    self._remove_source(db, name)
+                    db.execute("DELETE FROM sources WHERE path = ?", (name,))
+                    stats["removed"] += 1
+            if embed is not None and np is not None:
+                stats["embedded"] = self._update_embeddings(db, previous_rows, embed, embedding_model, batch_size)
+            elif embed is not None:
+                logger.warning("numpy is not installed; the knowledge base is searched by keywords only.")
+        finally:
+            db.close()
+        logger.info(f"Knowledge base updated: {stats}")
+        return stats
+
+    def _remove_source(self, db: sqlite3.Connection, name: str):
+        db.execute("DELETE FROM chunks_fts WHERE rowid IN (SELECT id FROM chunks WHERE source = ?)", (name,))
+        db.execute("DELETE FROM chunks WHERE source = ?", (name,))
+
+    def _add_chunks(self, db: sqlite3.Connection, name: str, chunks: Sequence[Chunk]):
+        for chunk in chunks:
+            cursor = db.execute(
+                "INSERT INTO chunks (source, code, article, title, text, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, chunk.code, chunk.article, chunk.title, chunk.text, chunk.digest),
+            )
+            db.execute(
+                "INSERT INTO chunks_fts (rowid, title, text) VALUES (?, ?, ?)",
+                (cursor.lastrowid, _terms(f"{chunk.code} {chunk.title}"), _terms(chunk.text)),
+            )
+
+    def _update_embeddings(self, db: sqlite3.Connection, previous_rows: Dict[str, int], embed,
+                           embedding_model: str, batch_size: int) -> int:
+        """Write the next generation's matrix, reusing the vectors of unchanged chunks."""
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        old_file = meta.get("embeddings_file")
+        previous = {}
+        if old_file and meta.get("embedding_model") == embedding_model and (self.index_dir / old_file).exists():
+            old_vectors = np.load(self.index_dir / old_file, mmap_mode="r")
+            previous = {digest: old_vectors[row] for digest, row in previous_rows.items() if row < len(old_vectors)}
+        rows = db.execute("SELECT id, digest, title, text, row FROM chunks ORDER BY id").fetchall()
+        if not rows or (old_file and previous and all(row[4] is not None for row in rows)):
+            # Only removals (or nothing) since the last generation: its rows are still valid
+            return 0
+        missing = [(digest, f"{title}\n{text}") for _, digest, title, text, _ in rows if digest not in previous]
+        vectors: Dict[str, object] = dict(previous)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            for (digest, _), vector in zip(batch, embed([text for _, text in batch])):
+                vectors[digest] = np.asarray(vector, dtype=np.float32)
+
+        generation = int(meta.get("generation", "0")) + 1
+        file_name = f"embeddings.{generation}.npy"
+        matrix = _normalize_rows(np.stack([vectors[row[1]] for row in rows]))
+        tmp_path = self.index_dir / f"{file_name}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, self.index_dir / file_name)
+        with db:
+            db.executemany("UPDATE chunks SET row = ? WHERE id = ?", [(i, row[0]) for i, row in enumerate(rows)])
+            db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("generation", str(generation)),
+                ("embeddings_file", file_name),
+                ("embedding_model", embedding_model),
+                ("dimensions", str(matrix.shape[1])),
+            ])
+        if old_file and old_file != file_name:
+            # Workers that still map the old file keep reading it until they reload
+            (self.index_dir / old_file).unlink(missing_ok=True)
+        return len(missing)
+
+
+class KnowledgeBase:
+    """Read side of the store, opened by every worker.
+
+    Opening costs an SQLite connection per thread and a memory map of the
+    embedding matrix: nothing is read into the process until a query
+    touches it, and the OS page cache is shared between workers. A new
+    generation written by the indexer is picked up on the next query.
+    """
+
+    def __init__(self, index_dir, embedding_model: str = ""):
+        self.index_dir = Path(index_dir)
+        self.embedding_model = embedding_model
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._vectors_file = None
+        self._vectors = None
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            uri = f"{(self.index_dir / DATABASE_NAME).as_uri()}?mode=ro"
+            db = self._local.db = sqlite3.connect(uri, uri=True)
+        return db
+
+    def vectors(self):
+        """The memory-mapped embedding matrix of the current generation, or None."""
+        if np is None:
+            return None
+        meta = dict(self._db().execute(
+            "SELECT key, value FROM meta WHERE key IN ('embeddings_file', 'embedding_model')"
+        ))
+        file_name = meta.get("embeddings_file")
+        if not file_name or meta.get("embedding_model") != self.embedding_model:
+            return None
+        with self._lock:
+            if file_name != self._vectors_file:
+                self._vectors = np.load(self.index_dir / file_name, mmap_mode="r")
+                self._vectors_file = file_name
+            return self._vectors
+
+    def keyword_search(self, question: str, k: int) -> List[int]:
+        """Chunk ids ranked by bm25 over stemmed terms."""
+        query = _match_query(question)
+        if query is None:
+            return []
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        rows = self._db().execute(
+            f"SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts, {weights}) LIMIT ?",
+            (query, k),
+        )
+        return [row[0] for row in rows]
+
+    def vector_search(self, embedding: Sequence[float], k: int) -> List[int]:
+        """Chunk ids ranked by cosine similarity to ``embedding``."""
+        vectors = self.vectors()
+        if vectors is None or not len(vectors) or vectors.shape[1] != len(embedding):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = np.asarray(vectors) @ (query / norm if norm else query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        rows = [int(row) for row in top[np.argsort(-scores[top])]]
+        placeholders = ", ".join("?" * len(rows))
+        ids = dict(self._db().execute(f"SELECT row, id FROM chunks WHERE row IN ({placeholders})", rows))
+        return [ids[row] for row in rows if row in ids]
+
+    def retrieve(self, question: str, k: int = 4, embedding: Optional[Sequence[float]] = None) -> List[Passage]:
+        """Top ``k`` passages for ``question``: bm25, fused with vector search when an embedding is given."""
+        rankings = [self.keyword_search(question, k * 4)]
+        if embedding is not None:
+            rankings.append(self.vector_search(embedding, k * 4))
+        scores: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        if not best:
+            return []
+        placeholders = ", ".join("?" * len(best))
+        rows = {
+            row[0]: row[1:] for row in self._db().execute(
+                f"SELECT id, code, article, title, text FROM chunks WHERE id IN ({placeholders})", best
+            )
+        }
+        return [Passage(*rows[chunk_id], score=scores[chunk_id]) for chunk_id in best if chunk_id in rows]
+
+
+def format_passages(passages: Sequence[Passage], max_tokens: int) -> str:
+    """Passages as prompt text, most relevant first, within ``max_tokens``."""
+    parts, used = [], 0
+    for passage in passages:
+        heading = passage.code if passage.title == passage.code else f"{passage.code}. {passage.title}"
+        part = f"{heading}\n{passage.text}"
+        tokens = count_tokens(part)
+        if parts and used + tokens > max_tokens:
+            break
+        parts.append(part)
+        used += tokens
+    return "\n\n".join(parts)
+
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base(embedding_model: str = "") -> Optional[KnowledgeBase]:
+    """Return the process-wide knowledge base, or None when disabled or not indexed yet."""
+    global _knowledge_base
+    if not getattr(settings, 'LEGAL_AI_KNOWLEDGE_BASE', True):
+        return None
+    if _knowledge_base is None:
+        index_dir = Path(getattr(settings, 'LEGAL_AI_KNOWLEDGE_INDEX_DIR', 'cache/knowledge'))
+        if not (index_dir / DATABASE_NAME).exists():
+            return None
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                _knowledge_base = KnowledgeBase(index_dir, embedding_model)
+    return _knowledge_base
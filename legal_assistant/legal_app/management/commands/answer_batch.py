@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.batch import BatchCheckpoint, answer_batch, read_questions
+
+
+class Command(BaseCommand):
+    help = "Answer a file of questions (one per line, or JSONL with a 'question' key) and store the answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File of questions.')
+        parser.add_argument('--user', required=True,
+                            help='Username the answered questions are stored under.')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Checkpoint file to resume from (defaults to <path>.checkpoint.jsonl).')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Questions answered in parallel (defaults to LEGAL_AI_BATCH_CONCURRENCY).')
+        parser.add_argument('--rpm', type=int, default=None,
+                            help='Requests per minute budget, 0 for none (defaults to LEGAL_AI_BATCH_RPM).')
+        parser.add_argument('--tpm', type=int, default=None,
+                            help='Estimated tokens per minute budget, 0 for none (defaults to LEGAL_AI_BATCH_TPM).')
+        parser.add_argument('--flush-every', type=int, default=50,
+                            help='Answers inserted per bulk_create.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+        try:
+            questions = read_questions(options['path'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read questions: {e}")
+
+        checkpoint = BatchCheckpoint(options['checkpoint'] or f"{options['path']}.checkpoint.jsonl")
+        checkpoint.start(len(questions), user_id=user.id)
+
+        def progress(result):
+            self.stdout.write(f"Saved {result.answered} answers...")
+
+        result = answer_batch(
+            questions,
+            user,
+            checkpoint,
+            concurrency=options['concurrency'],
+            requests_per_minute=options['rpm'],
+            tokens_per_minute=options['tpm'],
+            flush_every=options['flush_every'],
+            progress=progress,
+        )
+        for question in result.failed:
+            self.stderr.write(f"Failed: {question}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Answered {result.answered}, skipped {result.skipped}, failed {len(result.failed)}."
+        ))
@@ -0,0 +1,138 @@
+import tempfile
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from legal_app import providers, utils
+from legal_app.benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from legal_app.benchmarks.runner import SCENARIOS, QuestionPool, compare, format_table, run_level, write_json
+from legal_app.metrics import UPSTREAM_REQUESTS
+
+
+class Command(BaseCommand):
+    help = ("Load test chat and document generation at increasing concurrency against a fake "
+            "OpenAI server, on a throwaway database and cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run (repeatable; default: all).')
+        parser.add_argument('--concurrency', default='1,4,16',
+                            help='Comma-separated concurrency levels.')
+        parser.add_argument('--requests', type=int, default=40,
+                            help='Requests per concurrency level.')
+        parser.add_argument('--repeat-ratio', type=float, default=0.5,
+                            help='Share of requests repeating a hot set of questions.')
+        parser.add_argument('--latency', type=float, default=0.3,
+                            help='Fake upstream latency in seconds.')
+        parser.add_argument('--jitter', type=float, default=0.05,
+                            help='Random +/- seconds added to the fake latency.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of fake upstream requests that fail.')
+        parser.add_argument('--error-status', type=int, default=500,
+                            help='HTTP status of injected upstream errors.')
+        parser.add_argument('--stream-chunk-delay', type=float, default=0.005,
+                            help='Seconds between streamed chunks.')
+        parser.add_argument('--base-url', default=None,
+                            help='Use an already running OpenAI-compatible server instead of the built-in one.')
+        parser.add_argument('--stub', action='store_true',
+                            help='Route every task to the in-process stub provider: no HTTP, '
+                                 'only --latency per call, so the app\'s own overhead is measured.')
+        parser.add_argument('--output', default=None,
+                            help='Write results as JSON (usable as a later --baseline).')
+        parser.add_argument('--baseline', default=None,
+                            help='Fail when results regress against this JSON file.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative regression against the baseline.')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be comma-separated integers.")
+        scenarios = options['scenario'] or list(SCENARIOS)
+
+        server = None
+        base_url = options['base_url']
+        if not base_url and not options['stub']:
+            server = FakeOpenAIServer(config=FakeOpenAIConfig(
+                latency=options['latency'],
+                jitter=options['jitter'],
+                error_rate=options['error_rate'],
+                error_status=options['error_status'],
+                stream_chunk_delay=options['stream_chunk_delay'],
+                seed=0,
+            )).start()
+            base_url = server.base_url
+
+        workdir = tempfile.mkdtemp(prefix='legal-benchmark-')
+        overrides = override_settings(
+            OPENAI_BASE_URL=base_url,
+            OPENAI_API_KEY=settings.OPENAI_API_KEY or 'sk-benchmark',
+            RATELIMIT_ENABLE=False,
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+                'llm': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-llm'},
+            },
+            MEDIA_ROOT=workdir,
+            DOCUMENT_JOB_BACKEND='thread',
+            LEGAL_AI_WARMUP_ON_STARTUP=False,
+            LEGAL_AI_CACHE_ALIAS='llm',
+            **(self._stub_settings(options['latency']) if options['stub'] else {}),
+        )
+        if connection.vendor == 'sqlite':
+            # A file database, unlike the in-memory default, is shared by the worker threads
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = f"{workdir}/benchmark.sqlite3"
+
+        overrides.enable()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        self._reset_clients()
+        try:
+            users = [User.objects.create_user(f"benchmark{i}", password='benchmark') for i in range(max(levels))]
+            questions = QuestionPool(options['repeat_ratio'])
+            results = []
+            for scenario in scenarios:
+                for level in levels:
+                    result = run_level(scenario, level, options['requests'], users, questions,
+                                       lambda: int(UPSTREAM_REQUESTS.value()))
+                    results.append(result)
+                    self.stdout.write(f"{scenario} x{level}: {result.requests_per_second} req/s, "
+                                      f"p95 {result.p95_ms} ms, {result.errors} errors")
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            overrides.disable()
+            self._reset_clients()
+            if server:
+                server.stop()
+
+        self.stdout.write("")
+        self.stdout.write(format_table(results))
+        if options['output']:
+            write_json(results, options['output'], {
+                'latency': options['latency'],
+                'error_rate': options['error_rate'],
+                'repeat_ratio': options['repeat_ratio'],
+                'requests': options['requests'],
+            })
+        if options['baseline']:
+            regressions = compare(results, options['baseline'], options['tolerance'])
+            if regressions:
+                raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _stub_settings(self, latency: float) -> dict:
+        return {
+            'LEGAL_AI_PROVIDERS': {
+                **getattr(settings, 'LEGAL_AI_PROVIDERS', {}),
+                'stub': {'backend': 'stub', 'latency': latency},
+            },
+            **{name: 'stub:benchmark' for name in providers.TASK_MODEL_SETTINGS.values()},
+            'LEGAL_AI_EMBEDDING_MODEL': 'stub:benchmark-embedding',
+            'LEGAL_AI_FALLBACK_MODELS': [],
+        }
+
+    def _reset_clients(self):
+        """Drop LegalAI instances and providers so that they pick up the overridden settings."""
+        utils.legal_ai = None
+        utils.async_legal_ai = None
+        providers.reset_providers()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.benchmarks.rendering import RENDERERS, format_table, run_renders, sample_content, time_pdf
+from legal_app.rendering import pdf_converter
+
+
+class Command(BaseCommand):
+    help = "Benchmark .docx rendering of a sample contract, comparing the markdown renderer with plain paragraphs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=200,
+                            help='Renders per renderer and concurrency level.')
+        parser.add_argument('--concurrency', default='1,4',
+                            help='Comma-separated numbers of rendering threads.')
+        parser.add_argument('--repeat', type=int, default=1,
+                            help='Repeat the sample document this many times to make it longer.')
+        parser.add_argument('--pdf', action='store_true',
+                            help='Also time one PDF conversion (requires LibreOffice).')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be comma-separated integers.")
+        content = sample_content(options['repeat'])
+        results = [
+            run_renders(name, render, content, options['renders'], level)
+            for name, render in RENDERERS.items()
+            for level in levels
+        ]
+        self.stdout.write(format_table(results))
+        if options['pdf']:
+            if pdf_converter() is None:
+                raise CommandError("No PDF converter (LibreOffice) is installed.")
+            self.stdout.write(f"PDF conversion: {time_pdf(content) * 1000:.0f} ms")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.benchmarks.retrieval import format_table, run_benchmark
+from legal_app.knowledge import np
+
+
+class Command(BaseCommand):
+    help = "Benchmark knowledge base retrieval on a synthetic code: index load time and query latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=5000,
+                            help='Articles in the synthetic code.')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Queries per search mode.')
+        parser.add_argument('--top-k', type=int, default=4,
+                            help='Passages retrieved per query.')
+        parser.add_argument('--dimensions', type=int, default=1536,
+                            help='Embedding dimensions (1536 for text-embedding-ada-002).')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("numpy is required for the vector index.")
+        report = run_benchmark(options['articles'], options['queries'], options['top_k'], options['dimensions'])
+        self.stdout.write(f"Indexed {options['articles']} articles in {report['build_seconds']:.1f} s")
+        self.stdout.write(f"Open index (SQLite + mmap of vectors): {report['open_ms']:.2f} ms")
+        self.stdout.write(format_table(report['results']))
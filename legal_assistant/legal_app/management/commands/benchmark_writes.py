@@ -0,0 +1,47 @@
+import tempfile
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from legal_app.benchmarks.writes import MODES, format_table, run_level
+
+
+class Command(BaseCommand):
+    help = ("Benchmark inserting answered questions from concurrent threads (with readers running), "
+            "with SQLite's defaults, with WAL and with the write-behind buffer, on a throwaway database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=list(MODES),
+                            help='Mode to run (repeatable; default: all).')
+        parser.add_argument('--threads', default='1,4,16',
+                            help='Comma-separated numbers of writer threads.')
+        parser.add_argument('--rows', type=int, default=1000,
+                            help='Rows inserted per level.')
+        parser.add_argument('--readers', type=int, default=2,
+                            help='Threads reading the question history meanwhile.')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['threads'].split(',')]
+        except ValueError:
+            raise CommandError("--threads must be comma-separated integers.")
+
+        workdir = tempfile.mkdtemp(prefix='legal-writes-')
+        if connection.vendor == 'sqlite':
+            # A file database, unlike the in-memory default, has the locking of production
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = f"{workdir}/writes.sqlite3"
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            user = User.objects.create_user('benchmark', password='benchmark')
+            results = []
+            for mode in options['mode'] or list(MODES):
+                for threads in levels:
+                    result = run_level(mode, threads, options['rows'], user, options['readers'])
+                    results.append(result)
+                    self.stdout.write(f"{mode} x{threads}: {result.rows_per_second} rows/s, "
+                                      f"p95 {result.p95_ms} ms, {result.errors} errors")
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write("")
+        self.stdout.write(format_table(results))
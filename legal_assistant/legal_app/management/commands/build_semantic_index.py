@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.semantic_cache import get_semantic_cache
+from legal_app.utils import LegalAI
+from legal_app.warmup import current_answers
+
+
+class Command(BaseCommand):
+    help = "Rebuild the semantic answer cache from previously answered questions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Number of most recent questions to index (defaults to the index size).')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Questions embedded per API request.')
+
+    def handle(self, *args, **options):
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is None:
+            raise CommandError("The semantic cache is disabled; set LEGAL_AI_SEMANTIC_CACHE=True.")
+
+        limit = options['limit'] or semantic_cache.max_entries
+        batch_size = options['batch_size']
+        legal_ai = LegalAI()
+        # Only answers of the current model and prompt version, and no follow-ups
+        rows = list(
+            current_answers(legal_ai.model)
+            .order_by('-created_at')
+            .values('question', 'answer', 'category')[:limit]
+        )
+        # Oldest first, so the most recent questions are the last to be evicted
+        rows.reverse()
+
+        items = []
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            vectors = legal_ai.embed([row['question'] for row in batch])
+            items.extend(zip(vectors, batch))
+            self.stdout.write(f"Embedded {len(items)}/{len(rows)} questions")
+
+        semantic_cache.rebuild(items)
+        # Replace the saved index rather than merging the old entries back in
+        semantic_cache.save(merge=False)
+        self.stdout.write(self.style.SUCCESS(f"Semantic cache rebuilt with {len(semantic_cache)} entries."))
@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from legal_app.jobs import claim_next_job, requeue_stale_jobs, run_document_job
+
+
+class Command(BaseCommand):
+    help = "Process queued document generation jobs (DOCUMENT_JOB_BACKEND='db')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait between polls of an empty queue.')
+        parser.add_argument('--stale-after', type=int,
+                            default=getattr(settings, 'DOCUMENT_JOB_STALE_AFTER', 120),
+                            help='Requeue running jobs whose heartbeat stopped this many seconds ago.')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale jobs.")
+
+        processed = 0
+        while True:
+            close_old_connections()
+            job_id = claim_next_job()
+            if job_id is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            run_document_job(job_id)
+            processed += 1
+            self.stdout.write(f"Processed job {job_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs."))
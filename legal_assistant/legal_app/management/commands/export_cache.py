@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from legal_app.utils import get_legal_ai
+from legal_app.warmup import export_cache
+
+
+class Command(BaseCommand):
+    help = "Export cached responses for questions and documents in history to a .jsonl.gz file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file.')
+        parser.add_argument('--questions', type=int, default=None,
+                            help='Only the N most frequent questions (default: all).')
+        parser.add_argument('--documents', type=int, default=None,
+                            help='Only the N most frequent documents (default: all).')
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only consider history from the last N days.')
+
+    def handle(self, *args, **options):
+        exported = export_cache(
+            get_legal_ai(),
+            options['path'],
+            questions=options['questions'],
+            documents=options['documents'],
+            days=options['days'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Exported {exported} cache entries to {options['path']}."))
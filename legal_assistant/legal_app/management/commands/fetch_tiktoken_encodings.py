@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.providers import TASK_MODEL_SETTINGS, split_model, task_model
+from legal_app.tokens import tiktoken
+
+
+class Command(BaseCommand):
+    help = ("Download tiktoken's BPE files for the configured task models into LEGAL_AI_TIKTOKEN_CACHE_DIR, "
+            "so token counts work without network access. Run it when building the deployment.")
+
+    def handle(self, *args, **options):
+        if tiktoken is None:
+            raise CommandError("tiktoken is not installed: pip install -r requirements.txt")
+        # Models tiktoken does not know are counted with cl100k_base
+        names = {'cl100k_base'}
+        for task in TASK_MODEL_SETTINGS:
+            _, model = split_model(task_model(task))
+            try:
+                names.add(tiktoken.encoding_name_for_model(model))
+            except KeyError:
+                pass
+
+        for name in sorted(names):
+            try:
+                tiktoken.get_encoding(name)
+            except Exception as e:
+                raise CommandError(f"Could not download the {name} encoding: {e}")
+            self.stdout.write(f"Fetched {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(names)} encodings in {settings.LEGAL_AI_TIKTOKEN_CACHE_DIR}."
+        ))
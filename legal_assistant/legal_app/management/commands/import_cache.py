@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.utils import get_legal_ai
+from legal_app.warmup import import_cache
+
+
+class Command(BaseCommand):
+    help = "Load cached responses from a file written by export_cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File written by export_cache.')
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Replace entries that are already cached.')
+
+    def handle(self, *args, **options):
+        try:
+            imported = import_cache(get_legal_ai(), options['path'], overwrite=options['overwrite'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot import {options['path']}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} cache entries."))
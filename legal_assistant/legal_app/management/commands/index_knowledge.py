@@ -0,0 +1,43 @@
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.knowledge import KnowledgeIndexer
+from legal_app.utils import LegalAI
+
+
+class Command(BaseCommand):
+    help = (
+        "Index statute texts (one act per .txt file, articles starting with \"Статья N.\") into the "
+        "knowledge base. Unchanged files are skipped and unchanged articles are not embedded again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None,
+                            help='Directory of statute texts (defaults to LEGAL_AI_KNOWLEDGE_SOURCE_DIR).')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Re-index every file and re-embed every article.')
+        parser.add_argument('--no-embeddings', action='store_true',
+                            help='Only build the keyword index; no embedding API calls.')
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Articles embedded per API request.')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'] or settings.LEGAL_AI_KNOWLEDGE_SOURCE_DIR)
+        if not source.is_dir():
+            raise CommandError(f"{source} is not a directory.")
+
+        embed = None
+        embedding_model = ''
+        if settings.LEGAL_AI_KNOWLEDGE_EMBEDDINGS and not options['no_embeddings']:
+            legal_ai = LegalAI()
+            embed, embedding_model = legal_ai.embed, legal_ai.embedding_model
+
+        indexer = KnowledgeIndexer(settings.LEGAL_AI_KNOWLEDGE_INDEX_DIR, settings.LEGAL_AI_KNOWLEDGE_CHUNK_TOKENS)
+        stats = indexer.update(
+            source, embed=embed, embedding_model=embedding_model,
+            rebuild=options['rebuild'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {stats['files']} files ({stats['chunks']} chunks), skipped {stats['skipped']} unchanged, "
+            f"removed {stats['removed']}; embedded {stats['embedded']} chunks."
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from legal_app import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over questions and documents (SQLite FTS5)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows indexed per batch.')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("The full-text index is only maintained on SQLite.")
+        questions, documents = search.rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {questions} questions and {documents} documents."))
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from legal_app.analytics import rebuild, rollup
+
+
+class Command(BaseCommand):
+    help = ("Fold questions saved since the last run into the daily analytics rollups "
+            "read by the staff dashboard. Run it periodically (cron) or with --loop.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the rollups and recompute them from all questions first.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, rolling up new questions every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds between runs with --loop.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Questions folded in per transaction (default: LEGAL_ANALYTICS_BATCH_SIZE).')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            processed = rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt the rollups from {processed} questions."))
+            if not options['loop']:
+                return
+
+        while True:
+            close_old_connections()
+            processed = rollup(batch_size=options['batch_size'])
+            if not options['loop']:
+                break
+            if processed:
+                self.stdout.write(f"Rolled up {processed} questions")
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {processed} questions."))
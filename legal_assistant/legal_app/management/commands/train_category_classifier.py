@@ -0,0 +1,66 @@
+import random
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from legal_app.classifier import UNKNOWN_CATEGORY, CategoryClassifier, normalize_category
+from legal_app.models import LegalQuestion
+
+
+class Command(BaseCommand):
+    help = "Train the local category classifier from LegalQuestion history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Artifact path (defaults to LEGAL_AI_CATEGORY_CLASSIFIER_PATH).')
+        parser.add_argument('--min-samples', type=int, default=3,
+                            help='Minimum number of questions for a category to be learned.')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Share of questions held out to report accuracy.')
+        parser.add_argument('--normalize-history', action='store_true',
+                            help='Also rewrite stored categories to their canonical labels.')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.LEGAL_AI_CATEGORY_CLASSIFIER_PATH
+
+        if options['normalize_history']:
+            self._normalize_history()
+
+        samples = [
+            (question, normalize_category(category))
+            for question, category in LegalQuestion.objects
+            .filter(status='answered')
+            .values_list('question', 'category')
+            .iterator()
+        ]
+        samples = [(question, label) for question, label in samples if label != UNKNOWN_CATEGORY]
+        if not samples:
+            raise CommandError("No answered questions with a category to train on.")
+
+        random.Random(0).shuffle(samples)
+        split = int(len(samples) * (1 - options['holdout']))
+        train, test = samples[:split], samples[split:]
+        try:
+            classifier = CategoryClassifier.train(train, min_samples=options['min_samples'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Trained on {len(train)} questions: {dict(Counter(label for _, label in train))}")
+        if test:
+            self.stdout.write(f"Hold-out accuracy: {classifier.evaluate(test):.1%} on {len(test)} questions")
+
+        # Ship a model trained on everything we have
+        try:
+            classifier = CategoryClassifier.train(samples, min_samples=options['min_samples'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        classifier.save(output)
+        self.stdout.write(self.style.SUCCESS(f"Classifier with labels {classifier.labels} saved to {output}"))
+
+    def _normalize_history(self):
+        """Rewrite free-form categories to canonical labels, one UPDATE per distinct value."""
+        updated = 0
+        for raw in LegalQuestion.objects.values_list('category', flat=True).distinct():
+            label = normalize_category(raw)
+            if label != raw:
+                updated += LegalQuestion.objects.filter(category=raw).update(category=label)
+        self.stdout.write(f"Normalized the category of {updated} questions.")
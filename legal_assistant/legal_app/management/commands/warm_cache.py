@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from legal_app.utils import get_legal_ai
+from legal_app.warmup import warm_cache
+
+
+class Command(BaseCommand):
+    help = "Preload the response cache with the most frequent questions and documents from history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=None,
+                            help='Number of questions (defaults to LEGAL_AI_WARMUP_QUESTIONS).')
+        parser.add_argument('--documents', type=int, default=None,
+                            help='Number of documents (defaults to LEGAL_AI_WARMUP_DOCUMENTS).')
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only consider history from the last N days.')
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Replace entries that are already cached.')
+
+    def handle(self, *args, **options):
+        questions, documents = warm_cache(
+            get_legal_ai(),
+            questions=options['questions'],
+            documents=options['documents'],
+            days=options['days'],
+            overwrite=options['overwrite'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Cached {questions} answers and {documents} documents."))
@@ -0,0 +1,269 @@
+# legal_app/metrics.py
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; wide enough for a cache hit and a slow GPT-4 answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Recent observations kept per series for the p50/p95/p99 gauges
+RESERVOIR_SIZE = 1024
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def quantile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank quantile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Sum over all series matching ``labels``."""
+        with self._lock:
+            return sum(
+                value for key, value in self._values.items()
+                if all(key[self.labelnames.index(name)] == str(v) for name, v in labels.items())
+            )
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value:.15g}"
+
+
+class Gauge(Counter):
+    """Value that goes up and down, with labels."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Latency histogram with Prometheus buckets plus recent-sample quantiles."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "recent": deque(maxlen=RESERVOIR_SIZE),
+                }
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["recent"].append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            recent = sorted(self._series[key]["recent"]) if key in self._series else []
+        return {q: quantile(recent, q) for q in QUANTILES}
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            items = [
+                (key, list(series["counts"]), series["sum"])
+                for key, series in sorted(self._series.items())
+            ]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:.15g}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+    def render_quantiles(self) -> Iterator[str]:
+        with self._lock:
+            items = [(key, sorted(series["recent"])) for key, series in sorted(self._series.items())]
+        for key, recent in items:
+            for q in QUANTILES:
+                labels = _format_labels(self.labelnames, key, f'quantile="{q:g}"')
+                yield f"{self.name}_recent{labels} {quantile(recent, q):.15g}"
+
+
+class MetricsRegistry:
+    """Process-local metric registry rendered in the Prometheus text format.
+
+    Values are per worker process; the response cache hit ratio, which the
+    cache backend counts itself, is the exception and covers all workers.
+    Behind gunicorn with several workers each scrape reaches one of them,
+    so scrape every worker (``process_start_time_seconds`` tells their
+    series apart and marks restarts) or read the values as samples of one
+    worker, not totals.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help: str, labelnames: Tuple[str, ...], **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self, extra_gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+            if isinstance(metric, Histogram):
+                lines.append(f"# HELP {metric.name}_recent {metric.help} (p50/p95/p99 of the last {RESERVOIR_SIZE})")
+                lines.append(f"# TYPE {metric.name}_recent gauge")
+                lines.extend(metric.render_quantiles())
+        for name, (help, value) in (extra_gauges or {}).items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PROCESS_START = REGISTRY.gauge(
+    "process_start_time_seconds", "Start time of this worker process since the Unix epoch", ("pid",),
+)
+PROCESS_START.set(time.time(), pid=os.getpid())
+REQUEST_SECONDS = REGISTRY.histogram(
+    "legal_http_request_duration_seconds", "Time spent handling a request", ("view", "method", "status"),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "legal_stage_duration_seconds", "Time spent in a stage of the request path", ("stage",),
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "legal_upstream_duration_seconds", "Duration of LLM provider calls", ("kind", "provider", "outcome"),
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "legal_upstream_requests_total", "LLM provider calls made", ("kind", "provider", "outcome"),
+)
+UPSTREAM_TOKENS = REGISTRY.counter(
+    "legal_upstream_tokens_total", "Tokens reported by OpenAI", ("kind", "type"),
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "legal_cache_lookups_total", "Response and semantic cache lookups", ("cache", "result"),
+)
+
+
+def stage(name: str):
+    """Time a stage of the request path (``with stage("orm_write"): ...``)."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+class UpstreamCall:
+    """Handle yielded by ``upstream_call`` to report the response's token usage."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.prompt_tokens = self.completion_tokens = 0
+
+    def record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        UPSTREAM_TOKENS.inc(self.prompt_tokens, kind=self.kind, type="prompt")
+        UPSTREAM_TOKENS.inc(self.completion_tokens, kind=self.kind, type="completion")
+
+
+@contextmanager
+def upstream_call(kind: str, provider: str = "openai"):
+    """Time one call of ``kind`` (answer, category, document, embedding...) to an LLM provider."""
+    call = UpstreamCall(kind)
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        yield call
+        outcome = "success"
+    finally:
+        elapsed = time.monotonic() - started
+        UPSTREAM_SECONDS.observe(elapsed, kind=kind, provider=provider, outcome=outcome)
+        UPSTREAM_REQUESTS.inc(kind=kind, provider=provider, outcome=outcome)
+        logger.info(
+            f"upstream kind={kind} provider={provider} outcome={outcome} duration_ms={elapsed * 1000:.0f} "
+            f"prompt_tokens={call.prompt_tokens} completion_tokens={call.completion_tokens}"
+        )
+
+
+def upstream_error_rate() -> float:
+    total = UPSTREAM_REQUESTS.value()
+    return UPSTREAM_REQUESTS.value(outcome="error") / total if total else 0.0
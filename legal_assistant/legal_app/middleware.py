@@ -0,0 +1,46 @@
+# legal_app/middleware.py
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .metrics import REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """Record the duration of every request by view, method and status.
+
+    For streaming responses the time runs until the response starts, not
+    until the stream ends. Works under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.monotonic()
+        response = self.get_response(request)
+        self._record(request, response, time.monotonic() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self._record(request, response, time.monotonic() - started)
+        return response
+
+    def _record(self, request, response, elapsed: float):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        logger.info(
+            f"request view={view} method={request.method} status={response.status_code} "
+            f"duration_ms={elapsed * 1000:.0f}"
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legal_app', '0004_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'created_at'], name='legal_app_d_user_id_b61a30_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# The tables as created here; legal_app.search may change later without affecting this migration
+CREATE_FTS_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS legal_app_question_fts "
+    "USING fts5(question, answer, category, user_id UNINDEXED, tokenize='unicode61')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS legal_app_document_fts "
+    "USING fts5(title, content, user_id UNINDEXED, tokenize='unicode61')",
+]
+DROP_FTS_SQL = [
+    "DROP TABLE IF EXISTS legal_app_question_fts",
+    "DROP TABLE IF EXISTS legal_app_document_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 tables only exist on SQLite; other databases search with LIKE
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_FTS_SQL:
+        schema_editor.execute(sql)
+    # Backfill existing rows with the stems the application searches for
+    from legal_app.text import tokenize
+
+    def terms(text):
+        return " ".join(tokenize(text or ""))
+
+    LegalQuestion = apps.get_model('legal_app', 'LegalQuestion')
+    Document = apps.get_model('legal_app', 'Document')
+    database = schema_editor.connection.alias
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO legal_app_question_fts (rowid, question, answer, category, user_id) VALUES (%s, %s, %s, %s, %s)",
+            (
+                (q.id, terms(q.question), terms(q.answer), terms(q.category), q.user_id)
+                for q in LegalQuestion.objects.using(database).iterator(chunk_size=1000)
+            ),
+        )
+        cursor.executemany(
+            "INSERT INTO legal_app_document_fts (rowid, title, content, user_id) VALUES (%s, %s, %s, %s)",
+            (
+                (d.id, terms(d.title), terms(d.content), d.user_id)
+                for d in Document.objects.using(database).iterator(chunk_size=1000)
+            ),
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legal_app', '0005_document_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legal_app', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalquestion',
+            name='completion_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='legalquestion',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legal_app', '0008_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyQuestionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(max_length=100)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('timed_count', models.PositiveIntegerField(default=0)),
+                ('processing_time_sum', models.FloatField(default=0.0)),
+                ('processing_time_max', models.FloatField(default=0.0)),
+                ('latency_buckets', models.JSONField(default=list)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('closed_until', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyTopQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('digest', models.CharField(max_length=64)),
+                ('question', models.TextField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'count'], name='legal_app_d_day_3af989_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailytopquestion',
+            constraint=models.UniqueConstraint(fields=('day', 'digest'), name='daily_top_question_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyquestionstats',
+            constraint=models.UniqueConstraint(fields=('day', 'category', 'status'), name='daily_question_stats_unique'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legal_app', '0009_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalquestion',
+            name='model',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='legalquestion',
+            name='prompt_version',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legal_app', '0010_legalquestion_provenance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
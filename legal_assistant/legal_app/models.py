@@ -2,8 +2,31 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+class Conversation(models.Model):
+    """A thread of questions; earlier turns are sent along with each new question."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200, blank=True)
+    # Rolling summary of the turns up to and including summary_until; later turns are sent verbatim
+    summary = models.TextField(blank=True)
+    summary_until = models.ForeignKey(
+        'LegalQuestion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.title[:50]}"
+
 class LegalQuestion(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.SET_NULL, null=True, blank=True, related_name='questions'
+    )
     question = models.TextField()
     answer = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -19,6 +42,12 @@ class LegalQuestion(models.Model):
         default='pending'
     )
     processing_time = models.FloatField(null=True, blank=True)
+    # Tokens spent on this request; 0 when the answer came from a cache
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    # Answer model and LEGAL_AI_PROMPT_VERSION the answer was produced under; blank before they were recorded
+    model = models.CharField(max_length=100, blank=True)
+    prompt_version = models.CharField(max_length=20, blank=True)
 
     class Meta:
         indexes = [
@@ -36,7 +65,98 @@ class Document(models.Model):
     document_type = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     file = models.FileField(upload_to='documents/', null=True, blank=True)
+    # SHA-256 of the rendered text; names the file and serves as the download ETag
+    content_hash = models.CharField(max_length=64, blank=True)
+    # SHA-256 of the generation inputs; identical requests reuse the document
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
 
     def __str__(self):
         return self.title
-    
\ No newline at end of file
+
+class DocumentJob(models.Model):
+    """A queued document generation request, processed outside the request cycle."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    document_type = models.CharField(max_length=100)
+    title = models.CharField(max_length=200)
+    context = models.TextField()
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('queued', 'В очереди'),
+            ('running', 'Выполняется'),
+            ('done', 'Готово'),
+            ('failed', 'Ошибка')
+        ],
+        default='queued'
+    )
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker while the job runs; stops when the worker dies
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.status})"
+
+class DailyQuestionStats(models.Model):
+    """Questions of one day, category and status, rolled up by ``manage.py rollup_analytics``."""
+    day = models.DateField()
+    category = models.CharField(max_length=100)
+    status = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    # Latency of the questions with a processing_time
+    timed_count = models.PositiveIntegerField(default=0)
+    processing_time_sum = models.FloatField(default=0.0)
+    processing_time_max = models.FloatField(default=0.0)
+    # Counts per bound of analytics.LATENCY_BUCKETS, the last one for slower questions
+    latency_buckets = models.JSONField(default=list)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category', 'status'], name='daily_question_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category} {self.status}: {self.count}"
+
+class DailyTopQuestion(models.Model):
+    """How often a normalized question was asked on a day; only the top ones are kept for past days."""
+    day = models.DateField()
+    digest = models.CharField(max_length=64)
+    question = models.TextField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'digest'], name='daily_top_question_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'count']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.question[:50]}: {self.count}"
+
+class RollupState(models.Model):
+    """How far a rollup has got: the last row folded in and the last day pruned."""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    closed_until = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
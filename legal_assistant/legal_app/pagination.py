@@ -0,0 +1,37 @@
+# legal_app/pagination.py
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from django.core.exceptions import ValidationError
+from django.db.models import Model, Q, QuerySet
+
+
+def encode_cursor(obj: Model) -> str:
+    """Opaque cursor pointing just after ``obj`` in (-created_at, -id) order."""
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor from ``encode_cursor``; raises ValidationError when malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError("Invalid cursor.")
+
+
+def keyset_page(queryset: QuerySet, cursor: Optional[str], page_size: int) -> Tuple[List[Model], Optional[str]]:
+    """Return one page of ``queryset`` newest first, and the cursor of the next page.
+
+    Seeks with ``WHERE (created_at, id) < cursor`` instead of an OFFSET, so
+    every page costs the same index range scan however deep the history is.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    items = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(items[page_size - 1]) if len(items) > page_size else None
+    return items[:page_size], next_cursor
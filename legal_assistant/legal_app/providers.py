@@ -0,0 +1,320 @@
+# legal_app/providers.py
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .scheduler import UpstreamScheduler
+from .tokens import context_window, count_message_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = 'openai'
+# Tasks routed to a model of their own, and the setting naming it as "provider:model"
+TASK_MODEL_SETTINGS = {
+    'answer': 'LEGAL_AI_ANSWER_MODEL',
+    'category': 'LEGAL_AI_CATEGORY_MODEL',
+    'document': 'LEGAL_AI_DOCUMENT_MODEL',
+    'summary': 'LEGAL_AI_SUMMARY_MODEL',
+}
+
+
+def client_timeout():
+    """Default client timeout: explicit connect and read limits instead of the SDK's ten minutes."""
+    import httpx
+    return httpx.Timeout(
+        getattr(settings, 'LEGAL_AI_ANSWER_TIMEOUT', 60.0),
+        connect=getattr(settings, 'LEGAL_AI_CONNECT_TIMEOUT', 5.0),
+    )
+
+
+class Provider:
+    """A backend serving chat completions and embeddings in the OpenAI response format.
+
+    Responses have the SDK's shape (``choices[0].message.content``, ``usage``,
+    ``data[i].embedding``); with ``stream=True``, ``chat`` returns chunks
+    carrying ``choices[0].delta.content``. Each provider has its own
+    upstream scheduler, configured by ``concurrency``, ``requests_per_minute``
+    and ``tokens_per_minute`` in its ``LEGAL_AI_PROVIDERS`` entry.
+    """
+
+    # Whether the LEGAL_AI_UPSTREAM_RPM/TPM account limits apply by default
+    account_limits = False
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.config = config
+        self.concurrency = config.get('concurrency', getattr(settings, 'LEGAL_AI_UPSTREAM_CONCURRENCY', 8))
+        self.interactive_reserve = config.get(
+            'interactive_reserve', getattr(settings, 'LEGAL_AI_UPSTREAM_INTERACTIVE_RESERVE', 2)
+        )
+        self.requests_per_minute = config.get(
+            'requests_per_minute', getattr(settings, 'LEGAL_AI_UPSTREAM_RPM', 0) if self.account_limits else 0
+        )
+        self.tokens_per_minute = config.get(
+            'tokens_per_minute', getattr(settings, 'LEGAL_AI_UPSTREAM_TPM', 0) if self.account_limits else 0
+        )
+        self._scheduler: Optional[UpstreamScheduler] = None
+        self._lock = threading.Lock()
+
+    @property
+    def scheduler(self) -> Optional[UpstreamScheduler]:
+        """The provider's scheduler, or None when its ``concurrency`` is 0."""
+        if not self.concurrency:
+            return None
+        if self._scheduler is None:
+            with self._lock:
+                if self._scheduler is None:
+                    self._scheduler = UpstreamScheduler(
+                        self.concurrency, self.interactive_reserve,
+                        self.requests_per_minute, self.tokens_per_minute, name=self.name,
+                    )
+        return self._scheduler
+
+    def context_window(self, model: str) -> int:
+        return self.config.get('context_window') or context_window(model)
+
+    def chat(self, **kwargs) -> Any:
+        raise NotImplementedError
+
+    async def achat(self, **kwargs) -> Any:
+        raise NotImplementedError
+
+    def embeddings(self, **kwargs) -> Any:
+        raise NotImplementedError
+
+    async def aembeddings(self, **kwargs) -> Any:
+        raise NotImplementedError
+
+
+class OpenAIProvider(Provider):
+    """The OpenAI API through the official SDK, with a connection pool of its own.
+
+    The sync client is shared by all threads; async clients are kept per
+    event loop, since pooled connections cannot move between loops.
+    Retries are left to ``ResilientCaller``, which also knows about
+    fallback models.
+    """
+
+    account_limits = True
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        super().__init__(name, config)
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            'api_key': self.config.get('api_key') or settings.OPENAI_API_KEY,
+            'base_url': self.config.get('base_url') or getattr(settings, 'OPENAI_BASE_URL', None),
+            'max_retries': 0,
+            'timeout': client_timeout(),
+        }
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.config.get(
+                'max_connections', getattr(settings, 'LEGAL_AI_MAX_CONNECTIONS', 100)
+            ),
+            max_keepalive_connections=self.config.get(
+                'max_keepalive_connections', getattr(settings, 'LEGAL_AI_MAX_KEEPALIVE_CONNECTIONS', 20)
+            ),
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import OpenAI  # don't import OpenAI at module import time
+                    self._client = OpenAI(**self._client_options(), http_client=httpx.Client(limits=self._limits()))
+        return self._client
+
+    @property
+    def async_client(self):
+        """The AsyncOpenAI client (and its connection pool) shared on the running loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(**self._client_options(), http_client=httpx.AsyncClient(limits=self._limits()))
+            self._async_clients[loop] = client
+        return client
+
+    def chat(self, **kwargs) -> Any:
+        return self.client.chat.completions.create(**kwargs)
+
+    async def achat(self, **kwargs) -> Any:
+        return await self.async_client.chat.completions.create(**kwargs)
+
+    def embeddings(self, **kwargs) -> Any:
+        return self.client.embeddings.create(**kwargs)
+
+    async def aembeddings(self, **kwargs) -> Any:
+        return await self.async_client.embeddings.create(**kwargs)
+
+
+class OpenAICompatibleProvider(OpenAIProvider):
+    """A server speaking the OpenAI API, such as llama.cpp's server, vLLM or Ollama.
+
+    ``base_url`` is required and ``api_key`` optional. The account's rate
+    limits do not apply; ``concurrency`` should match the slots the
+    server runs in parallel.
+    """
+
+    account_limits = False
+
+    def _client_options(self) -> Dict[str, Any]:
+        if not self.config.get('base_url'):
+            raise ImproperlyConfigured(f"LLM provider {self.name!r} needs a base_url.")
+        return {
+            # The SDK insists on a key; local servers ignore it
+            'api_key': self.config.get('api_key') or 'local',
+            'base_url': self.config['base_url'],
+            'max_retries': 0,
+            'timeout': client_timeout(),
+        }
+
+
+_OPTIONS = re.compile(r"Reply with exactly one of: (.+?)\.?$", re.MULTILINE)
+
+
+class StubProvider(Provider):
+    """Deterministic in-process backend for tests and benchmarks: no network, no tokens billed.
+
+    Equal requests get equal replies. A prompt asking for one of a list of
+    options (the category) gets one of them, picked by a hash of the
+    question; other prompts get a short answer quoting the question.
+    Embeddings are hashed bags of words, so questions sharing words are
+    similar. ``latency`` seconds are spent per call.
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        super().__init__(name, config)
+        self.latency = config.get('latency', 0.0)
+        self.dimensions = config.get('dimensions', 256)
+
+    def _reply(self, messages: List[Dict[str, str]]) -> str:
+        question = messages[-1]['content']
+        digest = int(hashlib.sha1(question.encode('utf-8')).hexdigest(), 16)
+        options = _OPTIONS.search(messages[0]['content'])
+        if options:
+            choices = [option.strip() for option in options.group(1).split(',')]
+            return choices[digest % len(choices)]
+        return (
+            f"По вопросу «{question[:200]}» следует руководствоваться Гражданским кодексом РФ. "
+            f"Рекомендуется обратиться к юристу. [{digest % 10000:04d}]"
+        )
+
+    def _completion(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Any:
+        reply = self._reply(messages)
+        if stream:
+            return self._chunks(reply)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(role='assistant', content=reply), finish_reason='stop')],
+            usage=SimpleNamespace(
+                prompt_tokens=count_message_tokens(messages, model),
+                completion_tokens=count_tokens(reply, model),
+            ),
+        )
+
+    def _chunks(self, reply: str) -> Iterator[Any]:
+        for word in reply.split(' '):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + ' '))])
+
+    def _embeddings(self, model: str, input, **kwargs) -> Any:
+        texts = [input] if isinstance(input, str) else input
+        data = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in text.split():
+                vector[int(hashlib.sha1(word.encode('utf-8')).hexdigest(), 16) % self.dimensions] += 1.0
+            data.append(SimpleNamespace(embedding=vector))
+        return SimpleNamespace(model=model, data=data, usage=None)
+
+    def chat(self, **kwargs) -> Any:
+        time.sleep(self.latency)
+        return self._completion(**kwargs)
+
+    async def achat(self, **kwargs) -> Any:
+        await asyncio.sleep(self.latency)
+        return self._completion(**kwargs)
+
+    def embeddings(self, **kwargs) -> Any:
+        time.sleep(self.latency)
+        return self._embeddings(**kwargs)
+
+    async def aembeddings(self, **kwargs) -> Any:
+        await asyncio.sleep(self.latency)
+        return self._embeddings(**kwargs)
+
+
+BACKENDS = {
+    'openai': OpenAIProvider,
+    'openai_compatible': OpenAICompatibleProvider,
+    'stub': StubProvider,
+}
+
+_providers: Dict[str, Provider] = {}
+_providers_lock = threading.Lock()
+
+
+def provider_configs() -> Dict[str, Dict[str, Any]]:
+    configs = dict(getattr(settings, 'LEGAL_AI_PROVIDERS', None) or {})
+    configs.setdefault(DEFAULT_PROVIDER, {'backend': 'openai'})
+    return configs
+
+
+def split_model(spec: str) -> Tuple[str, str]:
+    """``"local:qwen2.5-3b"`` -> ``("local", "qwen2.5-3b")``; a bare model name is an OpenAI model."""
+    name, separator, model = spec.partition(':')
+    if separator and name in provider_configs():
+        return name, model
+    return DEFAULT_PROVIDER, spec
+
+
+def get_provider(name: str) -> Provider:
+    """Return the process-wide provider named in ``LEGAL_AI_PROVIDERS``."""
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            config = provider_configs().get(name)
+            if config is None:
+                raise ImproperlyConfigured(f"Unknown LLM provider {name!r}.")
+            backend = BACKENDS.get(config.get('backend', 'openai'))
+            if backend is None:
+                raise ImproperlyConfigured(f"Unknown backend {config.get('backend')!r} of LLM provider {name!r}.")
+            provider = _providers[name] = backend(name, config)
+        return provider
+
+
+def resolve(spec: str) -> Tuple[Provider, str]:
+    """The provider serving a ``provider:model`` spec and the model name to send it."""
+    name, model = split_model(spec)
+    return get_provider(name), model
+
+
+def task_model(task: str) -> str:
+    """The ``provider:model`` spec ``task`` is routed to."""
+    return getattr(settings, TASK_MODEL_SETTINGS[task], None) or 'gpt-4'
+
+
+def model_context_window(spec: str) -> int:
+    provider, model = resolve(spec)
+    return provider.context_window(model)
+
+
+def reset_providers():
+    """Drop the providers (and their pools and schedulers) so that they pick up new settings."""
+    with _providers_lock:
+        _providers.clear()
@@ -0,0 +1,208 @@
+# legal_app/rendering.py
+import copy
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import BinaryIO, Iterable, Optional
+from django.conf import settings
+from docx import Document as DocxDocument
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.part import Part, XmlPart
+from docx.oxml.ns import qn
+from .response_cache import stable_digest
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_CONTENT_TYPE = 'application/pdf'
+
+# Bump when the rendered output changes so content hashes (and file names) change too
+RENDERER_VERSION = '2'
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+•]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)\d+[.)]\s+\S")
+_RULE_RE = re.compile(r"^\s*(?:-{3,}|\*{3,})\s*$")
+# Parts renders only read; headers, footers and the rest stay live XML
+_FROZEN_RELTYPES = frozenset({RT.STYLES, RT.SETTINGS, RT.NUMBERING})
+# **bold** and *italic*; underscores are left alone, templates use them for blanks to fill in
+_INLINE_RE = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|\*(?=\S)(.+?)(?<=\S)\*")
+
+
+def content_hash(title: str, content: str) -> str:
+    """Content address of the .docx rendered from ``title`` and ``content``."""
+    return stable_digest(RENDERER_VERSION, title, content, getattr(settings, 'DOCUMENT_DOCX_TEMPLATE', None) or '')
+
+
+class BaseTemplate:
+    """The base .docx (branded styles, page setup, headers) loaded once per process.
+
+    The file is parsed and its body emptied once; each render deep-copies
+    the parsed document, which is much faster than parsing the
+    package again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        document = DocxDocument(path)
+        body = document.element.body
+        for child in list(body):
+            # Keep only the section properties (page size, margins, headers and footers)
+            if child.tag != qn('w:sectPr'):
+                body.remove(child)
+        # Looking styles up by name scans all of them; it is done here once, not per paragraph
+        self.style_ids = {
+            style.name: style.style_id for style in document.styles if style.type == WD_STYLE_TYPE.PARAGRAPH
+        }
+        self._freeze_parts(document)
+        self._prototype = document
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _freeze_parts(document):
+        """Replace the parsed styles, settings and numbering parts with their serialized bytes.
+
+        Renders never modify them, so they are neither deep-copied nor
+        serialized again on every save.
+        """
+        for rel in document.part.rels.values():
+            if rel.reltype not in _FROZEN_RELTYPES or rel.is_external:
+                continue
+            target = getattr(rel, '_target', None)
+            if isinstance(target, XmlPart):
+                rel._target = Part(target.partname, target.content_type, target.blob, target.package)
+
+    def new_document(self):
+        prototype = getattr(self._local, 'prototype', None)
+        if prototype is None:
+            # lxml trees are not shared between threads, so each gets its own copy
+            with self._lock:
+                prototype = self._local.prototype = copy.deepcopy(self._prototype)
+        return copy.deepcopy(prototype)
+
+    def add_paragraph(self, document, style: Optional[str] = None):
+        """Add a paragraph in the named style, or Normal if the template lacks it."""
+        paragraph = document.add_paragraph()
+        style_id = self.style_ids.get(style)
+        if style_id is not None:
+            paragraph._p.style = style_id
+        return paragraph
+
+
+_base_template = None
+_base_template_lock = threading.Lock()
+
+
+def get_base_template() -> BaseTemplate:
+    """Return the process-wide base template (``DOCUMENT_DOCX_TEMPLATE`` or python-docx's default)."""
+    global _base_template
+    if _base_template is None:
+        with _base_template_lock:
+            if _base_template is None:
+                _base_template = BaseTemplate(getattr(settings, 'DOCUMENT_DOCX_TEMPLATE', None))
+    return _base_template
+
+
+def add_inline_markdown(paragraph, text: str):
+    """Append ``text`` to ``paragraph`` as runs, turning **bold** and *italic* into formatting."""
+    position = 0
+    for match in _INLINE_RE.finditer(text):
+        if match.start() > position:
+            paragraph.add_run(text[position:match.start()])
+        bold, italic = match.groups()
+        run = paragraph.add_run(bold if bold is not None else italic)
+        if bold is not None:
+            run.bold = True
+        else:
+            run.italic = True
+        position = match.end()
+    if position < len(text):
+        paragraph.add_run(text[position:])
+
+
+def _add_markdown(document, template: BaseTemplate, lines: Iterable[str]):
+    """Add markdown ``lines`` in a single pass: headings, lists, bold and italic.
+
+    Numbered items keep their own numbers under the ``List`` style: Word's
+    ``List Number`` would continue counting across separate lists.
+    """
+    previous_blank = True
+    for line in lines:
+        line = line.rstrip()
+        if not line.strip() or _RULE_RE.match(line):
+            # Runs of blank lines collapse into one empty paragraph
+            if not previous_blank:
+                template.add_paragraph(document)
+            previous_blank = True
+            continue
+        previous_blank = False
+
+        heading = _HEADING_RE.match(line)
+        if heading:
+            level = len(heading.group(1))
+            paragraph = template.add_paragraph(document, f'Heading {level}')
+            add_inline_markdown(paragraph, heading.group(2))
+            # Headings have their own spacing; no empty paragraph after them
+            previous_blank = True
+            continue
+
+        bullet = _BULLET_RE.match(line)
+        if bullet:
+            depth = min(3, len(bullet.group(1).expandtabs(4)) // 2 + 1)
+            style = 'List Bullet' if depth == 1 else f'List Bullet {depth}'
+            paragraph = template.add_paragraph(document, style)
+            # Without the bullet style the marker stays in the text
+            add_inline_markdown(paragraph, bullet.group(2) if style in template.style_ids else line.strip())
+            continue
+
+        if _NUMBERED_RE.match(line):
+            paragraph = template.add_paragraph(document, 'List')
+            add_inline_markdown(paragraph, line.strip())
+            continue
+
+        add_inline_markdown(template.add_paragraph(document), line)
+
+
+def render_docx(title: str, content: str, stream: BinaryIO):
+    """Render generated markdown as a .docx file on the base template into ``stream``."""
+    template = get_base_template()
+    document = template.new_document()
+    document.core_properties.title = title
+    template.add_paragraph(document, 'Title').add_run(title)
+    _add_markdown(document, template, content.splitlines())
+    document.save(stream)
+
+
+def pdf_converter() -> Optional[str]:
+    """Path of the LibreOffice binary used for PDF export, or None if there is none."""
+    configured = getattr(settings, 'DOCUMENT_PDF_CONVERTER', None)
+    if configured:
+        return shutil.which(configured)
+    return shutil.which('soffice') or shutil.which('libreoffice')
+
+
+def convert_to_pdf(docx: bytes) -> bytes:
+    """Convert a .docx to PDF with a local LibreOffice (``soffice --headless``)."""
+    converter = pdf_converter()
+    if converter is None:
+        raise RuntimeError("No PDF converter (LibreOffice) is installed.")
+    with tempfile.TemporaryDirectory(prefix='legal-pdf-') as workdir:
+        source = os.path.join(workdir, 'document.docx')
+        with open(source, 'wb') as f:
+            f.write(docx)
+        subprocess.run(
+            [
+                converter,
+                # A private profile lets conversions run in parallel
+                f"-env:UserInstallation=file://{workdir}/profile",
+                '--headless', '--convert-to', 'pdf', '--outdir', workdir, source,
+            ],
+            check=True,
+            capture_output=True,
+            timeout=getattr(settings, 'DOCUMENT_PDF_TIMEOUT', 60),
+        )
+        with open(os.path.join(workdir, 'document.pdf'), 'rb') as f:
+            return f.read()
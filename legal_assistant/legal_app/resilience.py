@@ -0,0 +1,341 @@
+# legal_app/resilience.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, nullcontext
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+from django.conf import settings
+from .metrics import REGISTRY, upstream_call
+from .providers import resolve
+from .scheduler import SchedulerTimeout, request_cost
+
+try:
+    from openai import APIConnectionError, APIStatusError  # type: ignore
+except Exception:
+    APIConnectionError = APIStatusError = ()  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+RETRIES = REGISTRY.counter("legal_upstream_retries_total", "OpenAI calls retried", ("kind",))
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "legal_upstream_circuit_rejections_total", "OpenAI calls refused by an open circuit", ("model",),
+)
+FALLBACKS = REGISTRY.counter("legal_upstream_fallbacks_total", "Calls answered by a fallback model", ("model",))
+STALE_RESPONSES = REGISTRY.counter(
+    "legal_stale_responses_total", "Expired cached answers served because OpenAI failed", ("kind",),
+)
+
+
+class CircuitOpenError(Exception):
+    """Every model in the chain is failing; the call was not attempted."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and connection failures are worth retrying."""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, (APIConnectionError, TimeoutError, ConnectionError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from the Retry-After header of a 429/503 response, if any."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Fail fast after ``failure_threshold`` consecutive failures.
+
+    The circuit stays open for ``recovery_timeout`` seconds, then lets a
+    single trial call through (half-open): success closes it again, failure
+    reopens it. State is per process.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.recovery_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed.")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """End a trial call that neither succeeded nor failed (it never reached the upstream, or was cancelled)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures.")
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide breaker for an upstream model."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=getattr(settings, 'LEGAL_AI_CIRCUIT_FAILURE_THRESHOLD', 5),
+                recovery_timeout=getattr(settings, 'LEGAL_AI_CIRCUIT_RECOVERY_TIMEOUT', 30),
+            )
+        return breaker
+
+
+class HeldStream:
+    """Iterate over a streamed response, keeping its scheduler slot until the stream is exhausted or closed."""
+
+    def __init__(self, stream, held: ExitStack):
+        self._held: Optional[ExitStack] = held
+        self._stream = stream
+        self._iterator = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        held, self._held = self._held, None
+        if held is not None:
+            try:
+                close = getattr(self._stream, 'close', None)
+                if close is not None:
+                    close()
+            finally:
+                held.close()
+
+
+class ResilientCaller:
+    """Run an LLM call with retries, a circuit breaker per model and fallback models.
+
+    The request's ``timeout`` is a budget for the whole call, retries
+    included: each attempt gets the remaining time as its read timeout and
+    ``LEGAL_AI_CONNECT_TIMEOUT`` to connect. Retryable errors are retried
+    with full-jitter exponential backoff (or the server's Retry-After);
+    other errors, such as a bad request, are raised at once. When a model
+    keeps failing or its circuit is open, the next of ``fallback_models``
+    is tried. Models are ``provider:model`` specs (see ``providers``), so a
+    local model can fall back to OpenAI. Each attempt waits for a slot of
+    its provider's scheduler (not held during backoff) and is timed by
+    ``metrics.upstream_call``; a streamed response can keep that slot until
+    the stream ends.
+    """
+
+    def __init__(self, max_retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, deadline: Optional[float] = None,
+                 connect_timeout: Optional[float] = None, fallback_models: Optional[Sequence[str]] = None):
+        self.max_retries = getattr(settings, 'LEGAL_AI_MAX_RETRIES', 2) if max_retries is None else max_retries
+        self.base_delay = base_delay or getattr(settings, 'LEGAL_AI_RETRY_BASE_DELAY', 0.5)
+        self.max_delay = max_delay or getattr(settings, 'LEGAL_AI_RETRY_MAX_DELAY', 8.0)
+        self.deadline = deadline or getattr(settings, 'LEGAL_AI_RETRY_DEADLINE', 120.0)
+        self.connect_timeout = connect_timeout or getattr(settings, 'LEGAL_AI_CONNECT_TIMEOUT', 5.0)
+        self.fallback_models = list(
+            getattr(settings, 'LEGAL_AI_FALLBACK_MODELS', []) if fallback_models is None else fallback_models
+        )
+
+    def _attempts(self, kwargs: Dict[str, Any], fallback: bool) -> Iterator[Tuple[str, int]]:
+        """(model, attempt) pairs in the order they may be tried."""
+        models = [kwargs['model']]
+        if fallback:
+            models += [model for model in self.fallback_models if model not in models]
+        for model in models:
+            for attempt in range(self.max_retries + 1):
+                yield model, attempt
+
+    def _attempt_kwargs(self, kwargs: Dict[str, Any], model: str, deadline: float) -> Dict[str, Any]:
+        """``kwargs`` for one attempt, with the provider's model name and the remaining time."""
+        import httpx
+        remaining = max(0.1, deadline - time.monotonic())
+        timeout = httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining))
+        return {**kwargs, 'model': model, 'timeout': timeout}
+
+    def slot(self, kind: str, kwargs: Dict[str, Any], deadline: Optional[float] = None):
+        """Context manager holding a slot of the scheduler of ``kwargs['model']``'s provider."""
+        provider, model = resolve(kwargs['model'])
+        scheduler = provider.scheduler
+        if scheduler is None:
+            return nullcontext()
+        timeout = None if deadline is None else deadline - time.monotonic()
+        return scheduler.slot(kind, request_cost({**kwargs, 'model': model}), timeout)
+
+    def aslot(self, kind: str, kwargs: Dict[str, Any], deadline: Optional[float] = None):
+        """Async version of ``slot``."""
+        provider, model = resolve(kwargs['model'])
+        scheduler = provider.scheduler
+        if scheduler is None:
+            return nullcontext()
+        timeout = None if deadline is None else deadline - time.monotonic()
+        return scheduler.aslot(kind, request_cost({**kwargs, 'model': model}), timeout)
+
+    def _failed(self, kind: str, model: str, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """Record a failed attempt; return the delay before retrying ``model``, or None to move on."""
+        if not is_retryable(error):
+            # The request itself is at fault, not the upstream
+            get_circuit_breaker(model).record_success()
+            raise error
+        get_circuit_breaker(model).record_failure()
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = min(retry_after, self.max_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if attempt == self.max_retries or time.monotonic() + delay >= deadline:
+            logger.warning(f"Upstream {kind} call to {model} failed ({error!r}), giving up on {model}.")
+            return None
+        RETRIES.inc(kind=kind)
+        logger.warning(f"Upstream {kind} call to {model} failed ({error!r}), retrying in {delay:.2f}s.")
+        return delay
+
+    def _succeeded(self, kind: str, model: str, requested: str):
+        get_circuit_breaker(model).record_success()
+        if model != requested:
+            FALLBACKS.inc(model=model)
+            logger.warning(f"Upstream {kind} call answered by fallback model {model}.")
+
+    def call(self, kind: str, endpoint: str, kwargs: Dict[str, Any], fallback: bool = True,
+             schedule: bool = True, hold: bool = False) -> Any:
+        """Return ``provider.<endpoint>(**kwargs)`` (``chat`` or ``embeddings``) from the provider of ``kwargs['model']``.
+
+        With ``fallback`` the model may be replaced. Pass ``schedule=False``
+        when the caller already holds a slot (see ``slot``). With ``hold``
+        (for ``stream=True``) the slot of the model that answered is kept
+        until the returned ``HeldStream`` is exhausted or closed.
+        """
+        deadline = time.monotonic() + (kwargs.get('timeout') or self.deadline)
+        last_error: Optional[Exception] = None
+        skip = None
+        for model, attempt in self._attempts(kwargs, fallback):
+            if model == skip or time.monotonic() >= deadline:
+                continue
+            breaker = get_circuit_breaker(model)
+            if not breaker.allow():
+                CIRCUIT_REJECTIONS.inc(model=model)
+                skip = model
+                continue
+            provider, provider_model = resolve(model)
+            try:
+                with ExitStack() as held:
+                    if schedule:
+                        held.enter_context(self.slot(kind, {**kwargs, 'model': model}, deadline))
+                    with upstream_call(kind, provider.name) as call:
+                        create = getattr(provider, endpoint)
+                        response = create(**self._attempt_kwargs(kwargs, provider_model, deadline))
+                        call.record_usage(response)
+                    if hold:
+                        response = HeldStream(response, held.pop_all())
+            except SchedulerTimeout:
+                breaker.release_trial()
+                raise
+            except Exception as e:
+                last_error = e
+                delay = self._failed(kind, model, attempt, e, deadline)
+                if delay is None:
+                    skip = model
+                else:
+                    time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: a half-open trial must not stay in flight forever
+                breaker.release_trial()
+                raise
+            self._succeeded(kind, model, kwargs['model'])
+            return response
+        raise last_error or CircuitOpenError(f"Upstream circuit open for {kwargs['model']}")
+
+    async def acall(self, kind: str, endpoint: str, kwargs: Dict[str, Any],
+                    fallback: bool = True, schedule: bool = True) -> Any:
+        """Async version of ``call``."""
+        deadline = time.monotonic() + (kwargs.get('timeout') or self.deadline)
+        last_error: Optional[Exception] = None
+        skip = None
+        for model, attempt in self._attempts(kwargs, fallback):
+            if model == skip or time.monotonic() >= deadline:
+                continue
+            breaker = get_circuit_breaker(model)
+            if not breaker.allow():
+                CIRCUIT_REJECTIONS.inc(model=model)
+                skip = model
+                continue
+            provider, provider_model = resolve(model)
+            try:
+                async with self.aslot(kind, {**kwargs, 'model': model}, deadline) if schedule else nullcontext():
+                    with upstream_call(kind, provider.name) as call:
+                        create = getattr(provider, f"a{endpoint}")
+                        response = await create(**self._attempt_kwargs(kwargs, provider_model, deadline))
+                        call.record_usage(response)
+            except SchedulerTimeout:
+                breaker.release_trial()
+                raise
+            except Exception as e:
+                last_error = e
+                delay = self._failed(kind, model, attempt, e, deadline)
+                if delay is None:
+                    skip = model
+                else:
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: a half-open trial must not stay in flight forever
+                breaker.release_trial()
+                raise
+            self._succeeded(kind, model, kwargs['model'])
+            return response
+        raise last_error or CircuitOpenError(f"Upstream circuit open for {kwargs['model']}")
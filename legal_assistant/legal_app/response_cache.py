@@ -0,0 +1,86 @@
+# legal_app/response_cache.py
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def stable_digest(*parts: str) -> str:
+    """SHA-256 hex digest of ``parts``; unlike ``hash()`` it is stable across processes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_cache_key(namespace: str, *parts: str, model: str) -> str:
+    """Build a deterministic cache key from already normalized ``parts``.
+
+    The model and ``LEGAL_AI_PROMPT_VERSION`` are part of the key so that
+    changing either invalidates old entries.
+    """
+    prompt_version = str(getattr(settings, 'LEGAL_AI_PROMPT_VERSION', '1'))
+    return f"{namespace}:{stable_digest(model, prompt_version, *parts)}"
+
+
+class ResponseCache:
+    """LLM response cache on a configurable (shared) Django cache backend.
+
+    Hits and misses are counted in this process only: counting them in the
+    backend would cost two more round trips per lookup, and the file-based
+    backend's ``incr`` loses updates between workers. Sum the workers'
+    ``legal_cache_lookups_total`` for the overall ratio.
+    """
+
+    def __init__(self, alias: Optional[str] = None, timeout: Optional[int] = None):
+        self.alias = alias or getattr(settings, 'LEGAL_AI_CACHE_ALIAS', 'default')
+        self.timeout = timeout if timeout is not None else getattr(settings, 'LEGAL_AI_CACHE_TIMEOUT', 3600)
+        self._hits = 0
+        self._misses = 0
+        self._counter_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for ``key`` or None, recording a hit or miss."""
+        value = self.backend.get(key)
+        with self._counter_lock:
+            if value is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+        return value
+
+    def peek(self, key: str) -> Any:
+        """Return the cached value for ``key`` without counting a hit or miss."""
+        return self.backend.get(key)
+
+    def peek_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Return the cached entries among ``keys`` in one round trip, without counting."""
+        return self.backend.get_many(keys)
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None):
+        """Store ``value`` under ``key``."""
+        self.backend.set(key, value, self.timeout if timeout is None else timeout)
+
+    def set_many(self, values: Dict[str, Any], timeout: Optional[int] = None):
+        """Store several entries in one backend round trip."""
+        self.backend.set_many(values, self.timeout if timeout is None else timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the hit/miss counters of this process."""
+        with self._counter_lock:
+            hits, misses = self._hits, self._misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
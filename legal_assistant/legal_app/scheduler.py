@@ -0,0 +1,297 @@
+# legal_app/scheduler.py
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional
+from django.conf import settings
+from .metrics import REGISTRY
+from .tokens import count_message_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, BACKGROUND)  # served in this order
+# Upstream call kinds nobody is waiting on in the browser
+BACKGROUND_KINDS = frozenset({'document', 'document_section', 'summary'})
+
+QUEUE_DEPTH = REGISTRY.gauge(
+    "legal_scheduler_queue_depth", "Upstream calls waiting for a slot", ("provider", "priority"),
+)
+ACTIVE_CALLS = REGISTRY.gauge("legal_scheduler_active_calls", "Upstream calls holding a slot", ("provider", "priority"))
+WAIT_SECONDS = REGISTRY.histogram(
+    "legal_scheduler_wait_seconds", "Time upstream calls waited for a slot", ("provider", "priority"),
+)
+TIMEOUTS = REGISTRY.counter(
+    "legal_scheduler_timeouts_total", "Upstream calls that gave up waiting for a slot", ("provider", "priority"),
+)
+
+_current_user = contextvars.ContextVar('legal_scheduler_user', default=None)
+_current_priority = contextvars.ContextVar('legal_scheduler_priority', default=None)
+
+
+class SchedulerTimeout(Exception):
+    """An upstream call waited longer than its budget for a slot."""
+
+
+class RateBudget:
+    """Client-side token buckets for requests and tokens per minute.
+
+    ``acquire`` blocks until both buckets can pay for a call, keeping a batch
+    under the account's limits instead of running into 429 responses.
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.limits = (requests_per_minute, tokens_per_minute)
+        self.available = [float(requests_per_minute), float(tokens_per_minute)]
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        for i, limit in enumerate(self.limits):
+            self.available[i] = min(limit, self.available[i] + elapsed * limit / 60)
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Pay for a call if both buckets allow it (returning 0), else return the seconds to wait."""
+        # A call bigger than the whole bucket would wait forever; let it drain the bucket
+        cost = (1, min(tokens, self.limits[1]))
+        with self._lock:
+            self._refill()
+            wait = 0.0
+            for i, limit in enumerate(self.limits):
+                if limit and self.available[i] < cost[i]:
+                    wait = max(wait, (cost[i] - self.available[i]) * 60 / limit)
+            if wait == 0:
+                for i, limit in enumerate(self.limits):
+                    if limit:
+                        self.available[i] -= cost[i]
+            return wait
+
+    def acquire(self, tokens: int = 0):
+        while True:
+            wait = self.reserve(tokens)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+
+def request_cost(kwargs: Dict[str, Any]) -> int:
+    """Tokens OpenAI's rate limiter charges for a request: the prompt plus ``max_tokens``."""
+    model = kwargs.get('model', 'gpt-4')
+    if 'messages' in kwargs:
+        return count_message_tokens(kwargs['messages'], model) + (kwargs.get('max_tokens') or 0)
+    inputs = kwargs.get('input') or []
+    return sum(count_tokens(text, model) for text in ([inputs] if isinstance(inputs, str) else inputs))
+
+
+def current_priority(kind: Optional[str] = None) -> str:
+    """Priority of the caller's upstream calls: the one ``scheduling`` set, else by ``kind``."""
+    return _current_priority.get() or (BACKGROUND if kind in BACKGROUND_KINDS else INTERACTIVE)
+
+
+@contextmanager
+def scheduling(user: Any = None, priority: Optional[str] = None):
+    """Attribute the upstream calls made in the block to ``user`` and, if given, ``priority``.
+
+    Without a priority, document calls are background and everything else
+    interactive; batches pass ``BACKGROUND`` for their answers.
+    """
+    user_token = _current_user.set(getattr(user, 'pk', user))
+    priority_token = _current_priority.set(priority) if priority is not None else None
+    try:
+        yield
+    finally:
+        if priority_token is not None:
+            _current_priority.reset(priority_token)
+        _current_user.reset(user_token)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Ticket:
+    """A call waiting for, then holding, a slot."""
+
+    __slots__ = ('user', 'priority', 'cost', 'enqueued', 'granted', 'event', 'loop', 'future')
+
+    def __init__(self, user, priority: str, cost: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.user, self.priority, self.cost = user, priority, cost
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+class UpstreamScheduler:
+    """Admission control in front of the calls of this process to one LLM provider.
+
+    At most ``concurrency`` calls run at once, and the calls started stay
+    within ``requests_per_minute`` and ``tokens_per_minute``, where tokens
+    are the prompt plus ``max_tokens``, the amount OpenAI's limiter charges.
+    Waiting calls are served interactive first, then background. Within
+    each class, users take turns, one call each, so one user's burst of
+    documents does not hold up the others. ``interactive_reserve`` slots are
+    never given to background calls, so a chat arriving while documents are
+    being written does not wait for one of them to finish.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, interactive_reserve: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, name: str = 'openai'):
+        self.name = name
+        self.concurrency = max(1, concurrency or getattr(settings, 'LEGAL_AI_UPSTREAM_CONCURRENCY', 8))
+        reserve = getattr(settings, 'LEGAL_AI_UPSTREAM_INTERACTIVE_RESERVE', 2) if interactive_reserve is None \
+            else interactive_reserve
+        self.interactive_reserve = max(0, min(self.concurrency - 1, reserve))
+        self.budget = RateBudget(
+            getattr(settings, 'LEGAL_AI_UPSTREAM_RPM', 0) if requests_per_minute is None else requests_per_minute,
+            getattr(settings, 'LEGAL_AI_UPSTREAM_TPM', 0) if tokens_per_minute is None else tokens_per_minute,
+        )
+        self.queue_timeout = queue_timeout or getattr(settings, 'LEGAL_AI_UPSTREAM_QUEUE_TIMEOUT', 30.0)
+        # Per priority: user -> that user's waiting tickets, in round-robin order
+        self._queues: Dict[str, OrderedDict] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._active = {priority: 0 for priority in PRIORITIES}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def _ticket(self, kind: str, cost: int, loop=None) -> _Ticket:
+        return _Ticket(_current_user.get(), current_priority(kind), cost, loop)
+
+    def _enqueue(self, ticket: _Ticket):
+        self._queues[ticket.priority].setdefault(ticket.user, deque()).append(ticket)
+        QUEUE_DEPTH.inc(provider=self.name, priority=ticket.priority)
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues[ticket.priority]
+        tickets = queue[ticket.user]
+        tickets.remove(ticket)
+        if not tickets:
+            del queue[ticket.user]
+        QUEUE_DEPTH.dec(provider=self.name, priority=ticket.priority)
+
+    def _next(self) -> Optional[_Ticket]:
+        """The ticket to serve next, if a slot is free for it."""
+        active = sum(self._active.values())
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            limit = self.concurrency if priority == INTERACTIVE else self.concurrency - self.interactive_reserve
+            if queue and active < limit:
+                return queue[next(iter(queue))][0]
+        return None
+
+    def _dispatch(self):
+        """Grant slots while there are free ones and the rate budget allows; called with the lock held."""
+        while True:
+            ticket = self._next()
+            if ticket is None:
+                return
+            wait = self.budget.reserve(ticket.cost)
+            if wait:
+                # Nothing else will release a slot; retry when the buckets have refilled
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._retry)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            queue = self._queues[ticket.priority]
+            queue[ticket.user].popleft()
+            if queue[ticket.user]:
+                queue.move_to_end(ticket.user)
+            else:
+                del queue[ticket.user]
+            QUEUE_DEPTH.dec(provider=self.name, priority=ticket.priority)
+            self._active[ticket.priority] += 1
+            ACTIVE_CALLS.inc(provider=self.name, priority=ticket.priority)
+            WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued, provider=self.name, priority=ticket.priority)
+            ticket.grant()
+
+    def _retry(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _give_up(self, ticket: _Ticket) -> bool:
+        """Withdraw a ticket that stopped waiting; False if it was granted meanwhile."""
+        with self._lock:
+            if ticket.granted:
+                return False
+            self._remove(ticket)
+        return True
+
+    def _timed_out(self, ticket: _Ticket, kind: str) -> SchedulerTimeout:
+        TIMEOUTS.inc(provider=self.name, priority=ticket.priority)
+        waited = time.monotonic() - ticket.enqueued
+        logger.warning(f"Upstream {kind} call to {self.name} waited {waited:.1f}s for a slot, giving up.")
+        return SchedulerTimeout(f"No upstream slot for {kind} within {waited:.1f}s")
+
+    def _wait_timeout(self, timeout: Optional[float]) -> float:
+        return max(0.0, self.queue_timeout if timeout is None else min(timeout, self.queue_timeout))
+
+    def acquire(self, kind: str, cost: int, timeout: Optional[float] = None) -> _Ticket:
+        """Wait for a slot; raise ``SchedulerTimeout`` after ``timeout`` (at most the queue timeout)."""
+        ticket = self._ticket(kind, cost)
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        if not ticket.event.wait(self._wait_timeout(timeout)) and self._give_up(ticket):
+            raise self._timed_out(ticket, kind)
+        return ticket
+
+    async def aacquire(self, kind: str, cost: int, timeout: Optional[float] = None) -> _Ticket:
+        """Async version of ``acquire``."""
+        ticket = self._ticket(kind, cost, asyncio.get_running_loop())
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self._wait_timeout(timeout))
+        except asyncio.TimeoutError:
+            if self._give_up(ticket):
+                raise self._timed_out(ticket, kind)
+        except asyncio.CancelledError:
+            if not self._give_up(ticket):
+                self.release(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        with self._lock:
+            self._active[ticket.priority] -= 1
+            ACTIVE_CALLS.dec(provider=self.name, priority=ticket.priority)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, kind: str, cost: int, timeout: Optional[float] = None):
+        """Hold a slot for the ``with`` block."""
+        ticket = self.acquire(kind, cost, timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, kind: str, cost: int, timeout: Optional[float] = None):
+        """Async version of ``slot``."""
+        ticket = await self.aacquire(kind, cost, timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
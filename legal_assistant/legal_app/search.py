@@ -0,0 +1,191 @@
+# legal_app/search.py
+import logging
+from typing import Iterable, List, Optional, Sequence, Tuple
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.db.models.expressions import RawSQL
+from .models import Document, LegalQuestion
+from .text import tokenize
+
+logger = logging.getLogger(__name__)
+
+# SQLite FTS5 tables keyed by the model's primary key (rowid). They hold
+# stemmed tokens from ``text.tokenize`` rather than raw text, so Russian word
+# forms of the same stem match each other; FTS5's own tokenizer then only
+# splits on spaces.
+QUESTION_FTS_TABLE = "legal_app_question_fts"
+DOCUMENT_FTS_TABLE = "legal_app_document_fts"
+
+# Relative weight of each indexed column in the bm25 ranking
+QUESTION_WEIGHTS = (3.0, 1.0, 0.5)  # question, answer, category
+DOCUMENT_WEIGHTS = (3.0, 1.0)  # title, content
+
+CREATE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {QUESTION_FTS_TABLE} "
+    f"USING fts5(question, answer, category, user_id UNINDEXED, tokenize='unicode61')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {DOCUMENT_FTS_TABLE} "
+    f"USING fts5(title, content, user_id UNINDEXED, tokenize='unicode61')",
+]
+DROP_FTS_SQL = [
+    f"DROP TABLE IF EXISTS {QUESTION_FTS_TABLE}",
+    f"DROP TABLE IF EXISTS {DOCUMENT_FTS_TABLE}",
+]
+
+
+def is_available() -> bool:
+    """The index exists on SQLite only; other databases fall back to LIKE scans."""
+    return connection.vendor == 'sqlite'
+
+
+def _terms(text: str) -> str:
+    return " ".join(tokenize(text or ""))
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn user input into an FTS5 MATCH expression: every stem, as a prefix."""
+    stems = tokenize(query)
+    if not stems:
+        return None
+    return " ".join(f'"{stem}"*' for stem in stems)
+
+
+def index_questions(questions: Iterable[LegalQuestion]):
+    """Add or refresh questions in the index (for ``bulk_create`` and backfills)."""
+    if not is_available():
+        return
+    rows = [
+        (q.id, _terms(q.question), _terms(q.answer), _terms(q.category), q.user_id)
+        for q in questions
+    ]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {QUESTION_FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {QUESTION_FTS_TABLE} (rowid, question, answer, category, user_id) "
+            f"VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def index_documents(documents: Iterable[Document]):
+    """Add or refresh documents in the index."""
+    if not is_available():
+        return
+    rows = [(d.id, _terms(d.title), _terms(d.content), d.user_id) for d in documents]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {DOCUMENT_FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {DOCUMENT_FTS_TABLE} (rowid, title, content, user_id) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def unindex(table: str, pk: int):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [pk])
+
+
+def _ranked_ids(table: str, weights: Tuple[float, ...], match: str,
+                user_id: Optional[int], limit: int, offset: int) -> List[Tuple[int, float]]:
+    sql = f"SELECT rowid, bm25({table}, {', '.join(map(str, weights))}) AS score FROM {table} WHERE {table} MATCH %s"
+    params: list = [match]
+    if user_id is not None:
+        sql += " AND user_id = %s"
+        params.append(user_id)
+    sql += " ORDER BY score LIMIT %s OFFSET %s"
+    params += [limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search(model, table: str, weights, fallback_fields, query: str,
+            user=None, limit: int = 20, offset: int = 0) -> list:
+    """Best matches first, each with a ``search_rank`` attribute (lower is better)."""
+    queryset = model.objects.all()
+    if user is not None:
+        queryset = queryset.filter(user=user)
+
+    if not is_available():
+        condition = Q()
+        for field in fallback_fields:
+            condition |= Q(**{f"{field}__icontains": query})
+        results = list(queryset.filter(condition).order_by('-created_at')[offset:offset + limit])
+        for result in results:
+            result.search_rank = None
+        return results
+
+    match = build_match_query(query)
+    if match is None:
+        return []
+    ranked = _ranked_ids(table, weights, match, user.id if user is not None else None, limit, offset)
+    by_id = queryset.in_bulk([pk for pk, _ in ranked])
+    results = []
+    for pk, score in ranked:
+        # Rows deleted through queryset.delete() may linger until a rebuild
+        if pk in by_id:
+            by_id[pk].search_rank = score
+            results.append(by_id[pk])
+    return results
+
+
+def search_questions(query: str, user=None, limit: int = 20, offset: int = 0) -> List[LegalQuestion]:
+    """Rank a user's (or everyone's) questions and answers against ``query``."""
+    return _search(LegalQuestion, QUESTION_FTS_TABLE, QUESTION_WEIGHTS,
+                   ('question', 'answer', 'category'), query, user, limit, offset)
+
+
+def search_documents(query: str, user=None, limit: int = 20, offset: int = 0) -> List[Document]:
+    """Rank a user's (or everyone's) documents against ``query``."""
+    return _search(Document, DOCUMENT_FTS_TABLE, DOCUMENT_WEIGHTS,
+                   ('title', 'content'), query, user, limit, offset)
+
+
+def filter_by_search(queryset: QuerySet, table: str, query: str,
+                     columns: Sequence[str] = ()) -> Optional[QuerySet]:
+    """Restrict ``queryset`` to indexed matches, in ``columns`` only if given; None when the index cannot answer."""
+    match = build_match_query(query) if is_available() else None
+    if match is None:
+        return None
+    if columns:
+        match = f"{{{' '.join(columns)}}} : ({match})"
+    return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match]))
+
+
+def index_in_batches(queryset, index, batch_size: int = 1000) -> int:
+    """Feed ``queryset`` to ``index_questions``/``index_documents`` in batches."""
+    batch, count = [], 0
+    for obj in queryset.iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            index(batch)
+            count += len(batch)
+            batch = []
+    index(batch)
+    return count + len(batch)
+
+
+def rebuild_index(batch_size: int = 1000) -> Tuple[int, int]:
+    """Recreate both tables from the database; returns (questions, documents) indexed.
+
+    Needed after writes that bypass model signals, such as ``QuerySet.update()``.
+    """
+    with connection.cursor() as cursor:
+        for sql in DROP_FTS_SQL + CREATE_FTS_SQL:
+            cursor.execute(sql)
+
+    questions = index_in_batches(
+        LegalQuestion.objects.only('id', 'user_id', 'question', 'answer', 'category'), index_questions, batch_size
+    )
+    documents = index_in_batches(
+        Document.objects.only('id', 'user_id', 'title', 'content'), index_documents, batch_size
+    )
+    with connection.cursor() as cursor:
+        for table in (QUESTION_FTS_TABLE, DOCUMENT_FTS_TABLE):
+            cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+    return questions, documents
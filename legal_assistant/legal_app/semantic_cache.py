@@ -0,0 +1,276 @@
+# legal_app/semantic_cache.py
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .text import normalize_text
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not coordinated between processes
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Vector index of answered questions for serving near-duplicate questions.
+
+    Embeddings are stored L2-normalized in a NumPy matrix, so a lookup is a
+    single matrix-vector product. The matrix grows by doubling, and when
+    the index is full the least recently matched entry is overwritten in
+    place. The index is written to ``path`` by a background thread every
+    ``save_every`` additions, so no request waits for the file, and
+    loaded back on startup. Each save merges in what other processes
+    saved meanwhile, under a file lock, so gunicorn workers sharing the
+    file keep each other's entries; ``rebuild`` + ``save(merge=False)``
+    replaces the file, and workers then drop what they had added before.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, path: Optional[str] = None, save_every: int = 20):
+        if np is None:
+            raise ImproperlyConfigured("The semantic cache requires numpy: pip install numpy")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        # (capacity, dim) float32 buffers; the first len(_entries) rows are in use
+        self._vectors = None
+        self._last_used = np.zeros(0, dtype=np.float64)
+        self._added = np.zeros(0, dtype=np.float64)
+        self._entries: List[Dict[str, Any]] = []
+        # When the saved index was last rebuilt; entries added before are dropped on merge
+        self._rebuilt_at = 0.0
+        self._unsaved = 0
+        self._saving = False
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _entry_key(entry: Dict[str, Any]) -> str:
+        return normalize_text(entry.get("question", "")) or json.dumps(entry, sort_keys=True, ensure_ascii=False)
+
+    def lookup(self, vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """Return the stored entry most similar to ``vector`` if it clears the threshold."""
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._entries or self._vectors.shape[1] != query.shape[0]:
+                return None
+            scores = self._vectors[:len(self._entries)] @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                return None
+            self._last_used[best] = time.time()
+            return {**self._entries[best], "similarity": similarity}
+
+    def add(self, vector: Sequence[float], entry: Dict[str, Any]):
+        """Add an answered question; ``entry`` must be JSON-serializable."""
+        row = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != row.shape[0]:
+                # First entry, or the embedding model changed: start over
+                self._set(np.empty((0, row.shape[0]), dtype=np.float32), np.zeros(0), np.zeros(0), [])
+            size = len(self._entries)
+            if size >= self.max_entries:
+                index = int(np.argmin(self._last_used[:size]))
+                self._entries[index] = entry
+            else:
+                if size == len(self._vectors):
+                    self._grow(min(self.max_entries, max(16, 2 * size)))
+                index = size
+                self._entries.append(entry)
+            now = time.time()
+            self._vectors[index] = row
+            self._last_used[index] = self._added[index] = now
+            self._unsaved += 1
+            should_save = self.path is not None and self._unsaved >= self.save_every and not self._saving
+            if should_save:
+                self._saving = True
+        if should_save:
+            threading.Thread(target=self._save_in_background, name='semantic-cache-save', daemon=True).start()
+
+    def _save_in_background(self):
+        try:
+            self.save()
+        except Exception as e:
+            logger.warning(f"Could not save semantic cache to {self.path}: {e!r}")
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def _grow(self, capacity: int):
+        size = len(self._entries)
+        vectors = np.empty((capacity, self._vectors.shape[1]), dtype=np.float32)
+        vectors[:size] = self._vectors[:size]
+        last_used, added = np.zeros(capacity), np.zeros(capacity)
+        last_used[:size], added[:size] = self._last_used[:size], self._added[:size]
+        self._vectors, self._last_used, self._added = vectors, last_used, added
+
+    def _set(self, vectors, last_used, added, entries: List[Dict[str, Any]]):
+        """Replace the contents (lock held); the arrays are used as they are."""
+        self._vectors = vectors
+        self._last_used = np.asarray(last_used, dtype=np.float64)
+        self._added = np.asarray(added, dtype=np.float64)
+        self._entries = list(entries)
+
+    def _contents(self):
+        size = len(self._entries)
+        return self._vectors[:size], self._last_used[:size], self._added[:size], list(self._entries)
+
+    def rebuild(self, items: Iterable[Tuple[Sequence[float], Dict[str, Any]]]):
+        """Replace the index contents with ``(vector, entry)`` pairs, oldest first; call ``save(merge=False)`` after."""
+        rows, entries = [], []
+        for vector, entry in items:
+            rows.append(self._normalize(vector))
+            entries.append(entry)
+        rows, entries = rows[-self.max_entries:], entries[-self.max_entries:]
+        now = time.time()
+        with self._lock:
+            if rows:
+                # Equal timestamps: eviction takes the oldest (first) entries first
+                self._set(np.vstack(rows), np.full(len(rows), now), np.full(len(rows), now), entries)
+            else:
+                self._set(None, np.zeros(0), np.zeros(0), [])
+            self._rebuilt_at = now
+            self._unsaved = 0
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize saves of all processes sharing ``path``."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_name(f"{self.path.name}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        """(vectors, last_used, added, entries, rebuilt_at) saved at ``path``, or None."""
+        if not self.path.exists():
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                vectors = data["vectors"].astype(np.float32)
+                last_used = data["last_used"]
+                # Files written before additions were timed separately
+                added = data["added"] if "added" in data.files else last_used
+                rebuilt_at = float(data["rebuilt_at"]) if "rebuilt_at" in data.files else 0.0
+                entries = json.loads(str(data["entries"]))
+        except Exception as e:
+            logger.warning(f"Could not load semantic cache from {self.path}: {e!r}")
+            return None
+        return vectors, last_used, added, entries, rebuilt_at
+
+    def _merge(self, saved):
+        """Merge the saved index into this one (lock held); the most recently used copy of a question wins."""
+        vectors, last_used, added, entries, rebuilt_at = saved
+        if self._vectors is not None:
+            own_vectors, own_last_used, own_added, own_entries = self._contents()
+        else:
+            own_vectors, own_last_used, own_added, own_entries = None, np.zeros(0), np.zeros(0), []
+        if rebuilt_at > self._rebuilt_at:
+            # Rebuilt by another process: keep only what was added here since
+            keep = own_added >= rebuilt_at
+            own_vectors = own_vectors[keep] if own_vectors is not None else None
+            own_last_used, own_added = own_last_used[keep], own_added[keep]
+            own_entries = [entry for entry, kept in zip(own_entries, keep) if kept]
+            self._rebuilt_at = rebuilt_at
+        if own_vectors is not None and len(vectors) and vectors.shape[1] != own_vectors.shape[1]:
+            # Saved with another embedding model
+            vectors, entries = vectors[:0], []
+        if own_vectors is None:
+            own_vectors = vectors[:0]
+
+        merged: Dict[str, Tuple[float, float, Any, Dict[str, Any]]] = {}
+        for rows, used, times, items in ((vectors, last_used, added, entries),
+                                         (own_vectors, own_last_used, own_added, own_entries)):
+            for index, entry in enumerate(items):
+                key = self._entry_key(entry)
+                current = merged.get(key)
+                if current is None or used[index] >= current[0]:
+                    merged[key] = (float(used[index]), float(times[index]), rows[index], entry)
+        values = sorted(merged.values(), key=lambda value: value[0])[-self.max_entries:]
+        self._set(np.vstack([value[2] for value in values]) if values else own_vectors[:0],
+                  [value[0] for value in values], [value[1] for value in values], [value[3] for value in values])
+
+    def save(self, merge: bool = True):
+        """Atomically write the index to ``path``, first merging in what other processes saved."""
+        if self.path is None:
+            return
+        with self._file_lock():
+            saved = self._read() if merge else None
+            with self._lock:
+                if saved is not None:
+                    self._merge(saved)
+                if self._vectors is None:
+                    return
+                vectors, last_used, added, entries = self._contents()
+                vectors, last_used, added = vectors.copy(), last_used.copy(), added.copy()
+                entries = json.dumps(entries, ensure_ascii=False)
+                rebuilt_at = self._rebuilt_at
+                self._unsaved = 0
+            tmp_path = self.path.with_name(f"{self.path.stem}.{os.getpid()}.tmp.npz")
+            np.savez(tmp_path, vectors=vectors, last_used=last_used, added=added,
+                     rebuilt_at=np.array(rebuilt_at), entries=np.array(entries))
+            os.replace(tmp_path, self.path)
+        logger.info(f"Semantic cache saved: {len(vectors)} entries.")
+
+    def load(self):
+        """Load the index from ``path`` if it exists."""
+        if self.path is None:
+            return
+        saved = self._read()
+        if saved is None:
+            return
+        vectors, last_used, added, entries, rebuilt_at = saved
+        keep = np.argsort(last_used, kind="stable")[-self.max_entries:]
+        with self._lock:
+            self._set(vectors[keep], last_used[keep], added[keep], [entries[i] for i in keep])
+            self._rebuilt_at = rebuilt_at
+        logger.info(f"Semantic cache loaded: {len(self._entries)} entries.")
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None when it is disabled."""
+    global _semantic_cache
+    if not getattr(settings, 'LEGAL_AI_SEMANTIC_CACHE', False):
+        return None
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(
+                    threshold=getattr(settings, 'LEGAL_AI_SEMANTIC_CACHE_THRESHOLD', 0.95),
+                    max_entries=getattr(settings, 'LEGAL_AI_SEMANTIC_CACHE_MAX_ENTRIES', 5000),
+                    path=getattr(settings, 'LEGAL_AI_SEMANTIC_CACHE_PATH', None),
+                    save_every=getattr(settings, 'LEGAL_AI_SEMANTIC_CACHE_SAVE_EVERY', 20),
+                )
+    return _semantic_cache
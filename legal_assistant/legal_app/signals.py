@@ -0,0 +1,62 @@
+# legal_app/signals.py
+import logging
+from django.core.signals import request_started
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .models import Document, LegalQuestion
+from . import search
+
+logger = logging.getLogger(__name__)
+
+# Sent with ``instances=`` after LegalQuestion.objects.bulk_create(), which
+# bypasses post_save
+questions_bulk_created = Signal()
+
+
+def _update_index(update, *args):
+    """Update the search index in the transaction that saved the rows.
+
+    Savers wrap the save in ``transaction.atomic()``, so the index costs no
+    extra commit. A failure only leaves the index behind, which
+    ``manage.py rebuild_search_index`` repairs, so it is logged and the
+    save stands.
+    """
+    try:
+        with transaction.atomic():
+            update(*args)
+    except DatabaseError as e:
+        logger.error(f"Search index update failed: {e!r}")
+
+
+@receiver(post_save, sender=LegalQuestion)
+def index_question(sender, instance, **kwargs):
+    _update_index(search.index_questions, [instance])
+
+
+@receiver(questions_bulk_created, sender=LegalQuestion)
+def index_bulk_questions(sender, instances, **kwargs):
+    _update_index(search.index_questions, instances)
+
+
+@receiver(post_delete, sender=LegalQuestion)
+def unindex_question(sender, instance, **kwargs):
+    _update_index(search.unindex, search.QUESTION_FTS_TABLE, instance.pk)
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, **kwargs):
+    _update_index(search.index_documents, [instance])
+
+
+@receiver(post_delete, sender=Document)
+def unindex_document(sender, instance, **kwargs):
+    _update_index(search.unindex, search.DOCUMENT_FTS_TABLE, instance.pk)
+
+
+@receiver(request_started)
+def resume_document_jobs(sender, **kwargs):
+    """Pick up the document jobs of a previous run of the server on its first request."""
+    request_started.disconnect(resume_document_jobs)
+    from .jobs import start_job_recovery
+    start_job_recovery()
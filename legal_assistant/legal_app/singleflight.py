@@ -0,0 +1,164 @@
+# legal_app/singleflight.py
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapse concurrent identical upstream calls into one.
+
+    Within a process, callers with the same key wait for the first caller (the
+    leader) and share its result or exception. Across workers, the leader
+    holds a lock in the shared cache; other workers poll ``lookup`` (normally
+    the response cache, which the leader fills) until the result appears or
+    the lock is released. Waiting is bounded by ``wait_timeout``, after which
+    a caller makes the call itself rather than fail. ``share`` turns the
+    leader's result into the one followers get, e.g. to drop what only the
+    leader paid for.
+
+    Cross-worker exclusion is only as strong as the cache backend's ``add``:
+    atomic on Redis and the database cache, best effort on the file cache.
+    """
+
+    def __init__(self, alias: Optional[str] = None, lock_timeout: Optional[float] = None,
+                 wait_timeout: Optional[float] = None, poll_interval: Optional[float] = None):
+        self.alias = alias or getattr(settings, 'LEGAL_AI_CACHE_ALIAS', 'default')
+        self.lock_timeout = lock_timeout or getattr(settings, 'LEGAL_AI_SINGLE_FLIGHT_LOCK_TIMEOUT', 120)
+        self.wait_timeout = wait_timeout or getattr(settings, 'LEGAL_AI_SINGLE_FLIGHT_WAIT_TIMEOUT', 90)
+        self.poll_interval = poll_interval or getattr(settings, 'LEGAL_AI_SINGLE_FLIGHT_POLL_INTERVAL', 0.25)
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[Any, str], asyncio.Future] = {}
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def do(self, key: str, fn: Callable[[], Any], lookup: Callable[[], Any],
+           share: Optional[Callable[[Any], Any]] = None) -> Any:
+        """Return ``fn()``, sharing one execution among concurrent callers of ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                return share(call.result) if share else call.result
+            logger.warning(f"Single-flight wait for {key} timed out, calling upstream.")
+            return fn()
+
+        try:
+            call.result = self._do_across_workers(key, fn, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_across_workers(self, key: str, fn: Callable[[], Any], lookup: Callable[[], Any]) -> Any:
+        lock_key, token = f"singleflight:{key}", uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        while not self.backend.add(lock_key, token, self.lock_timeout):
+            # Another worker leads; its result lands in the response cache
+            time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                logger.info(f"Shared in-flight result for {key} from another worker.")
+                return result
+            if time.monotonic() >= deadline:
+                logger.warning(f"Single-flight lock for {key} not released in time, calling upstream.")
+                return fn()
+        try:
+            # The previous holder may have finished just before we got the lock
+            result = lookup()
+            return result if result is not None else fn()
+        finally:
+            if self.backend.get(lock_key) == token:
+                self.backend.delete(lock_key)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], lookup: Callable[[], Any],
+                  share: Optional[Callable[[Any], Any]] = None) -> Any:
+        """Async version of ``do``; ``lookup`` is a sync callable."""
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        future = self._async_calls.get(call_key)
+        if future is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Single-flight wait for {key} timed out, calling upstream.")
+                return await fn()
+            return share(result) if share else result
+
+        future = self._async_calls[call_key] = loop.create_future()
+        try:
+            result = await self._ado_across_workers(key, fn, lookup)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._async_calls.pop(call_key, None)
+
+    async def _ado_across_workers(self, key: str, fn: Callable[[], Awaitable[Any]], lookup: Callable[[], Any]) -> Any:
+        lock_key, token = f"singleflight:{key}", uuid.uuid4().hex
+        add = sync_to_async(self.backend.add, thread_sensitive=False)
+        alookup = sync_to_async(lookup, thread_sensitive=False)
+        deadline = time.monotonic() + self.wait_timeout
+        while not await add(lock_key, token, self.lock_timeout):
+            await asyncio.sleep(self.poll_interval)
+            result = await alookup()
+            if result is not None:
+                logger.info(f"Shared in-flight result for {key} from another worker.")
+                return result
+            if time.monotonic() >= deadline:
+                logger.warning(f"Single-flight lock for {key} not released in time, calling upstream.")
+                return await fn()
+        try:
+            result = await alookup()
+            return result if result is not None else await fn()
+        finally:
+            await sync_to_async(self._release, thread_sensitive=False)(lock_key, token)
+
+    def _release(self, lock_key: str, token: str):
+        if self.backend.get(lock_key) == token:
+            self.backend.delete(lock_key)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide SingleFlight shared by all LegalAI instances."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -1,3 +1,904 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from docx import Document as DocxDocument
+from docx.opc.part import XmlPart
+from . import analytics, db, downloads, jobs, knowledge, resilience, tokens, utils
+from .batch import BatchCheckpoint, answer_batch
+from .classifier import CategoryClassifier, get_category_classifier
+from .conversations import start_conversation
+from .db import record_question
+from .document_templates import SIGNATURE, TEMPLATES, document_template_version, get_document_template
+from .jobs import requeue_stale_jobs, resume_jobs, store_document_file
+from .knowledge import KnowledgeBase, KnowledgeIndexer
+from .models import DailyQuestionStats, DailyTopQuestion, Document, DocumentJob, LegalQuestion, RollupState
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .providers import StubProvider, reset_providers, resolve, split_model
+from .rendering import BaseTemplate
+from .resilience import CircuitBreaker, ResilientCaller, get_circuit_breaker
+from .response_cache import ResponseCache, make_cache_key
+from .scheduler import BACKGROUND, INTERACTIVE, SchedulerTimeout, UpstreamScheduler, scheduling
+from .semantic_cache import SemanticCache
+from .singleflight import SingleFlight
+from .tokens import TokenBudget, count_message_tokens, without_usage
+from .warmup import question_entries
 
-# Create your tests here.
+STUB_MODEL = 'stub:test-model'
+
+
+def chat_kwargs(**kwargs):
+    return {'model': STUB_MODEL, 'messages': [{'role': 'user', 'content': 'Вопрос'}], **kwargs}
+
+
+def ask(user, question, **fields):
+    return record_question(user=user, question=question, answer=f"Ответ: {question}",
+                           category='civil law', status='answered', **fields)
+
+
+def sse_events(response):
+    content = b''.join(response.streaming_content).decode()
+    return [json.loads(message[len('data: '):]) for message in content.split('\n\n') if message]
+
+
+# Every task answered in-process by the stub provider, caches in memory
+use_stub_ai = override_settings(
+    LEGAL_AI_ANSWER_MODEL=STUB_MODEL, LEGAL_AI_CATEGORY_MODEL=STUB_MODEL, LEGAL_AI_DOCUMENT_MODEL=STUB_MODEL,
+    LEGAL_AI_SUMMARY_MODEL=STUB_MODEL, LEGAL_AI_FALLBACK_MODELS=[], LEGAL_AI_KNOWLEDGE_BASE=False,
+    LEGAL_AI_SEMANTIC_CACHE=False, LEGAL_AI_CATEGORY_CLASSIFIER_PATH=None,
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+        'llm': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-llm'},
+    },
+)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        resilience._breakers.clear()
+        self.breaker = get_circuit_breaker(STUB_MODEL)
+        self.caller = ResilientCaller(max_retries=0, fallback_models=[])
+
+    def tearDown(self):
+        resilience._breakers.clear()
+
+    def make_half_open(self, breaker: CircuitBreaker):
+        breaker.failures = breaker.failure_threshold
+        breaker.opened_at = time.monotonic() - breaker.recovery_timeout - 1
+
+    def test_opens_after_threshold_and_lets_one_trial_through(self):
+        breaker = CircuitBreaker('m', failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+        self.make_half_open(breaker)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_trial_timing_out_for_a_slot_is_released(self):
+        self.make_half_open(self.breaker)
+        with mock.patch.object(ResilientCaller, 'slot', side_effect=SchedulerTimeout()):
+            with self.assertRaises(SchedulerTimeout):
+                self.caller.call('answer', 'chat', chat_kwargs())
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertTrue(self.breaker.allow())
+
+    def test_cancelled_trial_is_released(self):
+        self.make_half_open(self.breaker)
+
+        async def slow_chat(provider, **kwargs):
+            await asyncio.sleep(10)
+
+        async def run():
+            await asyncio.wait_for(self.caller.acall('answer', 'chat', chat_kwargs()), 0.05)
+
+        with mock.patch.object(StubProvider, 'achat', slow_chat):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(run())
+        self.assertTrue(self.breaker.allow())
+
+    def test_successful_trial_closes_the_circuit(self):
+        self.make_half_open(self.breaker)
+        response = self.caller.call('answer', 'chat', chat_kwargs())
+        self.assertTrue(response.choices[0].message.content)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_stream_holds_the_slot_of_the_model_that_answered(self):
+        held = []
+
+        @contextmanager
+        def slot(caller, kind, kwargs, deadline=None):
+            held.append(kwargs['model'])
+            try:
+                yield
+            finally:
+                held.remove(kwargs['model'])
+
+        broken = get_circuit_breaker('stub:broken')
+        broken.record_failure()
+        broken.opened_at = time.monotonic()
+        caller = ResilientCaller(max_retries=0, fallback_models=[STUB_MODEL])
+        with mock.patch.object(ResilientCaller, 'slot', slot):
+            stream = caller.call('answer_stream', 'chat', chat_kwargs(model='stub:broken', stream=True), hold=True)
+            self.assertEqual(held, [STUB_MODEL])
+            self.assertTrue(next(stream).choices[0].delta.content)
+            self.assertEqual(held, [STUB_MODEL])
+            list(stream)
+            self.assertEqual(held, [])
+
+
+@mock.patch('legal_app.views.get_legal_ai')
+class MetricsAccessTests(TestCase):
+    def setUp(self):
+        stats = {'hit_ratio': 0.0, 'hits': 0, 'misses': 0}
+        self.ai = mock.Mock(**{'response_cache.stats.return_value': stats})
+
+    def test_local_requests_need_a_token_or_staff(self, get_legal_ai):
+        get_legal_ai.return_value = self.ai
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self, get_legal_ai):
+        get_legal_ai.return_value = self.ai
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'process_start_time_seconds', response.content)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_staff(self, get_legal_ai):
+        get_legal_ai.return_value = self.ai
+        self.client.force_login(User.objects.create_user('staff', password='p', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class WarmupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='p')
+        self.ai = mock.Mock(model='gpt-4')
+        self.ai._response_cache_key.side_effect = lambda question: question
+        self.ai._format_response.side_effect = lambda answer, category: {'answer': answer}
+
+    def cached_questions(self):
+        return {key for key, _ in question_entries(self.ai)}
+
+    @override_settings(LEGAL_AI_ANSWER_MODEL='gpt-4', LEGAL_AI_PROMPT_VERSION='3')
+    def test_only_first_turns_of_the_current_version(self):
+        conversation = start_conversation(self.user, 'Первый')
+        ask(self.user, 'Первый', conversation=conversation)
+        ask(self.user, 'Уточнение', conversation=conversation)
+        ask(self.user, 'Отдельный')
+        ask(self.user, 'Старый', prompt_version='2')
+        ask(self.user, 'Другая модель', model='gpt-3.5-turbo')
+        self.assertEqual(self.cached_questions(), {'Первый', 'Отдельный'})
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.path = f"{tempfile.mkdtemp()}/index.npz"
+
+    def entry(self, question):
+        return {'question': question, 'answer': 'Ответ', 'category': 'civil law'}
+
+    def test_evicts_least_recently_used(self):
+        cache = SemanticCache(0.9, max_entries=2)
+        cache.add([1, 0, 0], self.entry('a'))
+        cache.add([0, 1, 0], self.entry('b'))
+        cache.lookup([1, 0, 0])
+        cache.add([0, 0, 1], self.entry('c'))
+        self.assertEqual(sorted(entry['question'] for entry in cache._entries), ['a', 'c'])
+
+    def test_rebuild_saves_once(self):
+        cache = SemanticCache(0.9, max_entries=100, path=self.path, save_every=2)
+        with mock.patch.object(SemanticCache, 'save') as save:
+            cache.rebuild(([i, 1], self.entry(f"q{i}")) for i in range(10))
+        save.assert_not_called()
+        cache.save(merge=False)
+        self.assertEqual(len(SemanticCache(0.9, max_entries=100, path=self.path)), 10)
+
+    def test_saves_in_the_background(self):
+        cache = SemanticCache(0.9, max_entries=100, path=self.path, save_every=2)
+        saved = threading.Event()
+        threads = []
+
+        def save():
+            threads.append(threading.current_thread())
+            saved.set()
+
+        with mock.patch.object(cache, 'save', side_effect=save):
+            cache.add([1, 0], self.entry('a'))
+            self.assertFalse(saved.is_set())
+            cache.add([0, 1], self.entry('b'))
+            self.assertTrue(saved.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_workers_keep_each_others_entries(self):
+        first = SemanticCache(0.9, max_entries=100, path=self.path)
+        second = SemanticCache(0.9, max_entries=100, path=self.path)
+        first.add([1, 0], self.entry('first'))
+        second.add([0, 1], self.entry('second'))
+        first.save()
+        second.save()
+        saved = SemanticCache(0.9, max_entries=100, path=self.path)
+        self.assertEqual(sorted(entry['question'] for entry in saved._entries), ['first', 'second'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.flight = SingleFlight(alias='default', wait_timeout=1, poll_interval=0.01)
+
+    def test_followers_share_the_leaders_call_without_its_usage(self):
+        calls = []
+        release = threading.Event()
+
+        def fn():
+            calls.append(1)
+            release.wait(1)
+            return {'answer': 'Ответ', 'usage': {'prompt_tokens': 10}}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.flight.do('k', fn, lambda: None, without_usage)))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted('usage' in result for result in results), [False, False, True])
+
+    def test_async_follower_calls_upstream_after_waiting_too_long(self):
+        self.flight.wait_timeout = 0.05
+
+        async def slow():
+            await asyncio.sleep(0.5)
+            return 'leader'
+
+        async def fast():
+            return 'follower'
+
+        async def run():
+            leader = asyncio.ensure_future(self.flight.ado('k', slow, lambda: None))
+            await asyncio.sleep(0.01)
+            follower = await self.flight.ado('k', fast, lambda: None)
+            return follower, await leader
+
+        self.assertEqual(asyncio.run(run()), ('follower', 'leader'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResponseCacheTests(SimpleTestCase):
+    def test_counts_lookups_without_extra_round_trips(self):
+        cache = ResponseCache(alias='default')
+        cache.set('answer:1', {'answer': 'Ответ'})
+        with mock.patch('django.core.cache.backends.locmem.LocMemCache.incr') as incr:
+            cache.get('answer:1')
+            cache.get('answer:2')
+            cache.get('answer:2')
+        incr.assert_not_called()
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
+
+
+class CategoryClassifierTests(SimpleTestCase):
+    samples = [
+        ('Как вернуть товар в магазин', 'consumer protection'),
+        ('Магазин не принимает товар обратно', 'consumer protection'),
+        ('Возврат денег за товар', 'consumer protection'),
+        ('Меня уволили без предупреждения', 'labor law'),
+        ('Работодатель не платит зарплату', 'labor law'),
+        ('Увольнение по сокращению штата', 'labor law'),
+    ]
+
+    def test_predicts_the_closest_category(self):
+        classifier = CategoryClassifier.train(self.samples)
+        label, confidence = classifier.predict('Хочу вернуть товар')
+        self.assertEqual(label, 'consumer protection')
+        self.assertLess(confidence, 1.0)
+
+    def test_refuses_a_single_label(self):
+        with self.assertRaises(ValueError):
+            CategoryClassifier.train(self.samples[:3] + self.samples[3:4])
+
+    def test_single_label_artifact_is_not_used(self):
+        path = f"{tempfile.mkdtemp()}/classifier.json"
+        classifier = CategoryClassifier.train(self.samples)
+        classifier.centroids = {'labor law': classifier.centroids['labor law']}
+        classifier.save(path)
+        with override_settings(LEGAL_AI_CATEGORY_CLASSIFIER_PATH=path):
+            self.assertIsNone(get_category_classifier())
+
+
+class TokenBudgetTests(SimpleTestCase):
+    @unittest.skipIf(tokens.tiktoken is None, "tiktoken is not installed")
+    def test_encodings_load_from_the_cache_dir(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        url = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+        # A byte-level stand-in for the real BPE file, under the name tiktoken caches it as
+        with open(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()), 'w') as f:
+            f.writelines(f"{base64.b64encode(bytes([i])).decode()} {i}\n" for i in range(256))
+        with override_settings(LEGAL_AI_TIKTOKEN_CACHE_DIR=cache_dir), mock.patch.dict(os.environ), \
+                mock.patch.dict(tokens._encodings, clear=True), mock.patch.dict(tokens._encoding_failures, clear=True), \
+                mock.patch.dict(tokens.tiktoken.registry.ENCODINGS, clear=True):
+            tokens.use_encoding_cache()
+            self.assertEqual(tokens.count_tokens('abcd', 'gpt-4'), 4)
+
+    @unittest.skipIf(tokens.tiktoken is None, "tiktoken is not installed")
+    def test_failed_encoding_is_retried_later(self):
+        with mock.patch.dict(tokens._encodings, clear=True), mock.patch.dict(tokens._encoding_failures, clear=True), \
+                mock.patch.object(tokens.tiktoken, 'get_encoding', side_effect=[OSError('offline'), 'encoding']):
+            self.assertIsNone(tokens.get_encoding('gpt-4'))
+            self.assertIsNone(tokens.get_encoding('gpt-4'))
+            tokens._encoding_failures['gpt-4'] -= tokens.ENCODING_RETRY_SECONDS
+            self.assertEqual(tokens.get_encoding('gpt-4'), 'encoding')
+
+    def messages(self, turns=4):
+        history = [{'role': 'system', 'content': 'Summary of the earlier conversation: ' + 'факт ' * 20}]
+        for index in range(turns):
+            history += [
+                {'role': 'user', 'content': f"Вопрос {index} " + 'слово ' * 40},
+                {'role': 'assistant', 'content': f"Ответ {index} " + 'слово ' * 40},
+            ]
+        return [
+            {'role': 'system', 'content': 'Instructions. ' + 'статья ' * 60},
+            *history,
+            {'role': 'user', 'content': 'Текущий вопрос ' + 'слово ' * 20},
+        ]
+
+    def test_drops_oldest_turns_before_touching_the_question(self):
+        messages = self.messages()
+        budget = TokenBudget('gpt-4', window=count_message_tokens(messages, 'gpt-4') + 100)
+        fitted, max_tokens = budget.fit(messages, 400)
+        self.assertEqual(fitted[-1], messages[-1])
+        self.assertEqual(fitted[:2], messages[:2])
+        self.assertNotIn(messages[2], fitted)
+        self.assertNotIn(messages[3], fitted)
+        self.assertIn(messages[-2], fitted)
+        self.assertLessEqual(count_message_tokens(fitted, 'gpt-4') + max_tokens, budget.window)
+
+    def test_trims_passages_before_the_question(self):
+        messages = self.messages(turns=0)
+        budget = TokenBudget('gpt-4', window=count_message_tokens(messages, 'gpt-4'))
+        fitted, _ = budget.fit(messages, 100, trim_system=True)
+        self.assertEqual(fitted[-1], messages[-1])
+        self.assertEqual(len(fitted), 2)
+        self.assertTrue(fitted[0]['content'].startswith('Instructions.'))
+        self.assertLess(len(fitted[0]['content']), len(messages[0]['content']))
+
+
+class UpstreamPriorityTests(SimpleTestCase):
+    def tearDown(self):
+        for executor in utils._upstream_executors.values():
+            executor.shutdown(wait=False)
+        utils._upstream_executors.clear()
+
+    def test_interactive_waiters_are_served_first(self):
+        scheduler = UpstreamScheduler(concurrency=1, interactive_reserve=0, requests_per_minute=0,
+                                      tokens_per_minute=0, queue_timeout=5)
+        order = []
+
+        def wait(priority):
+            with scheduling(priority=priority):
+                with scheduler.slot('chat', 1):
+                    order.append(priority)
+
+        held = scheduler.acquire('chat', 1)
+        threads = [threading.Thread(target=wait, args=(priority,)) for priority in (BACKGROUND, INTERACTIVE)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        scheduler.release(held)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [INTERACTIVE, BACKGROUND])
+
+    @override_settings(LEGAL_AI_MAX_WORKERS=2, LEGAL_AI_BACKGROUND_MAX_WORKERS=1)
+    def test_busy_background_pool_does_not_hold_up_interactive_calls(self):
+        release = threading.Event()
+        with scheduling(priority=BACKGROUND):
+            blocked = [utils.get_upstream_executor().submit(release.wait, 5) for _ in range(3)]
+        try:
+            interactive = utils.get_upstream_executor().submit(lambda: 'answer')
+            self.assertEqual(interactive.result(timeout=1), 'answer')
+        finally:
+            release.set()
+        self.assertTrue(all(future.result(timeout=1) for future in blocked))
+
+
+@override_settings(DB_WRITE_BEHIND=True, DB_WRITE_BEHIND_INTERVAL=60)
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='p')
+        db._write_behind = None
+
+    def tearDown(self):
+        if db._write_behind is not None:
+            # Rows left over would be flushed at exit, after the test database is gone
+            db._write_behind._pending.clear()
+        db._write_behind = None
+
+    def test_questions_are_buffered_until_flushed(self):
+        question = ask(self.user, 'Отдельный')
+        self.assertIsNone(question.pk)
+        self.assertFalse(LegalQuestion.objects.exists())
+        self.assertEqual(db.get_write_behind_buffer().flush(), 1)
+        self.assertTrue(LegalQuestion.objects.filter(question='Отдельный').exists())
+
+    @mock.patch('legal_app.views.get_legal_ai')
+    def test_chat_turns_are_buffered_and_read_back_by_the_next_turn(self, get_legal_ai):
+        get_legal_ai.return_value.get_legal_response.side_effect = lambda question, history: {
+            'status': 'success', 'answer': f"Ответ: {question}", 'category': 'civil law',
+        }
+        self.client.force_login(self.user)
+        url = reverse('legal_app:chat')
+        first = self.client.post(url, {'question': 'Как вернуть товар?'}).json()
+        self.assertIsNone(first['question_id'])
+        self.assertFalse(LegalQuestion.objects.exists())
+
+        self.client.post(url, {'question': 'А если прошло 14 дней?', 'conversation': first['conversation_id']})
+        _, history = get_legal_ai.return_value.get_legal_response.call_args.args
+        self.assertEqual([message['content'] for message in history],
+                         ['Как вернуть товар?', 'Ответ: Как вернуть товар?'])
+        self.assertEqual(LegalQuestion.objects.get().conversation_id, first['conversation_id'])
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_superuser('admin', password='p')
+        self.client.force_login(user)
+        LegalQuestion.objects.create(user=user, question='Как вернуть товар', answer='Ответ про увольнение',
+                                     category='consumer protection', status='answered')
+
+    def search(self, term):
+        response = self.client.get('/admin/legal_app/legalquestion/', {'q': term})
+        return response.context['cl'].result_count
+
+    def test_failed_indexing_keeps_the_question(self):
+        user = User.objects.create_user('u', password='p')
+        with mock.patch('legal_app.search.index_questions', side_effect=DatabaseError('fts5 missing')):
+            question = record_question(user=user, question='Как уволиться', answer='Ответ',
+                                       category='labor law', status='answered')
+        self.assertTrue(LegalQuestion.objects.filter(id=question.id).exists())
+
+    def test_matches_questions_and_categories_but_not_answers(self):
+        self.assertEqual(self.search('товары'), 1)
+        self.assertEqual(self.search('consumer'), 1)
+        self.assertEqual(self.search('увольнение'), 0)
+
+
+@override_settings(DOCUMENT_JOB_STALE_AFTER=600)
+class JobRecoveryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='p')
+
+    def job(self, status, started_minutes_ago=None, heartbeat_minutes_ago=None):
+        def ago(minutes):
+            return timezone.now() - timedelta(minutes=minutes) if minutes is not None else None
+        return DocumentJob.objects.create(user=self.user, document_type='claim', title='Иск', context='',
+                                          status=status, started_at=ago(started_minutes_ago),
+                                          heartbeat_at=ago(heartbeat_minutes_ago))
+
+    @mock.patch('legal_app.jobs.get_job_executor')
+    def test_left_behind_jobs_are_submitted_again(self, get_job_executor):
+        queued = self.job('queued')
+        stale = self.job('running', started_minutes_ago=30)
+        running = self.job('running', started_minutes_ago=1)
+        self.job('done')
+        self.assertEqual(resume_jobs(), 2)
+        submitted = {call.args[1] for call in get_job_executor.return_value.submit.call_args_list}
+        self.assertEqual(submitted, {queued.id, stale.id})
+        stale.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((stale.status, running.status), ('queued', 'running'))
+
+    @mock.patch('legal_app.jobs.get_job_executor')
+    def test_periodic_check_only_requeues_stale_jobs(self, get_job_executor):
+        self.job('queued')
+        stale = self.job('running', started_minutes_ago=30)
+        self.assertEqual(resume_jobs(include_queued=False), 1)
+        get_job_executor.return_value.submit.assert_called_once_with(mock.ANY, stale.id)
+
+    def test_slow_jobs_with_a_heartbeat_are_left_running(self):
+        slow = self.job('running', started_minutes_ago=60, heartbeat_minutes_ago=1)
+        dead = self.job('running', started_minutes_ago=60, heartbeat_minutes_ago=30)
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=10)), 1)
+        slow.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((slow.status, dead.status), ('running', 'queued'))
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(DOCUMENT_JOB_HEARTBEAT=0.01)
+    def test_running_job_refreshes_its_heartbeat(self):
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        job = DocumentJob.objects.create(user=User.objects.create_user('u', password='p'), document_type='claim',
+                                         title='Иск', context='', status='running',
+                                         started_at=an_hour_ago, heartbeat_at=an_hour_ago)
+        stale = jobs.stale_jobs(timedelta(minutes=10))
+        with jobs._heartbeat(job.id):
+            deadline = time.monotonic() + 5
+            while stale.exists() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertFalse(stale.exists())
+
+
+class BaseTemplateTests(SimpleTestCase):
+    def test_only_styles_settings_and_numbering_are_frozen(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'template.docx')
+        branded = DocxDocument()
+        branded.sections[0].header.paragraphs[0].text = 'ООО «Юрист»'
+        branded.save(path)
+        parts = {rel.reltype.rsplit('/', 1)[-1]: rel.target_part
+                 for rel in BaseTemplate(path)._prototype.part.rels.values()}
+        self.assertNotIsInstance(parts['styles'], XmlPart)
+        self.assertNotIsInstance(parts['settings'], XmlPart)
+        self.assertIsInstance(parts['header'], XmlPart)
+
+
+@mock.patch('legal_app.views.pdf_converter', return_value='soffice')
+class PdfDownloadTests(TestCase):
+    def setUp(self):
+        media_root = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        user = User.objects.create_user('u', password='p')
+        self.client.force_login(user)
+        digest, name = store_document_file('Иск', 'Текст иска')
+        self.document = Document.objects.create(user=user, title='Иск', content='Текст иска', document_type='claim',
+                                                file=name, content_hash=digest)
+        self.url = reverse('legal_app:download_document', args=[self.document.id]) + '?format=pdf'
+
+    def wait_for_conversion(self):
+        for conversion in list(downloads._pdf_conversions.values()):
+            conversion.exception(timeout=5)
+
+    def test_converts_in_the_background(self, pdf_converter):
+        with mock.patch('legal_app.downloads.convert_to_pdf', return_value=b'%PDF-1.4') as convert:
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response['Retry-After'], '2')
+            self.wait_for_conversion()
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        convert.assert_called_once()
+        self.assertFalse(downloads._pdf_conversions)
+
+    def test_failed_conversion_is_reported_once(self, pdf_converter):
+        with mock.patch('legal_app.downloads.convert_to_pdf', side_effect=RuntimeError('soffice crashed')):
+            self.assertEqual(self.client.get(self.url).status_code, 202)
+            self.wait_for_conversion()
+            self.assertEqual(self.client.get(self.url).status_code, 500)
+            self.assertEqual(self.client.get(self.url).status_code, 202)
+            self.wait_for_conversion()
+        self.assertEqual(self.client.get(self.url).status_code, 500)
+        self.assertFalse(downloads._pdf_conversions)
+
+
+@use_stub_ai
+class ChatStreamTests(TestCase):
+    def setUp(self):
+        caches['llm'].clear()
+        self.client.force_login(User.objects.create_user('u', password='p'))
+        self.ai = utils.LegalAI()
+        get_legal_ai = mock.patch('legal_app.views.get_legal_ai', return_value=self.ai)
+        get_legal_ai.start()
+        self.addCleanup(get_legal_ai.stop)
+
+    def post(self, question):
+        return sse_events(self.client.post(reverse('legal_app:chat_stream'), {'question': question}))
+
+    def test_tokens_then_done_and_the_answer_is_cached(self):
+        events = self.post('Как вернуть товар в магазин?')
+        types = [event['type'] for event in events]
+        self.assertGreater(len(types), 2)
+        self.assertEqual(types, ['token'] * (len(types) - 1) + ['done'])
+        done = events[-1]
+        self.assertEqual(done['answer'], ''.join(event['text'] for event in events[:-1]).strip())
+        self.assertEqual(LegalQuestion.objects.get(id=done['question_id']).answer, done['answer'])
+        cached = self.ai.response_cache.peek(self.ai._response_cache_key('Как вернуть товар в магазин?'))
+        self.assertEqual(cached['answer'], done['answer'])
+
+    def test_cached_answer_is_sent_as_one_token(self):
+        first = self.post('Как вернуть товар в магазин?')[-1]
+        with mock.patch.object(StubProvider, 'chat') as chat:
+            events = self.post('  как ВЕРНУТЬ товар в магазин?')
+        chat.assert_not_called()
+        self.assertEqual([event['type'] for event in events], ['token', 'done'])
+        self.assertEqual(events[-1]['answer'], first['answer'])
+        self.assertEqual(LegalQuestion.objects.count(), 2)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='p')
+        self.client.force_login(self.user)
+        questions = [ask(self.user, f"Вопрос {index}") for index in range(7)]
+        # Rows sharing a timestamp are ordered by id
+        LegalQuestion.objects.filter(id__in=[q.id for q in questions[2:5]]).update(created_at=questions[2].created_at)
+        self.expected = list(LegalQuestion.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_pages_cover_every_row_once(self):
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(reverse('legal_app:question_history'), params).json()
+            ids += [item['id'] for item in data['items']]
+            cursor = data['next_cursor']
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 4)
+
+    def test_cursor_round_trip(self):
+        question = LegalQuestion.objects.get(id=self.expected[3])
+        self.assertEqual(decode_cursor(encode_cursor(question)), (question.created_at, question.id))
+        items, _ = keyset_page(LegalQuestion.objects.all(), encode_cursor(question), 10)
+        self.assertEqual([item.id for item in items], self.expected[4:])
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            decode_cursor('not a cursor')
+        response = self.client.get(reverse('legal_app:question_history'), {'cursor': 'bm90IGEgY3Vyc29y'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnswerBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='p')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.checkpoint = BatchCheckpoint(os.path.join(directory, 'batch.jsonl'))
+        self.asked = []
+        self.failing = {'Вопрос 2'}
+
+        def get_legal_response(question):
+            self.asked.append(question)
+            if question in self.failing:
+                raise ConnectionError('upstream down')
+            return {'status': 'success', 'answer': f"Ответ: {question}", 'category': 'civil law'}
+
+        self.ai = mock.Mock(**{
+            'get_legal_response.side_effect': get_legal_response,
+            'token_budget.count.return_value': 1,
+            'token_budget.for_answer.return_value': 1,
+        })
+
+    def run_batch(self, questions):
+        with mock.patch('legal_app.batch.get_legal_ai', return_value=self.ai):
+            return answer_batch(questions, self.user, self.checkpoint, concurrency=2, flush_every=1)
+
+    def test_resume_skips_saved_answers_and_retries_failures(self):
+        questions = ['Вопрос 1', 'Вопрос 2', 'вопрос  1', 'Вопрос 3']
+        self.checkpoint.start(len(questions))
+        first = self.run_batch(questions)
+        self.assertEqual((first.answered, first.skipped, first.failed), (2, 1, ['Вопрос 2']))
+        self.assertEqual(self.checkpoint.status(), {'total': 4, 'answered': 2, 'failed': 1, 'finished': True})
+
+        self.asked.clear()
+        self.failing.clear()
+        # A line torn by a crash mid-write is ignored
+        with open(self.checkpoint.path, 'a', encoding='utf-8') as f:
+            f.write('{"question": "Вопр')
+        second = self.run_batch(questions)
+        self.assertEqual(self.asked, ['Вопрос 2'])
+        self.assertEqual((second.answered, second.skipped, second.failed), (1, 3, []))
+        self.assertEqual(
+            sorted(LegalQuestion.objects.values_list('question', flat=True)), ['Вопрос 1', 'Вопрос 2', 'Вопрос 3']
+        )
+
+
+@use_stub_ai
+class CacheKeyTests(SimpleTestCase):
+    def test_model_and_prompt_version_are_part_of_the_key(self):
+        key = make_cache_key('legal_response', 'вопрос', model='gpt-4')
+        self.assertEqual(key, make_cache_key('legal_response', 'вопрос', model='gpt-4'))
+        self.assertTrue(key.startswith('legal_response:'))
+        self.assertNotEqual(key, make_cache_key('legal_response', 'вопрос', model='gpt-3.5-turbo'))
+        with override_settings(LEGAL_AI_PROMPT_VERSION='next'):
+            self.assertNotEqual(key, make_cache_key('legal_response', 'вопрос', model='gpt-4'))
+
+    def test_questions_differing_in_case_and_spacing_share_a_key(self):
+        ai = utils.LegalAI()
+        key = ai._response_cache_key('Как вернуть товар?')
+        self.assertEqual(key, ai._response_cache_key('  как   ВЕРНУТЬ\nтовар?'))
+        self.assertNotEqual(key, ai._response_cache_key('Как вернуть деньги?'))
+        history = [{'role': 'user', 'content': 'Купил телевизор'}, {'role': 'assistant', 'content': 'Понятно'}]
+        self.assertNotEqual(key, ai._response_cache_key('Как вернуть товар?', history))
+
+
+class DocumentTemplateTests(SimpleTestCase):
+    def test_assemble_keeps_fixed_sections_in_order(self):
+        template = TEMPLATES['statement']
+        fragments = {section.key: f"<{section.key}>" for section in template.variable_sections}
+        document = template.assemble(fragments)
+        parts = document.split('\n\n')
+        self.assertTrue(parts[0].startswith('В ______'))
+        self.assertLess(document.index('## Существо заявления\n\n<body>'), document.index('## Прошу\n\n<requests>'))
+        self.assertTrue(document.endswith(SIGNATURE))
+        self.assertEqual([section.key for section in template.variable_sections], ['body', 'requests'])
+
+    def test_every_variable_section_is_required(self):
+        with self.assertRaises(KeyError):
+            TEMPLATES['statement'].assemble({'body': 'Текст'})
+
+    def test_templates_can_be_disabled(self):
+        self.assertIsNotNone(get_document_template('contract'))
+        with override_settings(LEGAL_AI_DOCUMENT_TEMPLATES=False):
+            self.assertIsNone(get_document_template('contract'))
+            self.assertEqual(document_template_version('contract'), 'freeform')
+
+
+@unittest.skipIf(knowledge.np is None, "numpy is not installed")
+class KnowledgeIndexerTests(SimpleTestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        self.addCleanup(shutil.rmtree, self.index_dir)
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded += texts
+        return [item.embedding for item in StubProvider('stub', {}).embeddings(model='m', input=texts).data]
+
+    def write(self, name, text):
+        with open(os.path.join(self.source_dir, name), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def update(self):
+        self.embedded.clear()
+        return KnowledgeIndexer(self.index_dir).update(self.source_dir, embed=self.embed, embedding_model='m')
+
+    def test_incremental_update_embeds_only_changed_chunks(self):
+        self.write('gk.txt', "Гражданский кодекс\nСтатья 1. Основные начала\nРавенство участников отношений.\n"
+                             "Статья 2. Неустойка\nНеустойкой признается денежная сумма.\n")
+        self.write('tk.txt', "Трудовой кодекс\nСтатья 81. Расторжение договора\nУвольнение работника.\n")
+        stats = self.update()
+        self.assertEqual((stats['files'], stats['chunks'], stats['embedded']), (2, 3, 3))
+        base = KnowledgeBase(self.index_dir, 'm')
+        passages = base.retrieve('неустойкой', k=1)
+        self.assertEqual((passages[0].code, passages[0].article), ('Гражданский кодекс', '2'))
+
+        self.assertEqual(self.update()['skipped'], 2)
+        self.assertEqual(self.embedded, [])
+
+        self.write('gk.txt', "Гражданский кодекс\nСтатья 1. Основные начала\nРавенство участников отношений.\n"
+                             "Статья 2. Неустойка\nНеустойкой признается штраф или пеня.\n")
+        os.remove(os.path.join(self.source_dir, 'tk.txt'))
+        stats = self.update()
+        self.assertEqual((stats['files'], stats['removed'], stats['embedded']), (1, 1, 1))
+        self.assertIn('пеня', self.embedded[0])
+        passage, = base.retrieve('пеня', k=1, embedding=self.embed(['Статья 2. Неустойка пеня'])[0])
+        self.assertIn('пеня', passage.text)
+        self.assertEqual(base.retrieve('увольнение', k=1), [])
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='p')
+
+    def ask_at(self, question, seconds_ago, **fields):
+        legal_question = ask(self.user, question, processing_time=1.5, **fields)
+        created_at = timezone.now() - timedelta(seconds=seconds_ago)
+        LegalQuestion.objects.filter(id=legal_question.id).update(created_at=created_at)
+        return legal_question
+
+    def counted(self):
+        return DailyQuestionStats.objects.aggregate(count=Sum('count'))['count'] or 0
+
+    def test_questions_younger_than_the_lag_wait_for_the_next_run(self):
+        self.ask_at('Как вернуть товар?', 600, prompt_tokens=10)
+        counted_last = self.ask_at('как  вернуть ТОВАР?', 300, prompt_tokens=5)
+        self.ask_at('Как уволиться?', 10)
+        self.assertEqual(analytics.rollup(lag=60), 2)
+        self.assertEqual(self.counted(), 2)
+        self.assertEqual(DailyQuestionStats.objects.aggregate(tokens=Sum('prompt_tokens'))['tokens'], 15)
+        self.assertEqual(DailyTopQuestion.objects.aggregate(count=Sum('count'))['count'], 2)
+        self.assertEqual(RollupState.objects.get().last_id, counted_last.id)
+
+        self.assertEqual(analytics.rollup(lag=60), 0)
+        self.assertEqual(analytics.rollup(lag=60, now=timezone.now() + timedelta(minutes=1)), 1)
+        self.assertEqual(self.counted(), 3)
+        self.assertEqual(DailyQuestionStats.objects.aggregate(timed=Sum('timed_count'))['timed'], 3)
+
+
+@override_settings(LEGAL_AI_PROVIDERS={'openai': {'backend': 'openai'}, 'stub': {'backend': 'stub'}})
+class ProviderTests(SimpleTestCase):
+    def setUp(self):
+        reset_providers()
+        self.addCleanup(reset_providers)
+
+    def test_split_model(self):
+        self.assertEqual(split_model('stub:test-model'), ('stub', 'test-model'))
+        self.assertEqual(split_model('gpt-4'), ('openai', 'gpt-4'))
+        # Fine-tuned OpenAI models contain colons too
+        self.assertEqual(split_model('ft:gpt-3.5-turbo:org::id'), ('openai', 'ft:gpt-3.5-turbo:org::id'))
+
+    def test_stub_replies_are_deterministic(self):
+        provider, model = resolve(STUB_MODEL)
+        self.assertIsInstance(provider, StubProvider)
+        first = provider.chat(**chat_kwargs(model=model))
+        again = provider.chat(**chat_kwargs(model=model))
+        self.assertEqual(first.choices[0].message.content, again.choices[0].message.content)
+        self.assertGreater(first.usage.prompt_tokens, 0)
+        category = provider.chat(model=model, messages=[
+            {'role': 'system', 'content': 'Reply with exactly one of: labor law, civil law.'},
+            {'role': 'user', 'content': 'Меня уволили'},
+        ])
+        self.assertIn(category.choices[0].message.content, ('labor law', 'civil law'))
+        chunks = provider.chat(**chat_kwargs(model=model, stream=True))
+        self.assertEqual(''.join(chunk.choices[0].delta.content for chunk in chunks).strip(),
+                         first.choices[0].message.content)
+
+    def test_stub_embeddings_of_shared_words_are_similar(self):
+        provider, model = resolve(STUB_MODEL)
+        vectors = [item.embedding for item in provider.embeddings(
+            model=model, input=['вернуть товар в магазин', 'вернуть товар', 'уволили с работы']).data]
+        similarity = [sum(a * b for a, b in zip(vectors[0], other)) for other in vectors[1:]]
+        self.assertGreater(similarity[0], similarity[1])
+
+
+@use_stub_ai
+@override_settings(LEGAL_AI_MAX_WORKERS=1)
+class AnswerTimeoutTests(SimpleTestCase):
+    def setUp(self):
+        utils._upstream_executors.clear()
+        self.ai = utils.LegalAI()
+        self.ai.answer_timeout = 5.0
+
+    def tearDown(self):
+        for executor in utils._upstream_executors.values():
+            executor.shutdown(wait=False)
+        utils._upstream_executors.clear()
+
+    def test_queued_call_gets_only_the_time_left(self):
+        timeouts = {}
+        call = ResilientCaller.call
+
+        def record(caller, kind, endpoint, kwargs, **options):
+            timeouts[kind] = kwargs['timeout']
+            return call(caller, kind, endpoint, kwargs, **options)
+
+        # The only worker is busy for a while before the calls start
+        utils.get_upstream_executor().submit(time.sleep, 0.3)
+        with mock.patch.object(ResilientCaller, 'call', record):
+            answer, category = self.ai._get_answer_and_category('Как вернуть товар?')
+        self.assertTrue(answer)
+        self.assertLess(timeouts['answer'], 4.8)
+        self.assertLess(timeouts['category'], self.ai.category_timeout - 0.2)
+
+    def test_no_call_once_the_deadline_passed(self):
+        with mock.patch.object(ResilientCaller, 'call') as call:
+            with self.assertRaises(TimeoutError):
+                self.ai._get_openai_response('Вопрос', 'answer', deadline=time.monotonic() - 1)
+        call.assert_not_called()
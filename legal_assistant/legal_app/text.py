@@ -0,0 +1,63 @@
+# legal_app/text.py
+import re
+import unicodedata
+from typing import List
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str, casefold: bool = True) -> str:
+    """Normalize text so that trivially different inputs compare equal.
+
+    Applies NFKC normalization, collapses runs of whitespace and, unless
+    ``casefold`` is False, folds case and treats "ё" as "е".
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    if casefold:
+        text = text.casefold().replace("ё", "е")
+    return text
+
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+
+# Frequent function words that carry no topical signal
+STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только
+ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни
+быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где
+есть надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже себе под будет ж
+тогда кто этот того потому этого какой совсем ним здесь этом один почти мой тем чтобы нее
+сейчас были куда зачем всех никогда можно при наконец два об другой хоть после над больше
+тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой
+перед иногда лучше чуть том нельзя такой им более всегда конечно всю между это мне можно
+the a an of to in and or is are be for on with what how my i
+""".split())
+
+# Russian inflectional endings, longest first (a light-weight stemmer in the
+# spirit of Snowball's Russian algorithm, without its region rules)
+_RU_ENDINGS = sorted("""
+иями ями ами ией иях иям ием ии ому ему ого его ыми ими ать ять ить еть уть ешь ете ишь ите ует уют
+ала яла ила ела ыла али яли или ели ыли ой ей ий ый ая яя ое ее ые ие ую юю ом ем ам ям
+ах ях ов ев ию ью ия ья ость ост ует ся сь ть ет ит ут ют ат ят ем им ей
+а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+
+
+def stem(token: str) -> str:
+    """Strip a Russian inflectional ending, keeping a stem of at least 3 letters."""
+    if not ("а" <= token[0] <= "я"):
+        return token
+    for ending in _RU_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split normalized text into stemmed tokens without stopwords."""
+    return [
+        stem(token)
+        for token in _TOKEN_RE.findall(normalize_text(text))
+        if token not in STOPWORDS and len(token) > 1
+    ]
@@ -0,0 +1,247 @@
+# legal_app/tokens.py
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken  # type: ignore
+except Exception:  # optional: counts fall back to an estimate
+    tiktoken = None
+
+# Context windows in tokens, matched by model name prefix (longest first)
+CONTEXT_WINDOWS = {
+    'gpt-4-1106-preview': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo-16k': 16385,
+    'gpt-3.5-turbo-1106': 16385,
+    'gpt-3.5-turbo': 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+# Tokens added by the chat format: per message and to prime the reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+TRUNCATION_MARKER = "\n[…]\n"
+# Seconds before loading an encoding that failed (say, offline without the BPE files) is tried again
+ENCODING_RETRY_SECONDS = 300.0
+
+# model -> loaded encoding, and model -> when loading it last failed
+_encodings: Dict[str, Any] = {}
+_encoding_failures: Dict[str, float] = {}
+
+
+def context_window(model: str) -> int:
+    for prefix in sorted(CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def use_encoding_cache():
+    """Point tiktoken at ``LEGAL_AI_TIKTOKEN_CACHE_DIR``; called once at startup."""
+    cache_dir = getattr(settings, 'LEGAL_AI_TIKTOKEN_CACHE_DIR', None)
+    if cache_dir:
+        os.environ['TIKTOKEN_CACHE_DIR'] = str(cache_dir)
+
+
+def _encoding(model: str):
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    if time.monotonic() - _encoding_failures.get(model, -ENCODING_RETRY_SECONDS) < ENCODING_RETRY_SECONDS:
+        return None
+    try:
+        try:
+            name = tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            # Models tiktoken does not know (local ones, say) are counted like GPT-4
+            name = 'cl100k_base'
+        encoding = _encodings[model] = tiktoken.get_encoding(name)
+        return encoding
+    except Exception as e:
+        # e.g. the BPE files are not in the cache and cannot be downloaded; retried later
+        _encoding_failures[model] = time.monotonic()
+        logger.warning(f"tiktoken unavailable for {model}, estimating token counts: {e!r}")
+        return None
+
+
+def get_encoding(model: str):
+    """The model's tiktoken encoding, or None when counts are estimated."""
+    return _encoding(model) if tiktoken is not None else None
+
+
+def count_tokens(text: str, model: str = 'gpt-4') -> int:
+    """Number of tokens in ``text`` for ``model``.
+
+    Without tiktoken, one token per 4 bytes of UTF-8 is assumed: about right
+    for English and a slight overestimate for Russian, which errs on the
+    side of leaving room in the context window.
+    """
+    encoding = get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text.encode('utf-8')) / 4)
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = 'gpt-4') -> int:
+    """Prompt tokens of a chat completion request."""
+    return sum(count_tokens(m['content'], model) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = 'gpt-4') -> str:
+    """Shorten ``text`` to about ``max_tokens`` by cutting out its middle.
+
+    The beginning (parties, subject) and the end (requests, dates) of a
+    context usually matter most, so two thirds of the budget go to the head
+    and one third to the tail.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(TRUNCATION_MARKER, model))
+    head_tokens = budget * 2 // 3
+    tail_tokens = budget - head_tokens
+    encoding = get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_tokens])
+        tail = encoding.decode(tokens[len(tokens) - tail_tokens:]) if tail_tokens else ""
+    else:
+        data = text.encode('utf-8')
+        # Partial multi-byte characters at the cuts are dropped
+        head = data[:head_tokens * 4].decode('utf-8', 'ignore')
+        tail = data[len(data) - tail_tokens * 4:].decode('utf-8', 'ignore') if tail_tokens else ""
+    # Cut at whitespace so that no half words are sent
+    head = head.rsplit(None, 1)[0] if ' ' in head.strip() else head
+    tail = tail.split(None, 1)[-1] if ' ' in tail.strip() else tail
+    return head.rstrip() + TRUNCATION_MARKER + tail.lstrip()
+
+
+class Usage:
+    """Prompt and completion tokens spent on one request, possibly over several calls."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def add_response(self, response: Any):
+        """Add the ``usage`` reported with an OpenAI response."""
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            self.add(getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {'prompt_tokens': self.prompt_tokens, 'completion_tokens': self.completion_tokens}
+
+
+def usage_fields(response: Dict[str, Any]) -> Dict[str, int]:
+    """``prompt_tokens``/``completion_tokens`` model fields for a LegalAI response.
+
+    Responses served from a cache carry no usage: the request spent no tokens.
+    """
+    usage = response.get('usage') or {}
+    return {
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': usage.get('completion_tokens', 0),
+    }
+
+
+def without_usage(response: Dict[str, Any]) -> Dict[str, Any]:
+    """``response`` as served to a caller that spent no tokens on it, e.g. a single-flight follower."""
+    return {key: value for key, value in response.items() if key != 'usage'}
+
+
+class TokenBudget:
+    """Chooses ``max_tokens`` and keeps prompts inside the context window.
+
+    ``window`` is the smallest context window of the models a request may
+    be sent to, so that a fallback model accepts the same prompt.
+    """
+
+    def __init__(self, model: str, window: Optional[int] = None):
+        self.model = model
+        self.window = window or context_window(model)
+        self.answer_min_tokens = getattr(settings, 'LEGAL_AI_ANSWER_MIN_TOKENS', 600)
+        self.answer_max_tokens = getattr(settings, 'LEGAL_AI_ANSWER_MAX_TOKENS', 2000)
+        self.answer_tokens_per_question_token = getattr(settings, 'LEGAL_AI_ANSWER_TOKENS_PER_QUESTION_TOKEN', 8)
+        self.document_max_tokens = getattr(settings, 'LEGAL_AI_DOCUMENT_MAX_TOKENS', {})
+        self.document_default_max_tokens = getattr(settings, 'LEGAL_AI_DOCUMENT_DEFAULT_MAX_TOKENS', 1500)
+        self.context_max_tokens = getattr(settings, 'LEGAL_AI_DOCUMENT_CONTEXT_MAX_TOKENS', 3000)
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def for_answer(self, question: str) -> int:
+        """``max_tokens`` for an answer: short questions get short answers."""
+        wanted = self.answer_min_tokens + self.count(question) * self.answer_tokens_per_question_token
+        return max(self.answer_min_tokens, min(self.answer_max_tokens, wanted))
+
+    def for_document(self, doc_type: str) -> int:
+        """``max_tokens`` for a document of ``doc_type``."""
+        return self.document_max_tokens.get(doc_type, self.document_default_max_tokens)
+
+    def trim_context(self, context: str) -> str:
+        """Cut a document context down to ``LEGAL_AI_DOCUMENT_CONTEXT_MAX_TOKENS``."""
+        trimmed = truncate_tokens(context, self.context_max_tokens, self.model)
+        if trimmed is not context:
+            logger.info(f"Document context truncated to {self.context_max_tokens} tokens.")
+        return trimmed
+
+    def fit(self, messages: List[Dict[str, str]], max_tokens: int,
+            trim_system: bool = False) -> Tuple[List[Dict[str, str]], int]:
+        """Make ``messages`` plus ``max_tokens`` fit the context window.
+
+        Keeping at least a quarter of the window for the reply, the prompt
+        is cut until it fits: first the conversation history between the
+        system message and the last (user) message, oldest turns first and
+        the summary last; then, with ``trim_system``, the middle of the
+        system message, where ``truncate_tokens`` cuts (the instructions at
+        its start and the passages at its end stay); only then the question
+        itself. Otherwise ``max_tokens`` shrinks to the space left by the
+        prompt.
+        """
+        prompt_tokens = count_message_tokens(messages, self.model)
+        if prompt_tokens + max_tokens <= self.window:
+            return messages, max_tokens
+        limit = self.window - min(max_tokens, self.window // 4)
+        if prompt_tokens > limit:
+            logger.warning(f"Prompt of {prompt_tokens} tokens cut down to fit the {self.window} token window.")
+            messages = self._drop_history(messages, limit)
+            positions = ([0] if trim_system and len(messages) > 1 else []) + [len(messages) - 1]
+            for position in positions:
+                excess = count_message_tokens(messages, self.model) - limit
+                if excess <= 0:
+                    break
+                message = messages[position]
+                keep = max(0, self.count(message['content']) - excess)
+                messages = messages[:position] + [
+                    {**message, 'content': truncate_tokens(message['content'], keep, self.model)}
+                ] + messages[position + 1:]
+            prompt_tokens = count_message_tokens(messages, self.model)
+        return messages, max(1, min(max_tokens, self.window - prompt_tokens))
+
+    def _drop_history(self, messages: List[Dict[str, str]], limit: int) -> List[Dict[str, str]]:
+        """Drop history messages until the prompt is within ``limit`` tokens: turns oldest first, then the summary."""
+        if len(messages) < 3:
+            return messages
+        first, history, last = messages[0], list(messages[1:-1]), messages[-1]
+        while history and count_message_tokens([first, *history, last], self.model) > limit:
+            turns = [index for index, message in enumerate(history) if message['role'] != 'system']
+            index = turns[0] if turns else 0
+            dropped = history.pop(index)
+            # An answer goes with its question
+            if dropped['role'] == 'user' and index < len(history) and history[index]['role'] == 'assistant':
+                history.pop(index)
+        return [first, *history, last]
@@ -6,5 +6,18 @@ app_name = 'legal_app'
 urlpatterns = [
     path('', views.home, name='home'),
     path('chat/', views.chat, name='chat'),
+    path('chat/stream/', views.chat_stream, name='chat_stream'),
+    path('chat/history/', views.question_history_page, name='question_history'),
+    path('search/', views.search, name='search'),
+    path('questions/<int:question_id>/', views.question_detail, name='question_detail'),
     path('document-generator/', views.document_generator, name='document_generator'),
+    path('document-jobs/<int:job_id>/', views.document_job_status, name='document_job_status'),
+    path('documents/history/', views.document_history_page, name='document_history'),
+    path('documents/<int:document_id>/download/', views.download_document, name='download_document'),
+    path('batches/', views.answer_batch_api, name='answer_batch'),
+    path('batches/<slug:batch_id>/', views.answer_batch_status, name='answer_batch_status'),
+    path('analytics/', views.analytics_dashboard, name='analytics'),
+    # ASGI-native variants; serve with an ASGI server (uvicorn/daphne) to benefit
+    path('async/chat/', views.chat_async, name='chat_async'),
+    path('async/document-generator/', views.document_generator_async, name='document_generator_async'),
 ]
@@ -1,42 +1,159 @@
+import asyncio
+import contextvars
 import json
 import logging
+import threading
 import time
-from typing import Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
-
-_OPENAI_AVAILABLE = True
-try:
-    # don't import OpenAI at module import time to avoid httpx/httpcore issues
-    from openai import OpenAI  # type: ignore
-except Exception:
-    OpenAI = None  # type: ignore
-    _OPENAI_AVAILABLE = False
+from .metrics import CACHE_LOOKUPS, stage
+from .classifier import CATEGORY_LABELS, UNKNOWN_CATEGORY, get_category_classifier, normalize_category
+from .document_templates import DocumentTemplate, Section, document_template_version, get_document_template
+from .knowledge import Passage, format_passages, get_knowledge_base
+from .providers import TASK_MODEL_SETTINGS, model_context_window, split_model, task_model
+from .resilience import STALE_RESPONSES, ResilientCaller
+from .response_cache import ResponseCache, make_cache_key, stable_digest
+from .scheduler import BACKGROUND, INTERACTIVE, current_priority
+from .semantic_cache import get_semantic_cache
+from .singleflight import get_single_flight
+from .text import normalize_text
+from .tokens import TokenBudget, Usage, count_message_tokens, without_usage
 
 logger = logging.getLogger(__name__)
 
+# Bounded pools shared by all LegalAI instances for fanning out upstream calls, one per priority
+_upstream_executors: Dict[str, ThreadPoolExecutor] = {}
+_upstream_executor_lock = threading.Lock()
+UPSTREAM_EXECUTOR_WORKERS = {
+    INTERACTIVE: 'LEGAL_AI_MAX_WORKERS',
+    BACKGROUND: 'LEGAL_AI_BACKGROUND_MAX_WORKERS',
+}
+
+
+class _ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """Runs tasks in the submitter's context, so scheduler attribution follows them."""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def get_upstream_executor(priority: Optional[str] = None) -> ThreadPoolExecutor:
+    """Return the process-wide thread pool for concurrent upstream calls of ``priority``.
+
+    Interactive and background calls get separate pools. The scheduler
+    serves waiting calls by priority, but a shared FIFO pool in front of it
+    would let background tasks waiting for a slot occupy every thread, and
+    chat requests would queue behind them. Without ``priority`` the one
+    ``scheduling`` set for the caller is used.
+    """
+    priority = priority or current_priority()
+    executor = _upstream_executors.get(priority)
+    if executor is None:
+        with _upstream_executor_lock:
+            executor = _upstream_executors.get(priority)
+            if executor is None:
+                default = 8 if priority == INTERACTIVE else 4
+                executor = _upstream_executors[priority] = _ContextThreadPoolExecutor(
+                    max_workers=getattr(settings, UPSTREAM_EXECUTOR_WORKERS[priority], default),
+                    thread_name_prefix=f'legal-ai-{priority}',
+                )
+    return executor
+
+
 class LegalAI:
+    """Answers, categories, documents and summaries, each from the model its task is routed to.
+
+    ``models`` maps a task to a ``provider:model`` spec (see ``providers``);
+    ``model``, the answer model, identifies cached answers.
+    """
+
     def __init__(self):
-        if not _OPENAI_AVAILABLE:
-            # postpone import error until first use
-            from openai import OpenAI as _OpenAI  # local import
-            self.client = _OpenAI(api_key=settings.OPENAI_API_KEY)
-        else:
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.cache_timeout = 3600  # 1 hour cache timeout
+        self.models = {task: task_model(task) for task in TASK_MODEL_SETTINGS}
+        self.model = self.models["answer"]
+        self.cache_timeout = getattr(settings, 'LEGAL_AI_CACHE_TIMEOUT', 3600)  # 1 hour by default
+        self.stale_cache_timeout = getattr(settings, 'LEGAL_AI_STALE_CACHE_TIMEOUT', 7 * 24 * 3600)
+        self.response_cache = ResponseCache(timeout=self.cache_timeout)
+        self.semantic_cache = get_semantic_cache()
+        self.single_flight = get_single_flight()
+        self.embedding_model = getattr(settings, 'LEGAL_AI_EMBEDDING_MODEL', 'text-embedding-ada-002')
+        self.concurrent_calls = getattr(settings, 'LEGAL_AI_CONCURRENT_CALLS', True)
+        self.answer_timeout = getattr(settings, 'LEGAL_AI_ANSWER_TIMEOUT', 60.0)
+        self.category_timeout = getattr(settings, 'LEGAL_AI_CATEGORY_TIMEOUT', 15.0)
+        self.classifier_threshold = getattr(settings, 'LEGAL_AI_CATEGORY_CLASSIFIER_THRESHOLD', 0.6)
+        self.knowledge_top_k = getattr(settings, 'LEGAL_AI_KNOWLEDGE_TOP_K', 4)
+        self.knowledge_max_tokens = getattr(settings, 'LEGAL_AI_KNOWLEDGE_MAX_TOKENS', 1500)
+        self.summary_max_tokens = getattr(settings, 'LEGAL_AI_CONVERSATION_SUMMARY_TOKENS', 400)
+        self.upstream = ResilientCaller()
+        # The prompt of a task must fit the smallest window of its model and the fallbacks
+        self.token_budgets = {
+            task: TokenBudget(
+                split_model(model)[1],
+                min(model_context_window(spec) for spec in [model, *self.upstream.fallback_models]),
+            )
+            for task, model in self.models.items()
+        }
+        self.token_budget = self.token_budgets["answer"]
 
     def _get_cached_response(self, cache_key: str) -> Any:
         """Retrieve a response from the cache."""
-        return cache.get(cache_key)
+        with stage("cache_lookup"):
+            response = self.response_cache.get(cache_key)
+        CACHE_LOOKUPS.inc(cache="response", result="hit" if response is not None else "miss")
+        return response
 
     def _cache_response(self, cache_key: str, response: Any):
-        """Store a response in the cache."""
-        cache.set(cache_key, response, self.cache_timeout)
+        """Store a response in the cache, plus a long-lived copy to serve while OpenAI is down."""
+        self.response_cache.set(cache_key, response)
+        self.response_cache.set(f"stale:{cache_key}", response, timeout=self.stale_cache_timeout)
+
+    def _get_stale_response(self, cache_key: str, kind: str) -> Any:
+        """Return the long-lived copy of an expired response, if any."""
+        try:
+            response = self.response_cache.peek(f"stale:{cache_key}")
+        except Exception as e:
+            logger.warning(f"Stale cache lookup failed: {e!r}")
+            return None
+        if response is not None:
+            STALE_RESPONSES.inc(kind=kind)
+            logger.warning(f"OpenAI unavailable, serving a stale {kind}.")
+        return response
+
+    def _response_cache_key(self, question: str, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Cache key for the legal response to ``question``, insensitive to case and spacing.
+
+        A follow-up in a conversation depends on the earlier turns, so they
+        are part of its key.
+        """
+        if history:
+            context = stable_digest(*(f"{m['role']}:{m['content']}" for m in history))
+            return make_cache_key("legal_response", normalize_text(question), context, model=self.model)
+        return make_cache_key("legal_response", normalize_text(question), model=self.model)
+
+    def _document_cache_key(self, doc_type: str, context: str) -> str:
+        """Cache key for a document generated from ``doc_type`` and ``context``."""
+        # Case is kept: names and figures in the context end up in the document
+        return make_cache_key(
+            "document", doc_type, document_template_version(doc_type), normalize_text(context, casefold=False),
+            model=self.models["document"],
+        )
 
-    def get_legal_response(self, question: str) -> Dict[str, Any]:
-        """Get a legal response to a user's question from OpenAI."""
+    def _section_cache_key(self, template: DocumentTemplate, section: Section, context: str) -> str:
+        """Cache key for one LLM-written section of a templated document."""
+        return make_cache_key(
+            "document_section", template.doc_type, template.version, section.key,
+            normalize_text(context, casefold=False), model=self.models["document"],
+        )
+
+    def get_legal_response(self, question: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Get a legal response to a user's question from OpenAI.
+
+        ``history`` holds the earlier turns of the conversation as chat
+        messages (see ``conversations.conversation_history``).
+        """
         start_time = time.time()
-        cache_key = f"legal_response_{hash(question)}"
+        cache_key = self._response_cache_key(question, history)
 
         # Check if response is cached
         cached_response = self._get_cached_response(cache_key)
@@ -44,39 +161,329 @@ class LegalAI:
             logger.info("Response found in cache.")
             return cached_response
 
+        # Check if a similar question was already answered
+        semantic_response, embedding = self._semantic_lookup(question, history)
+        if semantic_response:
+            self._cache_response(cache_key, semantic_response)
+            return semantic_response
+
         try:
-            # Generate the legal answer and its category
-            answer = self._get_openai_response(question, context_type="answer")
-            category = self._get_openai_response(question, context_type="category")
+            # Identical questions in flight at the same time share one upstream call
+            return self.single_flight.do(
+                cache_key,
+                lambda: self._generate_legal_response(question, cache_key, embedding, history),
+                lambda: self.response_cache.peek(cache_key),
+                without_usage,
+            )
+
+        except Exception as e:
+            logger.error(f"Error processing request: {e}", exc_info=True)
+            stale_response = self._get_stale_response(cache_key, "answer")
+            if stale_response:
+                return {**stale_response, "stale": True}
+            return self._handle_error(e, start_time)
 
-            # Format the legal response
-            formatted_response = self._format_response(answer, category)
+    def _generate_legal_response(self, question: str, cache_key: str, embedding: Optional[List[float]],
+                                 history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Ask the LLM for an answer (and category) and cache the formatted response.
+
+        The returned response also carries the tokens spent under ``usage``;
+        the cached copy does not, since serving it costs nothing.
+        """
+        usage = Usage()
+        passages = self._retrieve(question, embedding)
+        # The LLM is asked for the category only when the local classifier is not confident
+        category = self._classify_locally(question)
+        if category:
+            answer = self._get_openai_response(question, "answer", usage, passages, history)
+        elif self.concurrent_calls:
+            answer, category = self._get_answer_and_category(question, usage, passages, history)
+        else:
+            answer = self._get_openai_response(question, "answer", usage, passages, history)
+            category = self._get_llm_category(question, usage)
 
-            # Cache the result
+        # Format the legal response
+        formatted_response = self._format_response(answer, category)
+
+        # Cache the result; a missing category is retried on the next request
+        if category != UNKNOWN_CATEGORY:
             self._cache_response(cache_key, formatted_response)
+            self._semantic_remember(question, formatted_response, embedding)
             logger.info("Response successfully generated and cached.")
-            return formatted_response
+        return {**formatted_response, "usage": usage.as_dict()}
+
+    def _get_answer_and_category(self, question: str, usage: Optional[Usage] = None,
+                                 passages: Optional[List[Passage]] = None,
+                                 history: Optional[List[Dict[str, str]]] = None) -> Tuple[str, str]:
+        """Request the answer and the category in parallel and wait for both.
 
+        A failed or timed out category call degrades to ``UNKNOWN_CATEGORY``;
+        a failed answer call is re-raised. Each call gets what is left of its
+        timeout when a worker picks it up, so it ends (and frees its
+        scheduler slot) when the wait for it gives up.
+        """
+        executor = get_upstream_executor()
+        started = time.monotonic()
+        answer_deadline = started + self.answer_timeout
+        answer_future = executor.submit(
+            self._get_openai_response, question, "answer", usage, passages, history, answer_deadline
+        )
+        category_future = executor.submit(self._get_llm_category, question, usage, started + self.category_timeout)
+
+        try:
+            answer = answer_future.result(timeout=max(0.0, answer_deadline - time.monotonic()))
+        except Exception:
+            category_future.cancel()
+            raise
+
+        return answer, self._wait_for_category(category_future, started)
+
+    def _classify_locally(self, question: str) -> Optional[str]:
+        """Return the local classifier's category if it is confident enough, else None."""
+        classifier = get_category_classifier()
+        if classifier is None:
+            return None
+        try:
+            with stage("classify"):
+                category, confidence = classifier.predict(question)
         except Exception as e:
-            logger.error(f"Error processing request: {e}", exc_info=True)
-            return self._handle_error(e, start_time)
+            logger.warning(f"Category classifier failed: {e!r}")
+            return None
+        if confidence < self.classifier_threshold:
+            logger.info(f"Classifier unsure ({category}, {confidence:.2f}), asking the LLM.")
+            return None
+        return category
+
+    def _get_llm_category(self, question: str, usage: Optional[Usage] = None,
+                          deadline: Optional[float] = None) -> str:
+        """Ask the LLM for the category and map the reply onto a canonical label."""
+        return normalize_category(
+            self._get_openai_response(question, context_type="category", usage=usage, deadline=deadline)
+        )
+
+    def _wait_for_category(self, category_future: Future, started: float) -> str:
+        """Wait for a category call submitted at ``started``, degrading to ``UNKNOWN_CATEGORY``."""
+        remaining = max(0.0, self.category_timeout - (time.monotonic() - started))
+        try:
+            return category_future.result(timeout=remaining)
+        except Exception as e:
+            category_future.cancel()
+            logger.warning(f"Category request failed, using '{UNKNOWN_CATEGORY}': {e!r}")
+            return UNKNOWN_CATEGORY
+
+    def stream_legal_response(self, question: str,
+                              history: Optional[List[Dict[str, str]]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream a legal response as events.
+
+        Yields ``{"type": "token", "text": ...}`` for every answer chunk received
+        from OpenAI, then a single ``{"type": "done", ...}`` event carrying the
+        formatted response (or ``{"type": "error", ...}``). The complete answer
+        is cached once the stream finishes.
+        """
+        start_time = time.time()
+        cache_key = self._response_cache_key(question, history)
+
+        cached_response = self._get_cached_response(cache_key)
+        if cached_response:
+            logger.info("Response found in cache.")
+            yield {"type": "token", "text": cached_response["answer"]}
+            yield {"type": "done", **cached_response}
+            return
+
+        semantic_response, embedding = self._semantic_lookup(question, history)
+        if semantic_response:
+            self._cache_response(cache_key, semantic_response)
+            yield {"type": "token", "text": semantic_response["answer"]}
+            yield {"type": "done", **semantic_response}
+            return
+
+        # The category is short, so it is resolved while the answer streams
+        started = time.monotonic()
+        category = self._classify_locally(question)
+        usage = Usage()
+        category_future = None if category else get_upstream_executor().submit(
+            self._get_llm_category, question, usage, started + self.category_timeout
+        )
+        chunks = []
+        try:
+            # Only opening the stream is retried (and timed, up to the first byte);
+            # once tokens were sent to the client the answer cannot restart
+            kwargs = self._build_completion_kwargs(question, "answer", self._retrieve(question, embedding), history)
+            # The slot of the model that answered is held until the stream ends,
+            # not only while it opens
+            with self.upstream.call("answer_stream", "chat", {**kwargs, "stream": True}, hold=True) as stream:
+                for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        chunks.append(text)
+                        yield {"type": "token", "text": text}
+        except Exception as e:
+            if category_future is not None:
+                category_future.cancel()
+            logger.error(f"Error streaming response: {e}", exc_info=True)
+            stale_response = None if chunks else self._get_stale_response(cache_key, "answer")
+            if stale_response:
+                yield {"type": "token", "text": stale_response["answer"]}
+                yield {"type": "done", **stale_response, "stale": True}
+                return
+            yield {"type": "error", **self._handle_error(e, start_time)}
+            return
 
-    def _get_openai_response(self, question: str, context_type: str) -> str:
-        """Get a legal answer or category from OpenAI."""
+        if category_future is not None:
+            category = self._wait_for_category(category_future, started)
+        formatted_response = self._format_response("".join(chunks).strip(), category)
+        # Streamed responses report no usage, so the tokens are counted locally
+        usage.add(
+            count_message_tokens(kwargs["messages"], self.token_budget.model),
+            self.token_budget.count(formatted_response["answer"]),
+        )
+        if category != UNKNOWN_CATEGORY:
+            self._cache_response(cache_key, formatted_response)
+            self._semantic_remember(question, formatted_response, embedding)
+            logger.info("Streamed response successfully generated and cached.")
+        yield {"type": "done", **formatted_response, "usage": usage.as_dict()}
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed normalized ``texts`` with the configured embedding model."""
+        # No fallback model: vectors of different models are not comparable
+        response = self.upstream.call("embedding", "embeddings", {
+            "model": self.embedding_model,
+            "input": [normalize_text(text) for text in texts],
+            "timeout": self.category_timeout,
+        }, fallback=False)
+        return [item.embedding for item in response.data]
+
+    def _semantic_lookup(self, question: str, history: Optional[List[Dict[str, str]]] = None
+                         ) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        """Look for an already answered question similar to ``question``.
+
+        Returns the formatted response on a hit (or None) and the question's
+        embedding so that a fresh answer can be added to the index.
+        Follow-ups in a conversation are neither looked up nor added: their
+        meaning depends on the earlier turns.
+        """
+        if self.semantic_cache is None or history:
+            return None, None
+        try:
+            embedding = self.embed([question])[0]
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup skipped: {e!r}")
+            return None, None
+
+        with stage("semantic_lookup"):
+            match = self.semantic_cache.lookup(embedding)
+        CACHE_LOOKUPS.inc(cache="semantic", result="hit" if match is not None else "miss")
+        if match is None:
+            return None, embedding
+        logger.info(f"Response found in semantic cache (similarity {match['similarity']:.3f}).")
+        return self._format_response(match["answer"], match["category"]), embedding
+
+    def _semantic_remember(self, question: str, response: Dict[str, Any], embedding: Optional[List[float]]):
+        """Add a freshly answered question to the semantic cache."""
+        if self.semantic_cache is None or embedding is None:
+            return
+        self.semantic_cache.add(embedding, {
+            "question": question,
+            "answer": response["answer"],
+            "category": response["category"],
+        })
+
+    def _retrieve(self, question: str, embedding: Optional[List[float]] = None) -> List[Passage]:
+        """Statute passages relevant to ``question`` from the local knowledge base, if one is indexed."""
+        knowledge_base = get_knowledge_base(self.embedding_model)
+        if knowledge_base is None:
+            return []
+        try:
+            with stage("retrieval"):
+                return knowledge_base.retrieve(question, self.knowledge_top_k, embedding)
+        except Exception as e:
+            logger.warning(f"Knowledge base retrieval skipped: {e!r}")
+            return []
+
+    def _build_completion_kwargs(self, question: str, context_type: str, passages: Optional[List[Passage]] = None,
+                                 history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Build the chat completion request for a legal answer or category.
+
+        Retrieved ``passages`` are added to the answer's system message so
+        that the answer cites them instead of hedging from memory; the
+        conversation's ``history`` goes between it and the question.
+        ``max_tokens`` grows with the question and the prompt is fitted to the
+        context window. ``timeout`` is the budget for the call including
+        retries, see ``ResilientCaller``.
+        """
         if context_type == "answer":
             system_message = "You are a legal assistant providing accurate and relevant legal information under Russian law."
+            provisions = format_passages(passages or [], self.knowledge_max_tokens)
+            if provisions:
+                system_message += (
+                    " Base the answer on the provisions below where they apply, cite them by act and article,"
+                    " and be concise.\n\n" + provisions
+                )
         else:
-            system_message = "Determine the category of this legal question (e.g., civil law, criminal law, administrative law)."
+            system_message = (
+                "Determine the category of this legal question. "
+                f"Reply with exactly one of: {', '.join(CATEGORY_LABELS)}."
+            )
 
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
+        budget = self.token_budgets[context_type]
+        messages, max_tokens = budget.fit(
+            [
                 {"role": "system", "content": system_message},
+                *(history or []),
                 {"role": "user", "content": question},
             ],
-            temperature=0.5 if context_type == "answer" else 0.3,
-            max_tokens=2000 if context_type == "answer" else 100,
+            budget.for_answer(question) if context_type == "answer" else 100,
+            trim_system=context_type == "answer",
         )
+        return {
+            "model": self.models[context_type],
+            "messages": messages,
+            "temperature": 0.5 if context_type == "answer" else 0.3,
+            "max_tokens": max_tokens,
+            "timeout": self.answer_timeout if context_type == "answer" else self.category_timeout,
+        }
+
+    def _get_openai_response(self, question: str, context_type: str, usage: Optional[Usage] = None,
+                             passages: Optional[List[Passage]] = None,
+                             history: Optional[List[Dict[str, str]]] = None,
+                             deadline: Optional[float] = None) -> str:
+        """Get a legal answer or category from OpenAI, adding the tokens spent to ``usage``.
+
+        With a ``deadline`` (``time.monotonic()``), the time left until then
+        replaces the call's timeout.
+        """
+        kwargs = self._build_completion_kwargs(question, context_type, passages, history)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No time left for the {context_type} call.")
+            kwargs["timeout"] = remaining
+        response = self.upstream.call(context_type, "chat", kwargs)
+        if usage is not None:
+            usage.add_response(response)
+        return response.choices[0].message.content.strip()
+
+    def summarize_conversation(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Fold ``turns`` (question, answer) into the running ``summary`` of a conversation."""
+        exchanges = "\n\n".join(f"Вопрос: {question}\nОтвет: {answer}" for question, answer in turns)
+        messages, max_tokens = self.token_budgets["summary"].fit(
+            [
+                {"role": "system", "content": (
+                    "You maintain the running summary of a legal consultation. Update the summary with the new "
+                    "exchanges. Keep the facts, parties, dates, amounts, documents and legal conclusions; "
+                    "drop everything else. Reply with the updated summary only, in Russian."
+                )},
+                {"role": "user", "content": f"Current summary:\n{summary or '-'}\n\nNew exchanges:\n{exchanges}"},
+            ],
+            self.summary_max_tokens,
+        )
+        response = self.upstream.call("summary", "chat", {
+            "model": self.models["summary"],
+            "messages": messages,
+            "temperature": 0.2,
+            "max_tokens": max_tokens,
+            "timeout": self.answer_timeout,
+        })
         return response.choices[0].message.content.strip()
 
     def _format_response(self, answer: str, category: str) -> Dict[str, Any]:
@@ -98,10 +505,13 @@ class LegalAI:
             "processing_time": elapsed_time,
         }
 
-    def generate_document(self, doc_type: str, context: str) -> str:
-        """Generate a legal document based on the given context."""
+    def generate_document(self, doc_type: str, context: str, raise_errors: bool = False) -> str:
+        """Generate a legal document based on the given context.
+
+        Errors are returned as the document text unless ``raise_errors`` is set.
+        """
         # Cache key based on document type and context (now plain text)
-        cache_key = f"document_{hash(doc_type)}_{hash(context)}"
+        cache_key = self._document_cache_key(doc_type, context)
 
         # Check if the document is cached
         cached_document = self._get_cached_response(cache_key)
@@ -110,33 +520,291 @@ class LegalAI:
             return cached_document
 
         try:
-            # Generate document content using OpenAI
-            document_content = self._generate_document_content(doc_type, context)
-
-            # Cache the document content
-            self._cache_response(cache_key, document_content)
-            logger.info("Document successfully generated and cached.")
-            return document_content
+            # Generate document content using OpenAI, once for identical requests in flight
+            return self.single_flight.do(
+                cache_key,
+                lambda: self._generate_and_cache_document(doc_type, context, cache_key),
+                lambda: self.response_cache.peek(cache_key),
+            )
 
         except Exception as e:
             logger.error(f"Error generating document: {e}", exc_info=True)
+            stale_document = self._get_stale_response(cache_key, "document")
+            if stale_document:
+                return stale_document
+            if raise_errors:
+                raise
             return f"Error generating document: {str(e)}"
 
-    def _generate_document_content(self, doc_type: str, context: str) -> str:
-        """Generate a legal document using OpenAI based on the context."""
+    def _generate_and_cache_document(self, doc_type: str, context: str, cache_key: str) -> str:
+        document_content = self._generate_document_content(doc_type, context)
+        self._cache_response(cache_key, document_content)
+        logger.info("Document successfully generated and cached.")
+        return document_content
+
+    def _build_document_kwargs(self, doc_type: str, context: str) -> Dict[str, Any]:
+        """Build the chat completion request for a legal document.
+
+        Oversized contexts are truncated and ``max_tokens`` depends on ``doc_type``.
+        """
+        budget = self.token_budgets["document"]
         prompt = f"Create a {doc_type} based on the following details:\n"
-        prompt += context  # Now it's plain text instead of JSON
+        prompt += budget.trim_context(context)  # Now it's plain text instead of JSON
 
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
+        messages, max_tokens = budget.fit(
+            [
                 {
                     "role": "system",
                     "content": "You are a legal assistant. Create a legal document based on the provided template and details.",
                 },
                 {"role": "user", "content": prompt},
             ],
-            temperature=0.5,
-            max_tokens=2000,
+            budget.for_document(doc_type),
+        )
+        return {
+            "model": self.models["document"],
+            "messages": messages,
+            "temperature": 0.5,
+            "max_tokens": max_tokens,
+        }
+
+    def _generate_document_content(self, doc_type: str, context: str) -> str:
+        """Generate a legal document using OpenAI based on the context."""
+        template = get_document_template(doc_type)
+        if template is not None:
+            return self._assemble_document(template, context)
+        response = self.upstream.call(
+            "document", "chat", self._build_document_kwargs(doc_type, context)
         )
         return response.choices[0].message.content.strip()
+
+    def _build_section_kwargs(self, template: DocumentTemplate, section: Section, context: str) -> Dict[str, Any]:
+        """Build the chat completion request for one variable section of a templated document."""
+        budget = self.token_budgets["document"]
+        messages, max_tokens = budget.fit(
+            [
+                {
+                    "role": "system",
+                    "content": (
+                        f"You are a legal assistant drafting a document of type «{template.name}» under Russian law. "
+                        f"Write only this part of it, in Russian: {section.instruction}. "
+                        "Do not add a heading, other sections, addresses, dates or signatures."
+                    ),
+                },
+                {"role": "user", "content": budget.trim_context(context)},
+            ],
+            section.max_tokens,
+        )
+        return {
+            "model": self.models["document"],
+            "messages": messages,
+            "temperature": 0.5,
+            "max_tokens": max_tokens,
+        }
+
+    def _generate_section(self, template: DocumentTemplate, section: Section, context: str) -> str:
+        response = self.upstream.call(
+            "document_section", "chat", self._build_section_kwargs(template, section, context),
+        )
+        return response.choices[0].message.content.strip()
+
+    def _missing_sections(self, template: DocumentTemplate, context: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Split the variable sections into cached fragments and the cache keys of missing ones."""
+        keys = {section.key: self._section_cache_key(template, section, context) for section in template.variable_sections}
+        cached = self.response_cache.peek_many(list(keys.values()))
+        fragments = {key: cached[cache_key] for key, cache_key in keys.items() if cache_key in cached}
+        return fragments, {key: cache_key for key, cache_key in keys.items() if key not in fragments}
+
+    def _assemble_document(self, template: DocumentTemplate, context: str) -> str:
+        """Fill the variable sections of ``template`` and join them with its fixed text.
+
+        Sections are requested in parallel and cached one by one, so a
+        failure only repeats the sections that are still missing.
+        """
+        fragments, missing = self._missing_sections(template, context)
+        sections = {section.key: section for section in template.variable_sections}
+        executor = get_upstream_executor(BACKGROUND)
+        futures = {
+            key: executor.submit(self._generate_section, template, sections[key], context) for key in missing
+        }
+        generated, error = {}, None
+        for key, future in futures.items():
+            try:
+                generated[key] = future.result()
+            except Exception as e:
+                error = error or e
+        if generated:
+            self.response_cache.set_many({missing[key]: text for key, text in generated.items()})
+        if error is not None:
+            raise error
+        logger.info(f"Document assembled from {len(template.sections)} sections, {len(generated)} generated.")
+        return template.assemble({**fragments, **generated})
+
+
+class AsyncLegalAI(LegalAI):
+    """asyncio counterpart of LegalAI for ASGI views.
+
+    Upstream calls go through the providers' async clients, whose connection
+    pools are shared by all requests on the event loop, so an in-flight request
+    holds a socket rather than a worker thread. Prompts, caching and formatting
+    are inherited from LegalAI.
+    """
+
+    async def aget_legal_response(self, question: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Async version of ``get_legal_response``."""
+        start_time = time.time()
+        cache_key = self._response_cache_key(question, history)
+
+        cached_response = await sync_to_async(self._get_cached_response, thread_sensitive=False)(cache_key)
+        if cached_response:
+            logger.info("Response found in cache.")
+            return cached_response
+
+        semantic_response, embedding = await sync_to_async(self._semantic_lookup, thread_sensitive=False)(question, history)
+        if semantic_response:
+            await sync_to_async(self._cache_response, thread_sensitive=False)(cache_key, semantic_response)
+            return semantic_response
+
+        try:
+            return await self.single_flight.ado(
+                cache_key,
+                lambda: self._agenerate_legal_response(question, cache_key, embedding, history),
+                lambda: self.response_cache.peek(cache_key),
+                without_usage,
+            )
+
+        except Exception as e:
+            logger.error(f"Error processing request: {e}", exc_info=True)
+            stale_response = await sync_to_async(self._get_stale_response, thread_sensitive=False)(cache_key, "answer")
+            if stale_response:
+                return {**stale_response, "stale": True}
+            return self._handle_error(e, start_time)
+
+    async def _agenerate_legal_response(self, question: str, cache_key: str, embedding: Optional[List[float]],
+                                        history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Async version of ``_generate_legal_response``."""
+        usage = Usage()
+        passages = await sync_to_async(self._retrieve, thread_sensitive=False)(question, embedding)
+        answer, category = await asyncio.gather(
+            asyncio.wait_for(self._aget_openai_response(question, "answer", usage, passages, history), self.answer_timeout),
+            self._aget_category(question, usage),
+        )
+        formatted_response = self._format_response(answer, category)
+
+        if category != UNKNOWN_CATEGORY:
+            await sync_to_async(self._cache_response, thread_sensitive=False)(cache_key, formatted_response)
+            await sync_to_async(self._semantic_remember, thread_sensitive=False)(question, formatted_response, embedding)
+            logger.info("Response successfully generated and cached.")
+        return {**formatted_response, "usage": usage.as_dict()}
+
+    async def _aget_category(self, question: str, usage: Optional[Usage] = None) -> str:
+        """Classify locally or request the category, degrading to ``UNKNOWN_CATEGORY`` on failure or timeout."""
+        category = self._classify_locally(question)
+        if category:
+            return category
+        try:
+            reply = await asyncio.wait_for(self._aget_openai_response(question, "category", usage), self.category_timeout)
+            return normalize_category(reply)
+        except Exception as e:
+            logger.warning(f"Category request failed, using '{UNKNOWN_CATEGORY}': {e!r}")
+            return UNKNOWN_CATEGORY
+
+    async def _aget_openai_response(self, question: str, context_type: str, usage: Optional[Usage] = None,
+                                    passages: Optional[List[Passage]] = None,
+                                    history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Async version of ``_get_openai_response``."""
+        response = await self.upstream.acall(
+            context_type, "chat", self._build_completion_kwargs(question, context_type, passages, history),
+        )
+        if usage is not None:
+            usage.add_response(response)
+        return response.choices[0].message.content.strip()
+
+    async def agenerate_document(self, doc_type: str, context: str) -> str:
+        """Async version of ``generate_document``."""
+        cache_key = self._document_cache_key(doc_type, context)
+
+        cached_document = await sync_to_async(self._get_cached_response, thread_sensitive=False)(cache_key)
+        if cached_document:
+            logger.info("Document found in cache.")
+            return cached_document
+
+        try:
+            return await self.single_flight.ado(
+                cache_key,
+                lambda: self._agenerate_and_cache_document(doc_type, context, cache_key),
+                lambda: self.response_cache.peek(cache_key),
+            )
+
+        except Exception as e:
+            logger.error(f"Error generating document: {e}", exc_info=True)
+            stale_document = await sync_to_async(self._get_stale_response, thread_sensitive=False)(cache_key, "document")
+            if stale_document:
+                return stale_document
+            return f"Error generating document: {str(e)}"
+
+    async def _agenerate_and_cache_document(self, doc_type: str, context: str, cache_key: str) -> str:
+        template = get_document_template(doc_type)
+        if template is not None:
+            document_content = await self._aassemble_document(template, context)
+        else:
+            response = await self.upstream.acall(
+                "document", "chat", self._build_document_kwargs(doc_type, context)
+            )
+            document_content = response.choices[0].message.content.strip()
+
+        await sync_to_async(self._cache_response, thread_sensitive=False)(cache_key, document_content)
+        logger.info("Document successfully generated and cached.")
+        return document_content
+
+    async def _agenerate_section(self, template: DocumentTemplate, section: Section, context: str) -> str:
+        response = await self.upstream.acall(
+            "document_section", "chat", self._build_section_kwargs(template, section, context),
+        )
+        return response.choices[0].message.content.strip()
+
+    async def _aassemble_document(self, template: DocumentTemplate, context: str) -> str:
+        """Async version of ``_assemble_document``."""
+        fragments, missing = await sync_to_async(self._missing_sections, thread_sensitive=False)(template, context)
+        sections = {section.key: section for section in template.variable_sections}
+        results = await asyncio.gather(
+            *(self._agenerate_section(template, sections[key], context) for key in missing),
+            return_exceptions=True,
+        )
+        generated = {key: text for key, text in zip(missing, results) if not isinstance(text, BaseException)}
+        if generated:
+            await sync_to_async(self.response_cache.set_many, thread_sensitive=False)(
+                {missing[key]: text for key, text in generated.items()}
+            )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return template.assemble({**fragments, **generated})
+
+
+# Process-wide LegalAI instances, created lazily
+legal_ai = None
+def get_legal_ai() -> LegalAI:
+    global legal_ai
+    if legal_ai is None:
+        legal_ai = LegalAI()
+        _warm_up_once(legal_ai)
+    return legal_ai
+
+async_legal_ai = None
+def get_async_legal_ai() -> AsyncLegalAI:
+    global async_legal_ai
+    if async_legal_ai is None:
+        async_legal_ai = AsyncLegalAI()
+        _warm_up_once(async_legal_ai)
+    return async_legal_ai
+
+_warmed_up = False
+def _warm_up_once(ai: LegalAI):
+    """Preload the shared response cache when the first instance of the process is created."""
+    global _warmed_up
+    if _warmed_up or not getattr(settings, 'LEGAL_AI_WARMUP_ON_STARTUP', False):
+        return
+    _warmed_up = True
+    from .warmup import warm_up_in_background
+    warm_up_in_background(ai)
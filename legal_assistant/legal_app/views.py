@@ -1,29 +1,41 @@
 # legal_app/views.py
 from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.views.decorators.http import require_http_methods
 from django.core.exceptions import ValidationError
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.core.validators import validate_ipv46_address
+from django_ratelimit.core import is_ratelimited
+from django_ratelimit import ALL
 from django_ratelimit.decorators import ratelimit
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db.models.functions import Substr
+from asgiref.sync import sync_to_async
 from .forms import LegalQuestionForm, DocumentGeneratorForm
-from .models import LegalQuestion, Document  # Ensure Document is imported
-from .utils import LegalAI
+from .models import Conversation, LegalQuestion, Document, DocumentJob
+from .analytics import dashboard
+from .conversations import conversation_history, get_conversation, record_turn
+from .jobs import enqueue_document_job
+from .batch import batch_checkpoint, submit_batch
+from .downloads import request_document_pdf, serve_document_file
+from .rendering import PDF_CONTENT_TYPE, pdf_converter
+from .scheduler import scheduling
+from .pagination import keyset_page
+from .search import search_documents, search_questions
+from .tokens import usage_fields
+from .utils import get_async_legal_ai, get_legal_ai
+from .metrics import REGISTRY, stage, upstream_error_rate
+import hmac
 import logging
 import json
+import time
 from functools import wraps
-from docx import Document as DocxDocument
-from typing import Dict, Any
-
-# Initialize LegalAI instance lazily and logger
-legal_ai = None
-def get_legal_ai():
-    global legal_ai
-    if legal_ai is None:
-        legal_ai = LegalAI()
-    return legal_ai
+from typing import Dict, Any, Iterator, Optional
+
 logger = logging.getLogger(__name__)
 
 def format_russian_response(data: Dict[str, Any], status: int = 200) -> JsonResponse:
@@ -76,83 +88,535 @@ def chat(request):
         if getattr(request, 'limited', False):
             return format_russian_response({'status': 'error', 'message': 'Превышен лимит запросов. Подождите минуту.'}, 429)
         
+        started = time.monotonic()
         form = LegalQuestionForm(request.POST)
-        if form.is_valid():
+        with stage("form_validation"):
+            is_valid = form.is_valid()
+        if is_valid:
             question = form.cleaned_data['question']
             user_ip = get_client_ip(request)
+            conversation = get_conversation(request.user, request.POST.get('conversation'))
             
-            response = get_legal_ai().get_legal_response(question)
+            with scheduling(request.user):
+                response = get_legal_ai().get_legal_response(question, conversation_history(conversation))
             if response.get('status') == 'success':
-                legal_question = LegalQuestion.objects.create(
-                    user=request.user,
-                    question=question,
-                    answer=response['answer'],
-                    category=response['category'],
-                    ip_address=user_ip,
-                    status='answered'
-                )
+                with stage("orm_write"):
+                    legal_question, conversation = record_turn(
+                        request.user,
+                        conversation,
+                        question,
+                        answer=response['answer'],
+                        category=response['category'],
+                        ip_address=user_ip,
+                        status='answered',
+                        processing_time=time.monotonic() - started,
+                        **usage_fields(response),
+                    )
                 return format_russian_response({
                     'status': 'success',
                     'answer': response['answer'],
                     'category': response['category'],
-                    'question_id': legal_question.id
+                    'question_id': legal_question.id,
+                    'conversation_id': conversation.id,
                 })
             else:
                 return format_russian_response({'status': 'error', 'message': 'Не удалось получить ответ от AI.'}, 500)
         
         return format_russian_response({'status': 'error', 'errors': form.errors}, 400)
 
-    # GET request: display form and question history
-    questions = LegalQuestion.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'legal_app/chat.html', {'form': LegalQuestionForm(), 'questions': questions})
+    # GET request: display form and the first page of question history
+    questions, next_cursor = keyset_page(question_history(request.user), None, history_page_size(request))
+    return render(request, 'legal_app/chat.html', {
+        'form': LegalQuestionForm(),
+        'questions': questions,
+        'next_cursor': next_cursor,
+    })
+
+def history_page_size(request) -> int:
+    """Page size from ``?limit=``, bounded by HISTORY_MAX_PAGE_SIZE."""
+    default = getattr(settings, 'HISTORY_PAGE_SIZE', 20)
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, getattr(settings, 'HISTORY_MAX_PAGE_SIZE', 100)))
+
+def question_history(user):
+    """Question list rows: a title cut in the database instead of the full question and answer."""
+    return (
+        LegalQuestion.objects.filter(user=user)
+        .only('id', 'category', 'status', 'created_at')
+        .annotate(title=Substr('question', 1, getattr(settings, 'HISTORY_TITLE_LENGTH', 120)))
+    )
+
+def document_history(user):
+    """Document list rows without the generated text."""
+    return Document.objects.filter(user=user).only('id', 'title', 'document_type', 'file', 'created_at')
+
+def question_summary(question: LegalQuestion) -> Dict[str, Any]:
+    if hasattr(question, 'title'):
+        title = question.title  # cut by question_history()
+    else:
+        title = question.question[:getattr(settings, 'HISTORY_TITLE_LENGTH', 120)]
+    return {
+        'id': question.id,
+        'title': title,
+        'category': question.category,
+        'status': question.status,
+        'created_at': question.created_at.isoformat(),
+        'detail_url': reverse('legal_app:question_detail', args=[question.id]),
+    }
+
+def document_summary(document: Document) -> Dict[str, Any]:
+    return {
+        'id': document.id,
+        'title': document.title,
+        'document_type': document.document_type,
+        'created_at': document.created_at.isoformat(),
+        'download_url': reverse('legal_app:download_document', args=[document.id]) if document.file else None,
+    }
+
+@login_required
+@require_http_methods(["GET"])
+@handle_errors
+def question_history_page(request):
+    """Next page of question history for infinite scroll (``?cursor=``)."""
+    questions, next_cursor = keyset_page(
+        question_history(request.user), request.GET.get('cursor'), history_page_size(request)
+    )
+    return format_russian_response({
+        'status': 'success',
+        'items': [question_summary(q) for q in questions],
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+@require_http_methods(["GET"])
+@ratelimit(key='user', rate='60/m', group='legal_search')
+@handle_errors
+def search(request):
+    """Ranked full-text search over the user's questions or documents (``?q=&scope=``)."""
+    if getattr(request, 'limited', False):
+        return format_russian_response({'status': 'error', 'message': 'Превышен лимит запросов. Подождите минуту.'}, 429)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return format_russian_response({'status': 'error', 'message': 'Введите поисковый запрос.'}, 400)
+    scope = request.GET.get('scope', 'questions')
+    if scope not in ('questions', 'documents'):
+        raise ValidationError("Unknown search scope.")
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError:
+        raise ValidationError("Invalid offset.")
+    limit = history_page_size(request)
+
+    if scope == 'questions':
+        items = [question_summary(q) for q in search_questions(query, request.user, limit, offset)]
+    else:
+        items = [document_summary(d) for d in search_documents(query, request.user, limit, offset)]
+    return format_russian_response({
+        'status': 'success',
+        'items': items,
+        'next_offset': offset + limit if len(items) == limit else None,
+    })
+
+@login_required
+@require_http_methods(["GET"])
+@handle_errors
+def question_detail(request, question_id):
+    """Full question and answer, loaded on demand from the history list."""
+    question = get_object_or_404(LegalQuestion, id=question_id, user=request.user)
+    return format_russian_response({
+        'status': 'success',
+        'id': question.id,
+        'question': question.question,
+        'answer': question.answer,
+        'category': question.category,
+        'conversation_id': question.conversation_id,
+        'created_at': question.created_at.isoformat(),
+    })
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event as a Server-Sent Events message."""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+def _stream_chat_events(events: Iterator[Dict[str, Any]], user, question: str, user_ip: str,
+                        started: float, conversation: Optional[Conversation] = None) -> Iterator[str]:
+    """Relay LegalAI stream events and persist the question once the answer is complete."""
+    try:
+        # The stream is consumed after the view returned, so its upstream calls are attributed here
+        with scheduling(user):
+            for event in events:
+                if event['type'] == 'done':
+                    with stage("orm_write"):
+                        legal_question, conversation = record_turn(
+                            user,
+                            conversation,
+                            question,
+                            answer=event['answer'],
+                            category=event['category'],
+                            ip_address=user_ip,
+                            status='answered',
+                            processing_time=time.monotonic() - started,
+                            **usage_fields(event),
+                        )
+                    event = {
+                        'type': 'done',
+                        'status': 'success',
+                        'answer': event['answer'],
+                        'category': event['category'],
+                        'question_id': legal_question.id,
+                        'conversation_id': conversation.id,
+                    }
+                elif event['type'] == 'error':
+                    event = {'type': 'error', 'status': 'error', 'message': 'Не удалось получить ответ от AI.'}
+                yield format_sse(event)
+    except Exception as e:
+        logger.error(f"Error while streaming chat response: {str(e)}", exc_info=True)
+        yield format_sse({'type': 'error', 'status': 'error', 'message': 'Произошла внутренняя ошибка сервера.'})
+
+@login_required
+@require_http_methods(["POST"])
+@ratelimit(key='user', rate='10/m', group='legal_chat')
+@handle_errors
+def chat_stream(request):
+    """Stream the answer to a legal question as Server-Sent Events."""
+    if getattr(request, 'limited', False):
+        return format_russian_response({'status': 'error', 'message': 'Превышен лимит запросов. Подождите минуту.'}, 429)
+
+    started = time.monotonic()
+    form = LegalQuestionForm(request.POST)
+    with stage("form_validation"):
+        is_valid = form.is_valid()
+    if not is_valid:
+        return format_russian_response({'status': 'error', 'errors': form.errors}, 400)
+
+    question = form.cleaned_data['question']
+    conversation = get_conversation(request.user, request.POST.get('conversation'))
+    events = get_legal_ai().stream_legal_response(question, conversation_history(conversation))
+    response = StreamingHttpResponse(
+        _stream_chat_events(events, request.user, question, get_client_ip(request), started, conversation),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable proxy buffering (nginx)
+    return response
+
+def document_job_payload(job: DocumentJob) -> Dict[str, Any]:
+    """Describe a document job for status polling."""
+    payload = {
+        'status': 'success',
+        'job_id': job.id,
+        'job_status': job.status,
+        'status_url': reverse('legal_app:document_job_status', args=[job.id]),
+    }
+    if job.status == 'done' and job.document_id:
+        payload['document_id'] = job.document_id
+        payload['download_url'] = reverse('legal_app:download_document', args=[job.document_id])
+    elif job.status == 'failed':
+        payload['message'] = 'Ошибка при генерации документа.'
+    return payload
 
 @login_required
 @require_http_methods(["GET", "POST"])
+@ratelimit(key='user', rate='5/m', group='legal_documents', method='POST', block=False)
 @handle_errors
 def document_generator(request):
-    """Generate legal documents dynamically."""
+    """Queue legal document generation and display the document history."""
     if request.method == 'POST':
+        if getattr(request, 'limited', False):
+            return format_russian_response({'status': 'error', 'message': 'Превышен лимит запросов. Подождите минуту.'}, 429)
         form = DocumentGeneratorForm(request.POST)
         if form.is_valid():
-            try:
-                doc_type = form.cleaned_data['document_type']
-                title = form.cleaned_data['title']
-                context = form.cleaned_data['context']  # Direct plain text context
-                
-                # Generate document using LegalAI
-                generated_content = get_legal_ai().generate_document(doc_type, context)
-                
-                # Create Word document
-                document = DocxDocument()
-                document.add_heading(title, 0)
-                for paragraph in generated_content.split("\n"):
-                    document.add_paragraph(paragraph)
-                
-                # Prepare document for download
-                response = HttpResponse(
-                    content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                )
-                response['Content-Disposition'] = f'attachment; filename="{title}.docx"'
-                document.save(response)
-                
-                logger.info(f"Document '{title}' generated successfully.")
-                return response
-            
-            except Exception as e:
-                logger.error(f"Error generating document: {str(e)}", exc_info=True)
-                return format_russian_response({'status': 'error', 'message': 'Ошибка при генерации документа.'}, 500)
-        
+            job = enqueue_document_job(
+                request.user,
+                form.cleaned_data['document_type'],
+                form.cleaned_data['title'],
+                form.cleaned_data['context'],  # Direct plain text context
+            )
+            return format_russian_response(document_job_payload(job), 202)
+
         return format_russian_response({'status': 'error', 'errors': form.errors}, 400)
 
-    # GET request: display form and document history
-    documents = Document.objects.filter(user=request.user).order_by('-created_at')  # Ensure Document is defined
+    # GET request: display form and the first page of document history
+    documents, next_cursor = keyset_page(document_history(request.user), None, history_page_size(request))
     return render(request, 'legal_app/document_generator.html', {
         'form': DocumentGeneratorForm(),
-        'documents': documents  # Ensure 'documents' context is passed for history display
+        'documents': documents,
+        'next_cursor': next_cursor,
+        'pdf_available': pdf_converter() is not None,
+    })
+
+@login_required
+@require_http_methods(["GET"])
+@handle_errors
+def document_history_page(request):
+    """Next page of document history for infinite scroll (``?cursor=``)."""
+    documents, next_cursor = keyset_page(
+        document_history(request.user), request.GET.get('cursor'), history_page_size(request)
+    )
+    return format_russian_response({
+        'status': 'success',
+        'items': [document_summary(d) for d in documents],
+        'next_cursor': next_cursor,
     })
 
+@login_required
+@require_http_methods(["GET"])
+@handle_errors
+def document_job_status(request, job_id):
+    """Report the status of a queued document job."""
+    job = get_object_or_404(DocumentJob, id=job_id, user=request.user)
+    return format_russian_response(document_job_payload(job))
+
+@login_required
+@require_http_methods(["POST"])
+@handle_errors
+def answer_batch_api(request):
+    """Staff-only: answer a JSON list of questions in the background.
+
+    Expects ``{"questions": [...]}`` and returns 202 with a status URL.
+    """
+    if not request.user.is_staff:
+        return format_russian_response({'status': 'error', 'message': 'Доступ запрещён.'}, 403)
+    data = json.loads(request.body)
+    questions = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not all(isinstance(q, str) and q.strip() for q in questions):
+        raise ValidationError("Expected a list of non-empty questions.")
+    if not questions or len(questions) > getattr(settings, 'LEGAL_AI_BATCH_MAX_QUESTIONS', 1000):
+        return format_russian_response({'status': 'error', 'message': 'Недопустимое количество вопросов.'}, 400)
+
+    batch_id = submit_batch([q.strip() for q in questions], request.user)
+    return format_russian_response({
+        'status': 'success',
+        'batch_id': batch_id,
+        'status_url': reverse('legal_app:answer_batch_status', args=[batch_id]),
+    }, 202)
+
+@login_required
+@require_http_methods(["GET"])
+@handle_errors
+def answer_batch_status(request, batch_id):
+    """Staff-only: progress of a batch submitted through ``answer_batch_api``."""
+    if not request.user.is_staff:
+        return format_russian_response({'status': 'error', 'message': 'Доступ запрещён.'}, 403)
+    checkpoint = batch_checkpoint(batch_id)
+    if not checkpoint.path.exists():
+        return format_russian_response({'status': 'error', 'message': 'Пакет не найден.'}, 404)
+    return format_russian_response({'status': 'success', 'batch_id': batch_id, **checkpoint.status()})
+
+@login_required
+@require_http_methods(["GET"])
+@handle_errors
+def analytics_dashboard(request):
+    """Staff-only: question volume, categories, latency and top questions (``?days=``, ``?format=json``).
+
+    Reads only the daily rollups kept by ``manage.py rollup_analytics``.
+    """
+    if not request.user.is_staff:
+        return format_russian_response({'status': 'error', 'message': 'Доступ запрещён.'}, 403)
+    try:
+        days = int(request.GET.get('days', getattr(settings, 'LEGAL_ANALYTICS_DEFAULT_DAYS', 30)))
+    except ValueError:
+        raise ValidationError("days must be an integer.")
+    days = max(1, min(days, getattr(settings, 'LEGAL_ANALYTICS_MAX_DAYS', 366)))
+    report = dashboard(days)
+    if request.GET.get('format') == 'json':
+        return format_russian_response({'status': 'success', **report})
+    return render(request, 'legal_app/analytics.html', {'report': report})
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
 def download_document(request, document_id):
-    document = get_object_or_404(Document, id=document_id)
-    response = HttpResponse(document.file, content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-    response['Content-Disposition'] = f'attachment; filename="{document.title}.docx"'
-    return response
+    """Serve a stored document without loading it into memory.
+
+    ``?format=pdf`` serves a PDF copy; until its background conversion is
+    done the response is 202 with ``Retry-After``.
+    """
+    document = get_object_or_404(Document, id=document_id, user=request.user)
+    if not document.file:
+        raise Http404("Document file is not available.")
+    if request.GET.get('format') == 'pdf':
+        if pdf_converter() is None:
+            return format_russian_response({'status': 'error', 'message': 'Экспорт в PDF недоступен.'}, 501)
+        try:
+            pdf_name = request_document_pdf(document)
+        except Exception as e:
+            logger.error(f"PDF conversion of document {document.id} failed: {e!r}")
+            return format_russian_response({'status': 'error', 'message': 'Не удалось создать PDF.'}, 500)
+        if pdf_name is None:
+            response = format_russian_response({'status': 'pending', 'message': 'PDF готовится, подождите.'}, 202)
+            response['Retry-After'] = '2'
+            return response
+        return serve_document_file(request, document, pdf_name, PDF_CONTENT_TYPE)
+    return serve_document_file(request, document)
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus metrics of this worker process (see ``MetricsRegistry`` on several workers).
+
+    Scrapers authenticate with ``Authorization: Bearer <METRICS_TOKEN>``;
+    staff may read them too, as may METRICS_ALLOWED_IPS (empty by default:
+    behind a local reverse proxy every request comes from 127.0.0.1).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    allowed = bool(token) and hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(), f"Bearer {token}".encode()
+    )
+    allowed = allowed or (request.user.is_authenticated and request.user.is_staff) or \
+        request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if not allowed:
+        return HttpResponse(status=403)
+
+    cache_stats = get_legal_ai().response_cache.stats()
+    body = REGISTRY.render({
+        'legal_response_cache_hit_ratio': ('Response cache hit ratio in this worker', cache_stats['hit_ratio']),
+        'legal_upstream_error_ratio': ('Share of OpenAI calls that failed in this worker', upstream_error_rate()),
+    })
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Async (ASGI-native) views. Django's stock decorators used above only wrap sync
+# views in this Django version, so the async views use the equivalents below.
+
+def async_login_required(view_func):
+    """``login_required`` for async views."""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+def async_require_http_methods(methods):
+    """``require_http_methods`` for async views."""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                logger.warning(f"Method Not Allowed ({request.method}): {request.path}")
+                return HttpResponseNotAllowed(methods)
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def async_ratelimit(group: str, key: str, rate: str, method=ALL):
+    """Non-blocking ``ratelimit`` for async views; sets ``request.limited``."""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            limited = await sync_to_async(is_ratelimited)(
+                request=request, group=group, key=key, rate=rate, method=method, increment=True
+            )
+            request.limited = limited or getattr(request, 'limited', False)
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def async_handle_errors(view_func):
+    """``handle_errors`` for async views."""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view_func(request, *args, **kwargs)
+        except ValidationError as e:
+            logger.warning(f"Validation error: {str(e)}")
+            return format_russian_response({'status': 'error', 'message': 'Ошибка валидации данных.'}, 400)
+        except json.JSONDecodeError as e:
+            logger.warning(f"JSON decode error: {str(e)}")
+            return format_russian_response({'status': 'error', 'message': 'Некорректный формат JSON.'}, 400)
+        except Exception as e:
+            logger.error(f"Internal error: {str(e)}", exc_info=True)
+            return format_russian_response({'status': 'error', 'message': 'Произошла внутренняя ошибка сервера.'}, 500)
+    return wrapper
+
+@async_login_required
+@async_require_http_methods(["GET", "POST"])
+@async_ratelimit(key='user', rate='10/m', group='legal_chat')
+@async_handle_errors
+async def chat_async(request):
+    """Async version of ``chat`` that does not hold a worker thread while OpenAI responds."""
+    if request.method == 'POST':
+        if getattr(request, 'limited', False):
+            return format_russian_response({'status': 'error', 'message': 'Превышен лимит запросов. Подождите минуту.'}, 429)
+
+        started = time.monotonic()
+        form = LegalQuestionForm(request.POST)
+        with stage("form_validation"):
+            is_valid = form.is_valid()
+        if is_valid:
+            question = form.cleaned_data['question']
+            user_ip = get_client_ip(request)
+
+            conversation = await sync_to_async(get_conversation)(request.user, request.POST.get('conversation'))
+            history = await sync_to_async(conversation_history)(conversation)
+
+            with scheduling(request.user):
+                response = await get_async_legal_ai().aget_legal_response(question, history)
+            if response.get('status') == 'success':
+                with stage("orm_write"):
+                    legal_question, conversation = await sync_to_async(record_turn)(
+                        request.user,
+                        conversation,
+                        question,
+                        answer=response['answer'],
+                        category=response['category'],
+                        ip_address=user_ip,
+                        status='answered',
+                        processing_time=time.monotonic() - started,
+                        **usage_fields(response),
+                    )
+                return format_russian_response({
+                    'status': 'success',
+                    'answer': response['answer'],
+                    'category': response['category'],
+                    'question_id': legal_question.id,
+                    'conversation_id': conversation.id,
+                })
+            else:
+                return format_russian_response({'status': 'error', 'message': 'Не удалось получить ответ от AI.'}, 500)
+
+        return format_russian_response({'status': 'error', 'errors': form.errors}, 400)
+
+    # GET request: display form and the first page of question history
+    questions, next_cursor = await sync_to_async(keyset_page)(
+        question_history(request.user), None, history_page_size(request)
+    )
+    return render(request, 'legal_app/chat.html', {
+        'form': LegalQuestionForm(),
+        'questions': questions,
+        'next_cursor': next_cursor,
+    })
+
+@async_login_required
+@async_require_http_methods(["GET", "POST"])
+@async_ratelimit(key='user', rate='5/m', group='legal_documents', method='POST')
+@async_handle_errors
+async def document_generator_async(request):
+    """Async version of ``document_generator``."""
+    if request.method == 'POST':
+        if getattr(request, 'limited', False):
+            return format_russian_response({'status': 'error', 'message': 'Превышен лимит запросов. Подождите минуту.'}, 429)
+        form = DocumentGeneratorForm(request.POST)
+        if form.is_valid():
+            job = await sync_to_async(enqueue_document_job)(
+                request.user,
+                form.cleaned_data['document_type'],
+                form.cleaned_data['title'],
+                form.cleaned_data['context'],
+            )
+            return format_russian_response(document_job_payload(job), 202)
+
+        return format_russian_response({'status': 'error', 'errors': form.errors}, 400)
+
+    # GET request: display form and the first page of document history
+    documents, next_cursor = await sync_to_async(keyset_page)(
+        document_history(request.user), None, history_page_size(request)
+    )
+    return render(request, 'legal_app/document_generator.html', {
+        'form': DocumentGeneratorForm(),
+        'documents': documents,
+        'next_cursor': next_cursor,
+        'pdf_available': pdf_converter() is not None,
+    })
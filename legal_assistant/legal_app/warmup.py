@@ -0,0 +1,223 @@
+# legal_app/warmup.py
+import gzip
+import json
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, Iterator, Optional, Tuple
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+from .classifier import UNKNOWN_CATEGORY
+from .jobs import document_source_hash
+from .models import DocumentJob, LegalQuestion
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 1
+
+
+def _since(days: Optional[int]):
+    return timezone.now() - timedelta(days=days) if days else None
+
+
+def first_turns(queryset):
+    """Questions asked without earlier turns: outside a conversation or first in theirs.
+
+    A follow-up's answer depends on the turns before it, so it is no
+    answer to the question on its own.
+    """
+    first_id = LegalQuestion.objects.filter(conversation=OuterRef('conversation')).order_by('id').values('id')[:1]
+    return queryset.filter(Q(conversation__isnull=True) | Q(id=Subquery(first_id)))
+
+
+def current_answers(model: str):
+    """Answered questions produced by ``model`` under the current ``LEGAL_AI_PROMPT_VERSION``, first turns only."""
+    queryset = LegalQuestion.objects.filter(
+        status='answered', model=model, prompt_version=str(getattr(settings, 'LEGAL_AI_PROMPT_VERSION', '1')),
+    ).exclude(category=UNKNOWN_CATEGORY)
+    return first_turns(queryset)
+
+
+def question_entries(ai, limit: Optional[int] = None, days: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+    """Cache entries for the most frequently asked questions, most recent first on ties.
+
+    Yields ``(cache_key, response)`` built from the latest stored answer of
+    each question; ``limit=None`` covers the whole history. Answers of
+    another model or prompt version, and follow-ups, are left out.
+    """
+    queryset = current_answers(ai.model)
+    since = _since(days)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    groups = (
+        queryset.values('question')
+        .annotate(asked=Count('id'), latest_id=Max('id'))
+        .order_by('-asked', '-latest_id')
+    )
+    if limit:
+        # Spelling variants collapse to one key below; over-fetch a little
+        groups = groups[:limit * 2]
+
+    seen = set()
+    for chunk in _chunks(groups.iterator(), 500):
+        latest = LegalQuestion.objects.only('question', 'answer', 'category').in_bulk(
+            [group['latest_id'] for group in chunk]
+        )
+        for group in chunk:
+            question = latest[group['latest_id']]
+            key = ai._response_cache_key(question.question)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield key, ai._format_response(question.answer, question.category)
+            if limit and len(seen) >= limit:
+                return
+
+
+def document_entries(ai, limit: Optional[int] = None, days: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """Cache entries for the most frequently requested documents.
+
+    Document requests are keyed by type and context, which only the jobs
+    that produced them record. Documents produced by another model, prompt
+    or template version (whose ``source_hash`` differs from the current
+    one) are left out.
+    """
+    queryset = DocumentJob.objects.filter(status='done', document__isnull=False)
+    since = _since(days)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    groups = (
+        queryset.values('document_type', 'context')
+        .annotate(requested=Count('id'), latest_id=Max('id'))
+        .order_by('-requested', '-latest_id')
+    )
+    if limit:
+        groups = groups[:limit * 2]
+
+    seen = set()
+    for chunk in _chunks(groups.iterator(), 500):
+        jobs = DocumentJob.objects.select_related('document').only(
+            'document_type', 'title', 'context', 'document__content', 'document__source_hash'
+        ).in_bulk([group['latest_id'] for group in chunk])
+        for group in chunk:
+            job = jobs[group['latest_id']]
+            if job.document.source_hash != document_source_hash(job.document_type, job.title, job.context):
+                continue
+            key = ai._document_cache_key(job.document_type, job.context)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield key, job.document.content
+            if limit and len(seen) >= limit:
+                return
+
+
+def _chunks(iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _store(ai, entries: Iterator[Tuple[str, object]], overwrite: bool) -> int:
+    """Write entries with ``set_many``, by default only where the key is missing."""
+    stored = 0
+    for chunk in _chunks(entries, 200):
+        values = dict(chunk)
+        if not overwrite:
+            present = ai.response_cache.backend.get_many(list(values))
+            values = {key: value for key, value in values.items() if key not in present}
+        if values:
+            ai.response_cache.set_many(values)
+            stored += len(values)
+    return stored
+
+
+def warm_cache(ai, questions: Optional[int] = None, documents: Optional[int] = None,
+               days: Optional[int] = None, overwrite: bool = False) -> Tuple[int, int]:
+    """Preload the response cache from history; returns (questions, documents) stored."""
+    questions = getattr(settings, 'LEGAL_AI_WARMUP_QUESTIONS', 200) if questions is None else questions
+    documents = getattr(settings, 'LEGAL_AI_WARMUP_DOCUMENTS', 50) if documents is None else documents
+    stored_questions = _store(ai, question_entries(ai, questions, days), overwrite) if questions else 0
+    stored_documents = _store(ai, document_entries(ai, documents, days), overwrite) if documents else 0
+    logger.info(f"Cache warm-up stored {stored_questions} answers and {stored_documents} documents.")
+    return stored_questions, stored_documents
+
+
+def export_cache(ai, path, questions: Optional[int] = None, documents: Optional[int] = None,
+                 days: Optional[int] = None) -> int:
+    """Write cached responses to a gzip-compressed JSONL file.
+
+    Django cache backends cannot enumerate their keys, so the candidates come
+    from history (all of it by default) and only entries actually present
+    in the cache are written. Returns the number of entries exported.
+    """
+    candidates = [
+        key for key, _ in question_entries(ai, questions, days)
+    ] + [
+        key for key, _ in document_entries(ai, documents, days)
+    ]
+    exported = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'version': EXPORT_FORMAT_VERSION,
+            'model': ai.model,
+            'prompt_version': str(getattr(settings, 'LEGAL_AI_PROMPT_VERSION', '1')),
+            'created_at': timezone.now().isoformat(),
+        }) + '\n')
+        for chunk in _chunks(candidates, 500):
+            for key, value in ai.response_cache.backend.get_many(chunk).items():
+                f.write(json.dumps({'key': key, 'value': value}, ensure_ascii=False) + '\n')
+                exported += 1
+    logger.info(f"Exported {exported} cache entries to {path}.")
+    return exported
+
+
+def import_cache(ai, path, overwrite: bool = False) -> int:
+    """Load a file written by ``export_cache``; returns the number of entries stored.
+
+    Files from another model or prompt version are skipped: their keys could
+    never be looked up.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        prompt_version = str(getattr(settings, 'LEGAL_AI_PROMPT_VERSION', '1'))
+        if header.get('version') != EXPORT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported cache export version: {header.get('version')!r}")
+        if header.get('model') != ai.model or header.get('prompt_version') != prompt_version:
+            logger.warning(f"Cache export {path} is for another model or prompt version, skipping.")
+            return 0
+        entries = ((record['key'], record['value']) for record in map(json.loads, f))
+        stored = _store(ai, entries, overwrite)
+    logger.info(f"Imported {stored} cache entries from {path}.")
+    return stored
+
+
+def warm_up_in_background(ai):
+    """Start-up warm-up: import ``LEGAL_AI_WARMUP_FILE`` if set, then fill from history.
+
+    Runs in a daemon thread so that the first request is not delayed; entries
+    that are already cached (e.g. in a shared Redis cache) are left alone.
+    """
+    def run():
+        close_old_connections()
+        try:
+            path = getattr(settings, 'LEGAL_AI_WARMUP_FILE', None)
+            if path:
+                try:
+                    import_cache(ai, path)
+                except FileNotFoundError:
+                    logger.info(f"No cache export at {path}, warming up from history only.")
+            warm_cache(ai)
+        except Exception as e:
+            logger.error(f"Cache warm-up failed: {e}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=run, name='cache-warmup', daemon=True).start()
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'legal_app.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,13 +54,52 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'legal_assistant.wsgi.application'
+ASGI_APPLICATION = 'legal_assistant.asgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')  # 'sqlite' or 'postgresql'
+if DB_ENGINE == 'postgresql':
+    # Persistent connections: each worker thread keeps its connection for CONN_MAX_AGE seconds
+    # instead of reconnecting per request. Django 4.2 has no pool of its own; put PgBouncer in
+    # front of PostgreSQL for one (DB_PGBOUNCER=True in transaction pooling mode). Needs psycopg2 or psycopg.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'legal_assistant'),
+            'USER': os.getenv('DB_USER', 'legal_assistant'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', '127.0.0.1'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),  # seconds, 0 closes after each request
+            'CONN_HEALTH_CHECKS': True,  # a dropped persistent connection is replaced, not reused
+            # PgBouncer's transaction pooling hands each transaction a different server connection
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', 'False') == 'True',
+            'OPTIONS': {'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))},
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+
+# Applied to every SQLite connection (legal_app/db.py). WAL lets readers run alongside the
+# writer and synchronous=NORMAL syncs at checkpoints instead of every commit (safe with WAL).
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),  # ms a writer waits for the lock
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),  # bytes read through mmap
+} if os.getenv('SQLITE_TUNING', 'True') == 'True' else {}
+
+# Write-behind: answered questions are inserted in batches by a background thread, one
+# transaction per batch. Responses then carry no question_id, and rows still buffered are
+# lost if the process is killed. The next turn of a conversation flushes the buffer first if
+# the previous turn is still in it.
+DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', 'False') == 'True'
+DB_WRITE_BEHIND_MAX_ROWS = int(os.getenv('DB_WRITE_BEHIND_MAX_ROWS', '100'))  # rows per batch
+DB_WRITE_BEHIND_INTERVAL = float(os.getenv('DB_WRITE_BEHIND_INTERVAL', '0.5'))  # seconds a row may wait
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -80,12 +120,21 @@ AUTH_PASSWORD_VALIDATORS = [
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': 'ts=%(asctime)s level=%(levelname)s logger=%(name)s %(message)s',
+        },
+    },
     'handlers': {
         'file': {
             'level': 'ERROR',
             'class': 'logging.FileHandler',
             'filename': 'debug.log',
         },
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
     },
     'loggers': {
         'django': {
@@ -93,20 +142,61 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        # Request, stage and upstream timings are logged at INFO
+        'legal_app': {
+            'handlers': ['console', 'file'],
+            'level': os.getenv('LEGAL_APP_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
     },
 }
 
+# Prometheus metrics at /metrics: scrapers send "Authorization: Bearer <METRICS_TOKEN>";
+# staff and METRICS_ALLOWED_IPS may read them too. Leave the addresses empty behind a
+# reverse proxy on the same host, which makes every request come from 127.0.0.1.
+# Metrics are per gunicorn worker: scrape each worker, or read them as samples.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
 # Rate limiting settings
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 RATELIMIT_CACHE_PREFIX = 'rl:'
 
 # Cache settings
+# LLM responses live in their own cache shared by all workers: file (default),
+# db (run `manage.py createcachetable`), redis or locmem (per-process, tests only).
+LLM_CACHE_BACKEND = os.getenv('LLM_CACHE_BACKEND', 'file')
+LLM_CACHE_BACKENDS = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('LLM_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'llm')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('LLM_CACHE_LOCATION', 'legal_llm_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('LLM_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'llm-responses',
+    },
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    'llm': {
+        **LLM_CACHE_BACKENDS[LLM_CACHE_BACKEND],
+        'KEY_PREFIX': 'legal_ai',
+    },
 }
 
 LANGUAGE_CODE = 'ru-ru'
@@ -122,9 +212,168 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', str(BASE_DIR / 'media'))  # generated .docx files
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 # OpenAI API settings
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None  # e.g. a local fake server for benchmarks
+
+# LLM providers. Each task's model is a "provider:model" spec (a bare name is an OpenAI
+# model), so short tasks can go to a fast local model, e.g. LEGAL_AI_CATEGORY_MODEL=local:qwen2.5-3b-instruct.
+# Backends: 'openai', 'openai_compatible' (llama.cpp server, vLLM, Ollama) and 'stub' (deterministic,
+# in-process; for tests and benchmarks). Besides base_url/api_key a provider may set max_connections,
+# concurrency, requests_per_minute, tokens_per_minute and context_window. Each has its own
+# connection pool and upstream scheduler; LEGAL_AI_UPSTREAM_RPM/TPM only apply to 'openai' backends.
+LEGAL_AI_PROVIDERS = {
+    'openai': {'backend': 'openai'},  # OPENAI_API_KEY, OPENAI_BASE_URL
+    'local': {
+        'backend': 'openai_compatible',
+        'base_url': os.getenv('LEGAL_AI_LOCAL_BASE_URL', 'http://127.0.0.1:8080/v1'),
+        'api_key': os.getenv('LEGAL_AI_LOCAL_API_KEY', ''),
+        'concurrency': int(os.getenv('LEGAL_AI_LOCAL_CONCURRENCY', '4')),  # parallel slots of the server
+        'context_window': int(os.getenv('LEGAL_AI_LOCAL_CONTEXT_WINDOW', '8192')),
+    },
+    'stub': {'backend': 'stub'},
+}
+LEGAL_AI_ANSWER_MODEL = os.getenv('LEGAL_AI_ANSWER_MODEL', 'gpt-4')
+LEGAL_AI_CATEGORY_MODEL = os.getenv('LEGAL_AI_CATEGORY_MODEL', 'gpt-4')
+LEGAL_AI_DOCUMENT_MODEL = os.getenv('LEGAL_AI_DOCUMENT_MODEL', 'gpt-4')  # full documents and template sections
+LEGAL_AI_SUMMARY_MODEL = os.getenv('LEGAL_AI_SUMMARY_MODEL', 'gpt-4')  # conversation summaries
+
+# LegalAI upstream settings
+LEGAL_AI_CONCURRENT_CALLS = os.getenv('LEGAL_AI_CONCURRENT_CALLS', 'True') == 'True'  # answer + category in parallel
+LEGAL_AI_MAX_WORKERS = int(os.getenv('LEGAL_AI_MAX_WORKERS', '8'))
+LEGAL_AI_BACKGROUND_MAX_WORKERS = int(os.getenv('LEGAL_AI_BACKGROUND_MAX_WORKERS', '4'))  # the same for batches and document sections
+LEGAL_AI_ANSWER_TIMEOUT = float(os.getenv('LEGAL_AI_ANSWER_TIMEOUT', '60'))  # seconds
+LEGAL_AI_CATEGORY_TIMEOUT = float(os.getenv('LEGAL_AI_CATEGORY_TIMEOUT', '15'))  # seconds
+LEGAL_AI_MAX_CONNECTIONS = int(os.getenv('LEGAL_AI_MAX_CONNECTIONS', '100'))  # connection pool size per provider
+LEGAL_AI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LEGAL_AI_MAX_KEEPALIVE_CONNECTIONS', '20'))
+LEGAL_AI_CACHE_ALIAS = 'llm'
+LEGAL_AI_CACHE_TIMEOUT = int(os.getenv('LEGAL_AI_CACHE_TIMEOUT', '3600'))  # seconds
+LEGAL_AI_PROMPT_VERSION = '3'  # bump when prompts change to invalidate cached responses
+# Single-flight: identical requests in flight share one upstream call (lock held in the 'llm' cache)
+LEGAL_AI_SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.getenv('LEGAL_AI_SINGLE_FLIGHT_LOCK_TIMEOUT', '120'))  # seconds
+LEGAL_AI_SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv('LEGAL_AI_SINGLE_FLIGHT_WAIT_TIMEOUT', '90'))  # seconds
+
+# Upstream resilience: answer/category timeouts above are budgets per call, retries included
+LEGAL_AI_CONNECT_TIMEOUT = float(os.getenv('LEGAL_AI_CONNECT_TIMEOUT', '5'))  # seconds
+LEGAL_AI_MAX_RETRIES = int(os.getenv('LEGAL_AI_MAX_RETRIES', '2'))  # per model, on 429/5xx/timeouts
+LEGAL_AI_RETRY_BASE_DELAY = float(os.getenv('LEGAL_AI_RETRY_BASE_DELAY', '0.5'))  # seconds, doubled per retry
+LEGAL_AI_RETRY_MAX_DELAY = float(os.getenv('LEGAL_AI_RETRY_MAX_DELAY', '8'))  # seconds
+LEGAL_AI_RETRY_DEADLINE = float(os.getenv('LEGAL_AI_RETRY_DEADLINE', '120'))  # budget of calls without a timeout (documents)
+LEGAL_AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LEGAL_AI_CIRCUIT_FAILURE_THRESHOLD', '5'))  # consecutive failures
+LEGAL_AI_CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv('LEGAL_AI_CIRCUIT_RECOVERY_TIMEOUT', '30'))  # seconds open
+LEGAL_AI_FALLBACK_MODELS = [m.strip() for m in os.getenv('LEGAL_AI_FALLBACK_MODELS', '').split(',') if m.strip()]  # e.g. gpt-3.5-turbo, for local models too
+LEGAL_AI_STALE_CACHE_TIMEOUT = int(os.getenv('LEGAL_AI_STALE_CACHE_TIMEOUT', str(7 * 24 * 3600)))  # served when OpenAI fails
+
+# Upstream scheduler: admission control for the LLM calls of a worker process, one per provider
+# (defaults for each). Limits are per process: divide the account's tier limits by the number of workers.
+LEGAL_AI_UPSTREAM_CONCURRENCY = int(os.getenv('LEGAL_AI_UPSTREAM_CONCURRENCY', '8'))  # 0 disables the scheduler
+LEGAL_AI_UPSTREAM_INTERACTIVE_RESERVE = int(os.getenv('LEGAL_AI_UPSTREAM_INTERACTIVE_RESERVE', '2'))  # slots documents never get
+LEGAL_AI_UPSTREAM_RPM = int(os.getenv('LEGAL_AI_UPSTREAM_RPM', '0'))  # requests per minute, 0 = unlimited
+LEGAL_AI_UPSTREAM_TPM = int(os.getenv('LEGAL_AI_UPSTREAM_TPM', '0'))  # prompt + max_tokens per minute, 0 = unlimited
+LEGAL_AI_UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('LEGAL_AI_UPSTREAM_QUEUE_TIMEOUT', '30'))  # seconds waiting for a slot
+
+# Token budgets (counted with tiktoken when installed, estimated otherwise)
+# tiktoken's BPE files. Fill the directory at build time with `manage.py fetch_tiktoken_encodings`;
+# otherwise tiktoken downloads them on first use, and counts are estimated while it cannot
+LEGAL_AI_TIKTOKEN_CACHE_DIR = os.getenv('TIKTOKEN_CACHE_DIR') or str(BASE_DIR / 'cache' / 'tiktoken')
+LEGAL_AI_ANSWER_MIN_TOKENS = int(os.getenv('LEGAL_AI_ANSWER_MIN_TOKENS', '600'))  # max_tokens for the shortest questions
+LEGAL_AI_ANSWER_MAX_TOKENS = int(os.getenv('LEGAL_AI_ANSWER_MAX_TOKENS', '2000'))
+LEGAL_AI_ANSWER_TOKENS_PER_QUESTION_TOKEN = int(os.getenv('LEGAL_AI_ANSWER_TOKENS_PER_QUESTION_TOKEN', '8'))
+LEGAL_AI_DOCUMENT_MAX_TOKENS = {  # max_tokens per document type
+    'complaint': 1200,
+    'contract': 2000,
+    'statement': 800,
+    'pretension': 1000,
+}
+LEGAL_AI_DOCUMENT_DEFAULT_MAX_TOKENS = int(os.getenv('LEGAL_AI_DOCUMENT_DEFAULT_MAX_TOKENS', '1500'))
+LEGAL_AI_DOCUMENT_CONTEXT_MAX_TOKENS = int(os.getenv('LEGAL_AI_DOCUMENT_CONTEXT_MAX_TOKENS', '3000'))  # longer contexts are truncated
+# Documents of types with a template (legal_app/document_templates.py) are assembled from fixed text
+# and LLM-written sections; other types are written by the LLM in full
+LEGAL_AI_DOCUMENT_TEMPLATES = os.getenv('LEGAL_AI_DOCUMENT_TEMPLATES', 'True') == 'True'
+
+# Semantic answer cache: serve stored answers to near-duplicate questions (requires numpy)
+LEGAL_AI_SEMANTIC_CACHE = os.getenv('LEGAL_AI_SEMANTIC_CACHE', 'False') == 'True'
+LEGAL_AI_SEMANTIC_CACHE_THRESHOLD = float(os.getenv('LEGAL_AI_SEMANTIC_CACHE_THRESHOLD', '0.95'))  # cosine similarity
+LEGAL_AI_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('LEGAL_AI_SEMANTIC_CACHE_MAX_ENTRIES', '5000'))  # LRU eviction beyond this
+LEGAL_AI_SEMANTIC_CACHE_PATH = os.getenv('LEGAL_AI_SEMANTIC_CACHE_PATH', str(BASE_DIR / 'cache' / 'semantic_index.npz'))
+LEGAL_AI_SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv('LEGAL_AI_SEMANTIC_CACHE_SAVE_EVERY', '20'))  # additions between saves
+LEGAL_AI_EMBEDDING_MODEL = os.getenv('LEGAL_AI_EMBEDDING_MODEL', 'text-embedding-ada-002')  # provider:model, like the task models
+
+# Knowledge base of statute texts (`manage.py index_knowledge`): the articles most
+# relevant to a question are added to the answer prompt. Without an index it is off.
+LEGAL_AI_KNOWLEDGE_BASE = os.getenv('LEGAL_AI_KNOWLEDGE_BASE', 'True') == 'True'
+LEGAL_AI_KNOWLEDGE_SOURCE_DIR = os.getenv('LEGAL_AI_KNOWLEDGE_SOURCE_DIR', str(BASE_DIR / 'knowledge'))  # *.txt, one act per file
+LEGAL_AI_KNOWLEDGE_INDEX_DIR = os.getenv('LEGAL_AI_KNOWLEDGE_INDEX_DIR', str(BASE_DIR / 'cache' / 'knowledge'))
+LEGAL_AI_KNOWLEDGE_TOP_K = int(os.getenv('LEGAL_AI_KNOWLEDGE_TOP_K', '4'))  # passages per question
+LEGAL_AI_KNOWLEDGE_MAX_TOKENS = int(os.getenv('LEGAL_AI_KNOWLEDGE_MAX_TOKENS', '1500'))  # of passages in the prompt
+LEGAL_AI_KNOWLEDGE_CHUNK_TOKENS = int(os.getenv('LEGAL_AI_KNOWLEDGE_CHUNK_TOKENS', '400'))  # longer articles are split
+LEGAL_AI_KNOWLEDGE_EMBEDDINGS = os.getenv('LEGAL_AI_KNOWLEDGE_EMBEDDINGS', 'True') == 'True'  # vectors are matched with the semantic cache's question embeddings
+
+# Conversations: follow-up questions get the earlier turns in the prompt. Once the turns
+# since the last summary pass half the budget, all but the last few are folded into a
+# rolling summary in the background, so the prompt stays bounded however long the chat.
+LEGAL_AI_CONVERSATION_MAX_TOKENS = int(os.getenv('LEGAL_AI_CONVERSATION_MAX_TOKENS', '2000'))  # summary and turns in the prompt
+LEGAL_AI_CONVERSATION_KEEP_TURNS = int(os.getenv('LEGAL_AI_CONVERSATION_KEEP_TURNS', '2'))  # recent turns kept verbatim
+LEGAL_AI_CONVERSATION_SUMMARY_TOKENS = int(os.getenv('LEGAL_AI_CONVERSATION_SUMMARY_TOKENS', '400'))  # max_tokens of a summary
+LEGAL_AI_CONVERSATION_TURN_MAX_TOKENS = int(os.getenv('LEGAL_AI_CONVERSATION_TURN_MAX_TOKENS', '500'))  # of each earlier answer
+LEGAL_AI_CONVERSATION_MAX_TURNS = int(os.getenv('LEGAL_AI_CONVERSATION_MAX_TURNS', '20'))  # turns loaded per question
+LEGAL_AI_CONVERSATION_COMPACTION_WORKERS = int(os.getenv('LEGAL_AI_CONVERSATION_COMPACTION_WORKERS', '1'))  # summaries written at once per process
+
+# Analytics: `manage.py rollup_analytics` (cron, or --loop) folds new questions into daily
+# rollups; the staff dashboard and the admin's category filter read only those.
+LEGAL_ANALYTICS_LAG = float(os.getenv('LEGAL_ANALYTICS_LAG', '60'))  # seconds before a question is rolled up
+LEGAL_ANALYTICS_BATCH_SIZE = int(os.getenv('LEGAL_ANALYTICS_BATCH_SIZE', '1000'))  # questions per transaction
+LEGAL_ANALYTICS_TOP_QUESTIONS = int(os.getenv('LEGAL_ANALYTICS_TOP_QUESTIONS', '50'))  # kept per day once it is over
+LEGAL_ANALYTICS_DEFAULT_DAYS = int(os.getenv('LEGAL_ANALYTICS_DEFAULT_DAYS', '30'))
+LEGAL_ANALYTICS_MAX_DAYS = int(os.getenv('LEGAL_ANALYTICS_MAX_DAYS', '366'))
+
+# Local category classifier (train with `manage.py train_category_classifier`);
+# the LLM is asked for the category only below this confidence
+LEGAL_AI_CATEGORY_CLASSIFIER_PATH = os.getenv('LEGAL_AI_CATEGORY_CLASSIFIER_PATH', str(BASE_DIR / 'artifacts' / 'category_classifier.json'))
+LEGAL_AI_CATEGORY_CLASSIFIER_THRESHOLD = float(os.getenv('LEGAL_AI_CATEGORY_CLASSIFIER_THRESHOLD', '0.6'))
+
+# Batch answering (manage.py answer_batch and the staff batch API)
+LEGAL_AI_BATCH_CONCURRENCY = int(os.getenv('LEGAL_AI_BATCH_CONCURRENCY', '4'))
+LEGAL_AI_BATCH_RPM = int(os.getenv('LEGAL_AI_BATCH_RPM', '60'))  # requests per minute, 0 = unlimited
+LEGAL_AI_BATCH_TPM = int(os.getenv('LEGAL_AI_BATCH_TPM', '80000'))  # estimated tokens per minute, 0 = unlimited
+LEGAL_AI_BATCH_MAX_QUESTIONS = int(os.getenv('LEGAL_AI_BATCH_MAX_QUESTIONS', '1000'))  # per API request
+LEGAL_AI_BATCH_DIR = os.getenv('LEGAL_AI_BATCH_DIR', str(BASE_DIR / 'cache' / 'batches'))  # API batch checkpoints
+
+# Response cache warm-up (`manage.py warm_cache`, `export_cache`, `import_cache`).
+# On start-up, LEGAL_AI_WARMUP_FILE is imported if present, then the most
+# frequent questions and documents are loaded from history.
+LEGAL_AI_WARMUP_ON_STARTUP = os.getenv('LEGAL_AI_WARMUP_ON_STARTUP', 'False') == 'True'
+LEGAL_AI_WARMUP_QUESTIONS = int(os.getenv('LEGAL_AI_WARMUP_QUESTIONS', '200'))
+LEGAL_AI_WARMUP_DOCUMENTS = int(os.getenv('LEGAL_AI_WARMUP_DOCUMENTS', '50'))
+LEGAL_AI_WARMUP_FILE = os.getenv('LEGAL_AI_WARMUP_FILE') or None  # e.g. cache/response_cache.jsonl.gz
+
+# Document generation jobs: 'thread' runs them in in-process workers, 'db' leaves
+# them queued for `manage.py document_worker`
+DOCUMENT_JOB_BACKEND = os.getenv('DOCUMENT_JOB_BACKEND', 'thread')
+DOCUMENT_JOB_WORKERS = int(os.getenv('DOCUMENT_JOB_WORKERS', '2'))
+# Running jobs refresh their heartbeat this often; jobs whose heartbeat is older
+# than DOCUMENT_JOB_STALE_AFTER (their worker died) are run again
+DOCUMENT_JOB_HEARTBEAT = int(os.getenv('DOCUMENT_JOB_HEARTBEAT', '30'))  # seconds
+DOCUMENT_JOB_STALE_AFTER = int(os.getenv('DOCUMENT_JOB_STALE_AFTER', '120'))  # seconds
+# Let the front-end server send document files, e.g. 'X-Accel-Redirect' (nginx)
+# with an internal location at DOCUMENT_SENDFILE_PREFIX aliasing MEDIA_ROOT
+DOCUMENT_SENDFILE_HEADER = os.getenv('DOCUMENT_SENDFILE_HEADER') or None
+DOCUMENT_SENDFILE_PREFIX = os.getenv('DOCUMENT_SENDFILE_PREFIX', '/protected-media/')
+# Generated .docx files use the styles, page setup and headers of this base document
+# (python-docx's default when unset); PDF copies are made with LibreOffice if installed
+DOCUMENT_DOCX_TEMPLATE = os.getenv('DOCUMENT_DOCX_TEMPLATE') or None
+DOCUMENT_PDF_CONVERTER = os.getenv('DOCUMENT_PDF_CONVERTER') or None  # default: soffice or libreoffice on PATH
+DOCUMENT_PDF_TIMEOUT = int(os.getenv('DOCUMENT_PDF_TIMEOUT', '60'))  # seconds
+DOCUMENT_PDF_WORKERS = int(os.getenv('DOCUMENT_PDF_WORKERS', '2'))  # conversions running at once, in the background
+
+# Chat and document history are paginated by (created_at, id) cursor
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '100'))
+HISTORY_TITLE_LENGTH = int(os.getenv('HISTORY_TITLE_LENGTH', '120'))
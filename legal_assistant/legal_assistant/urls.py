@@ -25,4 +25,5 @@ urlpatterns = [
     path('chat/', views.chat, name='chat'),  # Страница чата
     path('document_generator/', views.document_generator, name='document_generator'),  # Страница генерации документов
     path('legal_app/', include('legal_app.urls')),  # Подключаем дополнительные URL для legal_app
+    path('metrics', views.metrics, name='metrics'),  # Метрики Prometheus
 ]